@@ -5,15 +5,19 @@ Created on Mon May 18 21:43:18 2020
 
 @author: corkep
 """
+
 import os
 from pathlib import Path
 import sys
 import importlib
 import inspect
 import traceback
+from time import perf_counter_ns
 from collections import Counter, namedtuple
+from operator import itemgetter
 from copy import deepcopy
 import numpy as np
+import scipy.sparse as sp
 from colored import fg, attr
 import warnings
 
@@ -73,6 +77,15 @@ class BlockDiagram:
         self.n_auto_const = 0
         self.n_auto_gain = 0
         self.n_auto_pow = 0
+        self._kernel = None  # compiled evaluation kernel
+        self._engine = "plan"  # evaluation engine used by the kernel
+        self._ensemble = None  # number of ensemble members, or None
+        self._fuse = False  # fuse groups of linear blocks in the kernel
+        self._refuse = False  # fuse only after the next evaluation
+        self._fold = False  # fold constants and eliminate unused blocks
+        self._watched = set()  # blocks with watched outputs
+        self._workers = None  # threads for expensive blocks
+        self._pool = None  # thread pool for expensive blocks
 
     def __getitem__(self, id):
         print(id)
@@ -100,11 +113,229 @@ class BlockDiagram:
             elif k == "runtime":
                 # it's a reference to the runtime
                 setattr(result, k, v)
+            elif k in ("_kernel", "_pool"):
+                # holds views into its own buffers, rebuild it on first use,
+                # and the copy gets its own threads
+                setattr(result, k, None)
             else:
                 # otherwise, do a deepcopy
                 setattr(result, k, deepcopy(v, memo))
         return result
 
+    engines = ("plan", "signals")
+
+    @property
+    def engine(self):
+        """
+        Evaluation engine
+
+        :return: name of the evaluation engine
+        :rtype: str
+
+        The engine determines how block inputs are gathered when the diagram is
+        evaluated:
+
+        - ``"plan"`` (default), each input is read from the ``output_values``
+          attribute of the block that drives it, and is passed to the block as a
+          list.
+        - ``"signals"``, all block outputs are kept in a shared signal store and
+          the inputs of each block are gathered from it by a single
+          :func:`operator.itemgetter` call, resolved at compile time. Inputs
+          are passed to the block as a list or tuple, so this engine is only
+          suitable for blocks that do not modify their inputs.
+
+        Setting the engine discards the compiled kernel, which is rebuilt on the
+        next evaluation.
+
+        :seealso: :meth:`schedule_compile`
+        """
+        return self._engine
+
+    @engine.setter
+    def engine(self, engine):
+        if engine not in self.engines:
+            raise ValueError(f"unknown evaluation engine {engine}")
+        if engine != self._engine:
+            self._engine = engine
+            self._kernel = None
+
+    @property
+    def ensemble(self):
+        """
+        Number of ensemble members
+
+        :return: number of ensemble members, or None
+        :rtype: int
+
+        If set to N, the diagram is evaluated for N copies, or members, of the
+        system at once.  The continuous state has shape (N, nstates), and
+        every block's state, inputs and outputs have a leading dimension of N.
+        The state vector passed to and returned from :meth:`schedule_evaluate`
+        and :meth:`getstate0` is this array flattened.
+
+        Only blocks whose computation broadcasts over the leading dimension,
+        for example ``INTEGRATOR``, ``LTI_SS``, ``GAIN``, ``SUM``, ``CONSTANT``
+        and ``FUNCTION`` with a vectorized function, can be used in an ensemble.
+        Clocked blocks are not supported.
+
+        Setting the number of members discards the compiled kernel, which is
+        rebuilt on the next evaluation.
+
+        :seealso: :meth:`BDSim.run`
+        """
+        return self._ensemble
+
+    @ensemble.setter
+    def ensemble(self, n):
+        if n is not None:
+            n = int(n)
+            if n < 1:
+                raise ValueError("number of ensemble members must be positive")
+            if len(self.clocklist) > 0:
+                raise ValueError("clocked blocks are not supported in an ensemble")
+        if n != self._ensemble:
+            self._ensemble = n
+            self._kernel = None
+
+    @property
+    def fuse(self):
+        """
+        Fuse groups of linear blocks
+
+        :return: True if linear blocks are fused
+        :rtype: bool
+
+        If True, the evaluation kernel replaces each connected group of linear
+        time-invariant blocks, such as ``SUM``, ``GAIN``, ``INTEGRATOR`` and
+        ``LTI_SS``, with a single block that computes their outputs and state
+        derivatives by matrix multiplication.  The outputs of the fused blocks
+        are still set, so watched ports and other blocks see the same signals.
+        Defaults to False.
+
+        Blocks are fused only for the ``"plan"`` :attr:`engine`, and not for an
+        :attr:`ensemble`.  The signal shapes are those of the most recent
+        evaluation of the diagram, :meth:`compile` evaluates it before fusing.
+
+        Setting this discards the compiled kernel, which is rebuilt on the next
+        evaluation.
+
+        :seealso: :mod:`bdsim.fusion`
+        """
+        return self._fuse
+
+    @fuse.setter
+    def fuse(self, fuse):
+        fuse = bool(fuse)
+        if fuse != self._fuse:
+            self._fuse = fuse
+            self._kernel = None
+
+    @property
+    def fold(self):
+        """
+        Fold constants and eliminate unused blocks
+
+        :return: True if constants are folded and unused blocks are eliminated
+        :rtype: bool
+
+        If True, the evaluation kernel:
+
+        - evaluates blocks whose outputs are constant only once, on the first
+          evaluation after the kernel is built or the simulation is started,
+          and reuses their outputs after that.  These are source blocks with a
+          constant output, such as ``CONSTANT``, and blocks driven only by
+          them whose output depends only on their inputs, such as ``GAIN``.
+        - does not evaluate blocks whose outputs do not reach, directly or
+          through other blocks, a transfer, clocked or sink block or a
+          :attr:`watched` port.
+
+        Defaults to False.  The outputs of eliminated blocks are not updated.
+        If the parameters of a folded block are changed with
+        :meth:`Block.set_param` the folded blocks are evaluated again on the
+        next evaluation, see :meth:`invalidate`.
+
+        A block declares that its output depends only on its inputs and
+        parameters, and not on time, state or any history, by setting the
+        attribute ``pure`` to True.
+
+        Setting this discards the compiled kernel, which is rebuilt on the next
+        evaluation.
+
+        :seealso: :meth:`schedule_compile`
+        """
+        return self._fold
+
+    @fold.setter
+    def fold(self, fold):
+        fold = bool(fold)
+        if fold != self._fold:
+            self._fold = fold
+            self._kernel = None
+
+    @property
+    def workers(self):
+        """
+        Number of threads for expensive blocks
+
+        :return: number of threads, or None
+        :rtype: int
+
+        If set, blocks in the same group of the execution plan that have their
+        ``expensive`` attribute set to True are evaluated at the same time on a
+        pool of this many threads.  This is beneficial only for blocks that
+        release the Python global interpreter lock, for example large NumPy
+        linear algebra or native code called from a ``FUNCTION`` block.  The
+        blocks are timed over the first few evaluations and those that are
+        cheap are still evaluated inline.  Defaults to None, all blocks are
+        evaluated by the calling thread.
+
+        Blocks are evaluated in parallel only for the ``"plan"``
+        :attr:`engine`.
+
+        Setting this discards the compiled kernel, which is rebuilt on the next
+        evaluation, and shuts down the thread pool.  Otherwise the pool is
+        kept by the block diagram and reused when the kernel is rebuilt.
+
+        :seealso: :mod:`bdsim.parallel`
+        """
+        return self._workers
+
+    @workers.setter
+    def workers(self, n):
+        if n is not None:
+            n = int(n)
+            if n < 1:
+                raise ValueError("number of workers must be positive")
+        if n != self._workers:
+            self._workers = n
+            self._kernel = None
+            if self._pool is not None:
+                self._pool.shutdown(wait=False)
+                self._pool = None
+
+    @property
+    def watched(self):
+        """
+        Blocks with watched outputs
+
+        :return: blocks with an output port that is recorded
+        :rtype: set of Block
+
+        Set by :meth:`BDSim.run` from its ``watch`` argument, a list of
+        :class:`Plug` or :class:`Block`.  These blocks are not eliminated when
+        :attr:`fold` is True, and setting a different set discards the compiled
+        kernel.
+        """
+        return self._watched
+
+    @watched.setter
+    def watched(self, watch):
+        watched = {w.block if isinstance(w, Plug) else w for w in watch}
+        if watched != self._watched:
+            self._watched = watched
+            if self._fold:
+                self._kernel = None
+
     @property
     def issubsystem(self):
         return self._issubsystem
@@ -274,7 +505,14 @@ class BlockDiagram:
     # ---------------------------------------------------------------------- #
 
     def compile(
-        self, subsystem=False, doimport=True, evaluate=True, report=False, verbose=True
+        self,
+        subsystem=False,
+        doimport=True,
+        evaluate=True,
+        report=False,
+        verbose=True,
+        fuse=None,
+        fold=None,
     ):
         """
         Compile the block diagram
@@ -283,6 +521,12 @@ class BlockDiagram:
         :type subsystem: bool, optional
         :param doimport: import subsystems, defaults to True
         :type doimport: bool, optional
+        :param fuse: fuse groups of linear blocks, defaults to the value of
+            :attr:`fuse`
+        :type fuse: bool, optional
+        :param fold: fold constants and eliminate unused blocks, defaults to
+            the value of :attr:`fold`
+        :type fold: bool, optional
         :raises RuntimeError: various block diagram errors
         :return: Compile status
         :rtype: bool
@@ -296,7 +540,10 @@ class BlockDiagram:
             - Check for unconnected inputs and outputs
             - Link all output ports to outgoing wires
             - Link all input ports to incoming wires
+            - Fold constants and eliminate unused blocks, if :attr:`fold` is
+              True
             - Evaluate all blocks in the network
+            - Fuse groups of linear blocks, if :attr:`fuse` is True
 
         """
 
@@ -326,12 +573,13 @@ class BlockDiagram:
         )
 
         # check that wires all point to valid blocks
+        blockset = set(self.blocklist)
         for w in self.wirelist:
-            if w.start.block not in self.blocklist:
+            if w.start.block not in blockset:
                 raise RuntimeError(
                     f"wire {w} starts at unreferenced block {w.start.block}"
                 )
-            if w.end.block not in self.blocklist:
+            if w.end.block not in blockset:
                 raise RuntimeError(f"wire {w} ends at unreferenced block {w.end.block}")
 
         # run block specific checks
@@ -373,6 +621,7 @@ class BlockDiagram:
 
         # initialize lists of input and output ports
         for b in self.blocklist:
+            b._diagram = self
             b.output_wires = [[] for i in range(0, b.nout)]
             b.input_wires = [None for i in range(0, b.nin)]
             b.sources = [None for i in range(0, b.nin)]
@@ -428,36 +677,32 @@ class BlockDiagram:
                     len(b._state_names) == b.nstates
                 ), "incorrect number of state names given: " + str(b)
 
-        # check for cycles of function blocks
-        def _DFS(path):
-            start = path[0]
-            tail = path[-1]
-            for outgoing in tail.output_wires:
-                # for every port on this block
-                for w in outgoing:
-                    dest = w.end.block
-                    if dest == start:
-                        print(
-                            "  ERROR: cycle found: ",
-                            " - ".join([str(x) for x in path + [dest]]),
-                        )
-                        return True
-                    if dest.blockclass == "function":
-                        return _DFS(path + [dest])  # recurse
-            return False
-
-        for b in self.blocklist:
-            if b.blockclass == "function":
-                # do depth first search looking for a cycle
-                if _DFS([b]):
-                    error = True
+        # check for algebraic loops, cycles of function blocks
+        for loop in self._algebraic_loops():
+            print(
+                "  ERROR: algebraic loop found: ",
+                " - ".join([str(x) for x in loop + loop[:1]]),
+            )
+            error = True
 
         if error:
             if not subsystem:
                 raise RuntimeError("could not compile system")
 
+        if fuse is not None:
+            self.fuse = fuse
+        if fold is not None:
+            self.fold = fold
+
         # create the execution plan/schedule
         self.schedule_generate()
+        self.schedule_compile()
+
+        if not subsystem and verbose and self.fold:
+            print(
+                f"  {len(self._kernel.folded)} constant blocks folded,"
+                f" {len(self._kernel.dead)} unused blocks eliminated"
+            )
 
         ## evaluate the network once to check out wire types
         x = self.getstate0()
@@ -487,6 +732,16 @@ class BlockDiagram:
         else:
             self.compiled = True
 
+            if self.fuse and not subsystem and evaluate:
+                # the signal shapes are now known, rebuild the kernel
+                self.schedule_compile()
+                if verbose and self._kernel.fused:
+                    nblocks = sum([len(f.blocks) for f in self._kernel.fused])
+                    print(
+                        f"  {nblocks} linear blocks fused into"
+                        f" {len(self._kernel.fused)} groups"
+                    )
+
         return self.compiled
 
     def _subsystem_import(self, bd, sspath, verbose=False):
@@ -538,7 +793,9 @@ class BlockDiagram:
 
     # ---------------------------------------------------------------------- #
 
-    def schedule_evaluate(self, x, t, checkfinite=True, sinks=True, simstate=None):
+    def schedule_evaluate(
+        self, x, t, checkfinite=True, sinks=True, simstate=None, partition=None
+    ):
         """
         Evaluate all blocks in the network
 
@@ -551,6 +808,8 @@ class BlockDiagram:
         :param sinks: evaluate sink blocks, defaults to Trye
         :type sinks: bool, optional
         :param simstate: simulation state
+        :param partition: evaluate only these blocks, defaults to None
+        :type partition: tuple
         :return: state derivative
         :rtype: numpy.ndarray
 
@@ -562,61 +821,73 @@ class BlockDiagram:
 
         Sink blocks are not executed here, but after completion their inputs
         will all be valid.
+
+        If ``partition`` is given it is a tuple ``(evallist, sinks)`` of subsets,
+        in the same order, of the ``evallist`` and ``sinks`` lists of the kernel,
+        see :meth:`schedule_compile`, and only those blocks are evaluated.  The
+        outputs of the other blocks keep their previous values.  The caller
+        then ends the evaluation of the :class:`~bdsim.timing.Profiler`, if
+        any, once all the partitions have been evaluated.
         """
 
-        # TODO: don't copy outputs to inputs of next block, have inputs
-        # pull the value from connected inputs
+        kernel = self._kernel
+        if kernel is None:
+            kernel = self.schedule_compile()
 
         self.runtime.DEBUG("state", ">>>>>>>>> t={}, x={} >>>>>>>>>>>>>>>>", t, x)
 
-        # reset all the blocks ready for the evalation
-        self.reset()
+        # reset the blocks that need it ready for the evaluation
+        for b in kernel.resets:
+            try:
+                b.reset()
+            except:
+                self._error_handler("reset", b)
 
-        # split the state vector to stateful blocks
-        for b in self.blocklist:
-            if b.blockclass == "transfer":
-                x = b.setstate(x)
+        # split the state vector to stateful blocks, each block's state is a
+        # view into the kernel's state buffer
+        if kernel.transfers:
+            kernel.xflat[:] = x
+            for b, xview, *_ in kernel.transfers:
+                b._x = xview
 
         # split the discrete state vector to clocked blocks
         for clock in self.clocklist:
             clock.setstate()
 
         self.runtime.DEBUG("propagate", "t={:.3f}", t)
+        debug = "p" in self.runtime.options.debug
+        validate = not kernel.validated
+        signals = kernel.signals
 
-        for sequence, group in enumerate(self.plan):
-            # self.runtime.DEBUG('propagate', '---- sequence = ', sequence)
-
-            for b in group:
-                # ask the block for output, check for errors
-                try:
-                    if sequence == 0:
-                        # blocks called at step 0 have no inputs
-                        out = b.output(t, None, b._x)
-                    else:
-                        out = b.output(t, b.inputs, b._x)
-                except Exception as err:
-                    # output method failed, report it
-                    print(fg("red"))
-                    print(
-                        "--Error at t={:f} when computing output of [{:s}::{:s}]".format(
-                            t, b.type, str(b)
-                        )
-                    )
-                    print()
-                    # print('  {}'.format(err))
-                    traceback.print_exc(file=sys.stderr)
+        if partition is None:
+            evallist, sinklist = kernel.evallist, kernel.sinks
+        else:
+            evallist, sinklist = partition
+        if kernel.refold:
+            # evaluate the blocks with constant outputs first
+            evallist = kernel.folded + evallist
+        profile = kernel.profile
 
-                    print()
-                    for i, input in enumerate(b.inputs):
-                        print(f"Input[{i}] = {input}")
+        for b, srcs, outslice in evallist:
+            if profile is not None:
+                t0 = perf_counter_ns()
 
-                    if b.nstates > 0:
-                        print(f"Block state x = {b._x}")
-                    print(attr(0))
-                    raise RuntimeError from None
+            # ask the block for output, check for errors
+            try:
+                if srcs is None:
+                    # blocks called at step 0 have no inputs
+                    out = b.output(t, None, b._x)
+                elif signals is None:
+                    out = b.output(t, [s.output_values[p] for s, p in srcs], b._x)
+                else:
+                    out = b.output(t, srcs(signals), b._x)
+            except Exception:
+                self._output_error(b, t)
 
+            if debug:
                 self.runtime.DEBUG("propagate", "block {:s}: output = {}", b, out)
 
+            if validate:
                 # check that output is a list of correct length
                 if not isinstance(out, (tuple, list)):
                     raise AssertionError(
@@ -628,41 +899,383 @@ class BlockDiagram:
                         f" of {b.nout}"
                     )
 
-                # TODO check output validity once at the startq
-
-                # check it has no nan or inf values
-                if (
-                    checkfinite
-                    and isinstance(out, (int, float, np.ndarray))
-                    and not np.isfinite(out).any()
-                ):
-                    raise RuntimeError(f"block {b} output contains NaN")
-
-                # # send block outputs to all downstream connected blocks
-                # for (port, outwires) in enumerate(b.outports): # every port
-                #     value = out[port]
-                #     for w in outwires:     # every wire
-
-                #         self.DEBUG('propagate', '  [{}] = {} -->  {}[{}]', port, value, w.end.block.name, w.end.port)
+            # check it has no nan or inf values
+            if (
+                checkfinite
+                and isinstance(out, (int, float, np.ndarray))
+                and not np.isfinite(out).any()
+            ):
+                raise RuntimeError(f"block {b} output contains NaN")
 
-                #         # send value to wire
-                #         w.send(value)
+            b.output_values = out
+            if signals is not None:
+                signals[outslice] = out
 
-                #         # TODO send return status no longer needed
-                #         # TODO use common error handler in all cases above
-                b.output_values = out
+            if profile is not None:
+                profile.record(b, perf_counter_ns() - t0)
 
         if sinks:
-            for b in self.blocklist:
-                if isinstance(b, SinkBlock):
-                    b.step(t, b.inputs)
+            for b, srcs in sinklist:
+                if profile is not None:
+                    t0 = perf_counter_ns()
+                if signals is None:
+                    b.step(t, [s.output_values[p] for s, p in srcs])
+                else:
+                    b.step(t, srcs(signals))
+                if profile is not None:
+                    profile.record(b, perf_counter_ns() - t0)
+
+        if profile is not None and partition is None:
+            # a partitioned evaluation is ended by the caller, after the last
+            # partition
+            profile.end()
 
         # gather the derivative
         YD = self.deriv(t)
 
+        # outputs and derivatives have been validated, skip it on subsequent
+        # evaluations, as well as the blocks with constant outputs
+        kernel.validated = True
+        kernel.refold = False
+
+        if self._refuse:
+            # the signal shapes are now known, fuse the linear blocks when the
+            # kernel is rebuilt on the next evaluation
+            self._refuse = False
+            self._kernel = None
+
         self.runtime.DEBUG("deriv", YD)
         return YD
 
+    def _output_error(self, b, t):
+        # called from except clause when a block's output method fails
+        print(fg("red"))
+        print(
+            "--Error at t={:f} when computing output of [{:s}::{:s}]".format(
+                t, b.type, str(b)
+            )
+        )
+        print()
+        traceback.print_exc(file=sys.stderr)
+
+        print()
+        for i, input in enumerate(b.inputs):
+            print(f"Input[{i}] = {input}")
+
+        if b.nstates > 0:
+            print(f"Block state x = {b._x}")
+        print(attr(0))
+        raise RuntimeError from None
+
+    def schedule_compile(self):
+        """
+        Create the compiled evaluation kernel
+
+        :return: the evaluation kernel
+        :rtype: BDStruct
+
+        Flattens the execution plan into the data structures used by
+        :meth:`schedule_evaluate` so that per-evaluation overhead is minimal:
+
+        - ``evallist``, a flat list of ``(block, sources, outslice)`` in plan
+          order, where ``sources`` describes the block's inputs, or is None for
+          blocks in the first plan group
+        - ``transfers``, a list of ``(block, xview, xdview, sources, inplace)``
+          for every transfer block, where ``xview`` and ``xdview`` are the
+          block's slices of ``xbuf`` and ``xdbuf`` respectively, and
+          ``inplace`` is True if the block's ``deriv_into`` method is used
+        - ``sinks``, a list of ``(block, sources)`` for every sink block
+        - ``resets``, the blocks that override the :meth:`reset` method of their
+          base class
+        - ``xbuf`` and ``xdbuf``, preallocated buffers for the continuous state
+          vector and its derivative, with a leading dimension for the members
+          of an :attr:`ensemble`
+        - ``signals``, the signal store, or None
+        - ``jacobian``, True if every transfer and function block that is
+          evaluated defines a ``jacobian`` method, see :meth:`jacobian`
+        - ``sparsity``, the sparsity pattern of the Jacobian, a boolean
+          ``scipy.sparse`` matrix whose element (i,j) is True if the
+          derivative of state i can depend on state j
+        - ``folded``, a list of ``(block, sources, outslice)`` in plan order
+          for the blocks with constant outputs, which are evaluated before
+          ``evallist`` only if ``refold`` is True, see :attr:`fold`
+        - ``dead``, the set of blocks that are not evaluated since their
+          outputs are not used, see :attr:`fold`
+        - ``parallel``, a list of the :class:`~bdsim.parallel.ParallelGroup`
+          blocks that replace the expensive blocks of each plan group in
+          ``evallist``, see :attr:`workers`, and ``pool`` the thread pool they
+          use, or None
+        - ``profile``, a :class:`~bdsim.timing.Profiler` that records the
+          execution time of the blocks, or None
+        - ``fused``, a list of the :class:`~bdsim.fusion.LinearGroup` blocks
+          that replace groups of linear blocks in ``evallist`` and
+          ``transfers``, see :attr:`fuse`
+
+        The block inputs are described according to the evaluation
+        :attr:`engine`.  For the ``"plan"`` engine ``sources`` is a tuple of
+        ``(block, port)`` pairs that drive the block's inputs, and ``signals``
+        and ``outslice`` are None.  For the ``"signals"`` engine ``signals`` is
+        a list with one element per output port of every block, ``outslice``
+        is the slice of it written by the block, and ``sources`` is an
+        :func:`operator.itemgetter` that gathers the block's inputs from it.
+
+        Block output types are checked on the first evaluation only.
+
+        The kernel is saved in the attribute ``_kernel``.
+
+        :seealso: :func:`schedule_generate`, :func:`schedule_evaluate`
+        """
+
+        signals = self.engine == "signals"
+
+        if signals:
+            # allocate a slot in the signal store for every output port
+            nsignals = 0
+            for b in self.blocklist:
+                b._outslice = slice(nsignals, nsignals + b.nout)
+                nsignals += b.nout
+            kernel_signals = [None] * nsignals
+        else:
+            kernel_signals = None
+
+        def sources(b):
+            if not signals:
+                return tuple((plug.block, plug.port) for plug in b.sources)
+
+            # resolve inputs to signal store indices
+            index = [plug.block._outslice.start + plug.port for plug in b.sources]
+            if len(index) == 0:
+                return itemgetter(slice(0, 0))
+            elif index == list(range(index[0], index[0] + len(index))):
+                # contiguous signals, including the single input case
+                return itemgetter(slice(index[0], index[-1] + 1))
+            else:
+                return itemgetter(*index)
+
+        def definer(cls, name):
+            # the class in the MRO that defines the method
+            for c in cls.__mro__:
+                if name in c.__dict__:
+                    return c
+
+        def inplace(b):
+            # use deriv_into, unless a subclass has overridden deriv
+            cls = type(b)
+            return hasattr(cls, "deriv_into") and issubclass(
+                definer(cls, "deriv_into"), definer(cls, "deriv")
+            )
+
+        kernel = BDStruct("kernel")
+        kernel.signals = kernel_signals
+
+        if self.fold:
+            folded, dead = self._prune()
+        else:
+            folded, dead = set(), set()
+
+        kernel.evallist = []
+        kernel.folded = []
+        for sequence, group in enumerate(self.plan):
+            for b in group:
+                if b in dead:
+                    continue
+                entry = (
+                    b,
+                    None if sequence == 0 else sources(b),
+                    b._outslice if signals else None,
+                )
+                if b in folded:
+                    kernel.folded.append(entry)
+                else:
+                    kernel.evallist.append(entry)
+        kernel.dead = dead
+        kernel.refold = True
+
+        nstates = sum([b.nstates for b in self.blocklist if b.blockclass == "transfer"])
+        if self.ensemble is None:
+            shape = (nstates,)
+        else:
+            shape = (self.ensemble, nstates)
+        kernel.xbuf = np.zeros(shape)
+        kernel.xdbuf = np.zeros(shape)
+        kernel.xflat = kernel.xbuf.reshape((-1,))  # view of xbuf
+        kernel.transfers = []
+        i = 0
+        for b in self.blocklist:
+            if b.blockclass == "transfer":
+                b._xslice = slice(i, i + b.nstates)
+                kernel.transfers.append(
+                    (
+                        b,
+                        kernel.xbuf[..., b._xslice],
+                        kernel.xdbuf[..., b._xslice],
+                        sources(b),
+                        inplace(b),
+                    )
+                )
+                i += b.nstates
+
+        kernel.sinks = [
+            (b, sources(b)) for b in self.blocklist if isinstance(b, SinkBlock)
+        ]
+
+        # the base class reset methods have no effect on evaluation
+        basereset = (Block.reset, TransferBlock.reset, ClockedBlock.reset)
+        kernel.resets = [b for b in self.blocklist if type(b).reset not in basereset]
+
+        kernel.sparsity = self._sparsity(kernel)
+
+        # source and clocked block outputs do not depend on the continuous
+        # state, all other blocks must provide their partial derivatives
+        kernel.jacobian = self.ensemble is None and all(
+            hasattr(b, "jacobian")
+            for b, *_ in kernel.evallist
+            if b.blockclass in ("transfer", "function")
+        )
+
+        if self.workers is not None and not signals:
+            from concurrent.futures import ThreadPoolExecutor
+            from bdsim.parallel import parallelize
+
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(self.workers)
+            kernel.pool = self._pool
+            kernel.parallel = parallelize(self, kernel, kernel.pool)
+        else:
+            kernel.pool = None
+            kernel.parallel = []
+
+        if self.fuse and not signals and self.ensemble is None and not self._refuse:
+            from bdsim.fusion import fuse
+
+            kernel.fused = fuse(self, kernel)
+        else:
+            kernel.fused = []
+
+        kernel.validated = False
+        kernel.profile = None
+
+        self._kernel = kernel
+        return kernel
+
+    def invalidate(self, *blocks):
+        """
+        Discard compiled data that depends on block parameters
+
+        :param blocks: blocks whose parameters have changed
+        :type blocks: Block
+
+        Called by :meth:`Block.set_param` after a parameter has been changed,
+        and only the parts of the evaluation kernel that depend on the
+        parameters of these blocks are recomputed:
+
+        - block outputs are checked again on the next evaluation
+        - if a block is folded, see :attr:`fold`, the folded blocks are
+          evaluated again on the next evaluation
+        - if a block is fused, see :attr:`fuse`, the matrices of its group are
+          recomputed.  If the signal shapes of the group have changed the
+          kernel is discarded, and rebuilt without fused blocks on the next
+          evaluation, and with them on the evaluation after that.
+
+        The wiring, schedule and state vector do not depend on block
+        parameters, so the diagram need not be compiled again.
+
+        :seealso: :meth:`schedule_compile`
+        """
+        kernel = self._kernel
+        if kernel is None:
+            return
+        blocks = set(blocks)
+
+        kernel.validated = False
+        if any([b in blocks for b, *_ in kernel.folded]):
+            kernel.refold = True
+        for fused in kernel.fused:
+            if not blocks.isdisjoint(fused.blocks) and not fused.update():
+                # the new signal shapes are known only once the blocks have
+                # been evaluated, as in compile
+                self._kernel = None
+                self._refuse = True
+                return
+
+    def _prune(self):
+        # the blocks with constant outputs, and the blocks whose outputs are
+        # not used.  A block's output is constant if it is pure and all its
+        # inputs are constant, which includes pure source blocks.  A block's
+        # output is used if it drives, through any chain of blocks, a transfer,
+        # clocked or sink block or a watched port
+        constant = set()
+        for group in self.plan:
+            for b in group:
+                if getattr(b, "pure", False) and all(
+                    [plug.block in constant for plug in b.sources]
+                ):
+                    constant.add(b)
+
+        used = set()
+        stack = [
+            b
+            for b in self.blocklist
+            if b.blockclass in ("transfer", "clocked", "sink", "graphics")
+        ]
+        stack.extend(self.watched)
+        while stack:
+            b = stack.pop()
+            if b not in used:
+                used.add(b)
+                stack.extend([plug.block for plug in b.sources])
+
+        dead = {b for group in self.plan for b in group} - used
+        return constant - dead, dead
+
+    def _sparsity(self, kernel):
+        # sparsity pattern of the Jacobian from the wiring, a transfer block's
+        # derivative depends on its own state and the states that drive its
+        # inputs, through any chain of function blocks.  The outputs of source
+        # and clocked blocks do not depend on the continuous state.  Each
+        # block's derivative is assumed to depend on all of its state and
+        # inputs, and each function block output on all of its inputs
+        deps = {}  # the transfer blocks that drive each (block, port) output
+
+        def inputdeps(b):
+            return set().union(
+                *[deps.get((plug.block, plug.port), ()) for plug in b.sources]
+            )
+
+        for b, *_ in kernel.evallist:
+            if b.blockclass == "transfer":
+                d = {b}
+            elif b.blockclass in ("source", "clocked"):
+                continue
+            else:
+                d = inputdeps(b)
+            for port in range(b.nout):
+                deps[b, port] = d
+
+        rows, cols = [], []
+        for b, *_ in kernel.transfers:
+            for xb in inputdeps(b) | {b}:
+                i, j = np.meshgrid(
+                    np.arange(b._xslice.start, b._xslice.stop),
+                    np.arange(xb._xslice.start, xb._xslice.stop),
+                    indexing="ij",
+                )
+                rows.append(i.ravel())
+                cols.append(j.ravel())
+
+        n = kernel.xbuf.shape[-1]
+        if rows:
+            rows, cols = np.concatenate(rows), np.concatenate(cols)
+        sparsity = sp.csr_matrix(
+            (np.ones(len(rows), dtype=bool), (rows, cols)), shape=(n, n)
+        )
+        if self.ensemble is not None:
+            # the members are independent
+            sparsity = sp.kron(
+                sp.identity(self.ensemble, dtype=bool), sparsity, format="csr"
+            )
+        return sparsity
+
     def schedule_generate(self):
         """
         Create execution plan
@@ -686,41 +1299,128 @@ class BlockDiagram:
         :seealso: :func:`schedule_report`, :func:`schedule_dotfile`
         """
 
-        plan = []
-        group = []
+        # topological sort of the blocks (Kahn's algorithm), the sequence of a
+        # block is one more than the largest sequence of the blocks that drive
+        # it.  The inputs of blocks in the first group are not followed
+        first = ("source", "transfer", "clocked")
+        children = {b: [] for b in self.blocklist}
+        count = {}  # number of parents that are not yet sequenced
+        ready = []
         for b in self.blocklist:
             b._sequence = None
-            if b.blockclass in ("source", "transfer", "clocked"):
-                b._sequence = 0
-                group.append(b)
-        plan.append(group)
-        sequence = len(plan)
-
-        while True:
-            group = []
-            for b in self.blocklist:
-                if b._sequence is not None:
-                    continue  # already has a sequence assigned
-
-                if all(
-                    [
-                        p._sequence < sequence if p._sequence is not None else False
-                        for p in b._parents
-                    ]
-                ):
-                    group.append(b)
-
-            for b in group.copy():
-                b._sequence = sequence
-                if b.blockclass in ("sink", "graphics"):
-                    group.remove(b)
-            if len(group) == 0:
-                break
-            plan.append(group)
-            sequence += 1
+            if b.blockclass in first:
+                count[b] = 0
+                ready.append(b)
+            else:
+                count[b] = len(b._parents)
+                for p in b._parents:
+                    if p is not None:
+                        children[p].append(b)
+                if count[b] == 0:
+                    ready.append(b)
+
+        for b in ready:
+            b._sequence = 0 if b.blockclass in first else 1
+        while ready:
+            b = ready.pop()
+            for c in children[b]:
+                if c._sequence is None or c._sequence <= b._sequence:
+                    c._sequence = b._sequence + 1
+                count[c] -= 1
+                if count[c] == 0:
+                    ready.append(c)
+
+        # blocks in, or driven by, an algebraic loop are never sequenced, and
+        # sink blocks are not part of the plan
+        plan = [[]]
+        for b in self.blocklist:
+            if count[b] > 0:
+                b._sequence = None
+            elif b.blockclass not in ("sink", "graphics"):
+                while len(plan) <= b._sequence:
+                    plan.append([])
+                plan[b._sequence].append(b)
 
         self.plan = plan
 
+    def _algebraic_loops(self):
+        # the strongly connected components of the graph of function and
+        # subsystem blocks that form a cycle, using Tarjan's algorithm without
+        # recursion.  Each loop is reported as the shortest cycle through the
+        # component's first block in block list order, in wiring order
+        nodes = [b for b in self.blocklist if b.blockclass in ("function", "subsystem")]
+        nodeset = set(nodes)
+
+        def successors(b):
+            return [
+                w.end.block
+                for wires in b.output_wires
+                for w in wires
+                if w.end.block in nodeset
+            ]
+
+        def cycle(component):
+            # breadth-first search within the component for the shortest
+            # path from its first block back to itself
+            members = set(component)
+            first = min(component, key=lambda c: c.id)
+            previous = {}
+            frontier = [first]
+            while first not in previous:
+                following = []
+                for b in frontier:
+                    for c in successors(b):
+                        if c in members and c not in previous:
+                            previous[c] = b
+                            following.append(c)
+                frontier = following
+            path = [first]
+            b = previous[first]
+            while b is not first:
+                path.append(b)
+                b = previous[b]
+            return path[:1] + path[:0:-1]
+
+        index = {}
+        lowlink = {}
+        stack = []
+        onstack = set()
+        loops = []
+        for root in nodes:
+            if root in index:
+                continue
+            index[root] = lowlink[root] = len(index)
+            stack.append(root)
+            onstack.add(root)
+            work = [(root, iter(successors(root)))]
+            while work:
+                b, it = work[-1]
+                for c in it:
+                    if c not in index:
+                        index[c] = lowlink[c] = len(index)
+                        stack.append(c)
+                        onstack.add(c)
+                        work.append((c, iter(successors(c))))
+                        break
+                    elif c in onstack:
+                        lowlink[b] = min(lowlink[b], index[c])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[parent] = min(lowlink[parent], lowlink[b])
+                    if lowlink[b] == index[b]:
+                        component = []
+                        while True:
+                            c = stack.pop()
+                            onstack.discard(c)
+                            component.append(c)
+                            if c is b:
+                                break
+                        if len(component) > 1 or b in successors(b):
+                            loops.append(cycle(component))
+        return loops
+
     def schedule_dotfile(self, filename):
         """
         Write a GraphViz dot file representing the execution schedule
@@ -1069,16 +1769,21 @@ class BlockDiagram:
         raise RuntimeError("Fatal failure") from None
 
     def getstate0(self):
-        # get the state from each stateful block
-        x0 = np.array([])
+        # get the state from each stateful block, for an ensemble the block's
+        # initial state is broadcast to all members
+        if self.ensemble is None:
+            x0 = np.zeros((self.nstates,))
+        else:
+            x0 = np.zeros((self.ensemble, self.nstates))
+        i = 0
         for b in self.blocklist:
             try:
                 if b.blockclass == "transfer":
-                    x0 = np.r_[x0, b.getstate0()]
-                # print('x0', x0)
+                    x0[..., i : i + b.nstates] = b.getstate0()
+                    i += b.nstates
             except:
                 self._error_handler("getstate0", b)
-        return x0
+        return x0.ravel()
 
     def reset(self):
         """
@@ -1128,25 +1833,182 @@ class BlockDiagram:
 
         :param t: simulation time, defaults to None
         :type t: float
-        :param simstate: simulation state, defaults to None
-        :type simstate: SimState, optional
+        :return: state derivative
+        :rtype: numpy.ndarray
+
+        Each block's derivative is written into its slice of the preallocated
+        derivative buffer, either by the block's ``deriv_into`` method or by
+        copying the value returned by its ``deriv`` method.  A copy of the buffer
+        is returned since the integrator may hold on to it.
         """
-        YD = np.array([])
-        for b in self.blocklist:
-            if b.blockclass == "transfer":
-                try:
-                    yd = b.deriv(t, b.inputs, b._x)
+        kernel = self._kernel
+        validate = not kernel.validated
+        signals = kernel.signals
+        for b, xview, xdview, srcs, inplace in kernel.transfers:
+            try:
+                if signals is None:
+                    u = [s.output_values[p] for s, p in srcs]
+                else:
+                    u = srcs(signals)
+                if inplace:
+                    b.deriv_into(t, u, b._x, xdview)
+                    continue
+                yd = b.deriv(t, u, b._x)
+                if validate:
                     if not isinstance(yd, np.ndarray):
                         raise AssertionError(f"deriv: block {b} did not return ndarray")
-                    if yd.ndim != 1 or yd.shape[0] != b.nstates:
+                    if yd.shape != xdview.shape:
                         raise AssertionError(
-                            f"deriv: block {b} returns wrong shape {yd.shape}, should"
-                            f" be ({b.nstates},)"
+                            f"deriv: block {b} returns wrong shape {yd.shape},"
+                            f" should be {xdview.shape}"
                         )
-                    YD = np.r_[YD, yd]
-                except:
-                    self._error_handler("deriv", b)
-        return YD
+                xdview[:] = yd
+            except:
+                self._error_handler("deriv", b)
+        return kernel.xdbuf.flatten()
+
+    def jacobian(self, t, x):
+        """
+        Jacobian of the state derivative
+
+        :param t: simulation time
+        :type t: float
+        :param x: continuous state
+        :type x: ndarray(n)
+        :return: Jacobian :math:`\\partial \\dot{x} / \\partial x`, or None
+        :rtype: scipy.sparse.csr_matrix(n,n)
+
+        The diagram is evaluated at ``t`` and ``x``, without the sink blocks,
+        and the Jacobian is assembled from the partial derivatives returned by
+        the ``jacobian`` methods of the blocks.  The derivatives of the block
+        outputs with respect to the state are propagated along the wires in
+        plan order, using the chain rule through function blocks, and through
+        the ports of subsystems unchanged.  The outputs
+        of source and clocked blocks do not depend on the continuous state.
+
+        Returns None if a transfer or function block does not define a
+        ``jacobian`` method, or cannot provide its derivatives for its current
+        inputs, or for an :attr:`ensemble`.  The integrator should then
+        estimate the Jacobian by finite differences.
+
+        :seealso: :class:`TransferBlock`, :class:`FunctionBlock`
+        """
+        kernel = self._kernel
+        if kernel is None:
+            kernel = self.schedule_compile()
+        if not kernel.jacobian:
+            return None
+
+        self.schedule_evaluate(x, t, sinks=False)
+
+        # derivatives wrt the state are held as dicts that map a transfer block
+        # to the dense derivative wrt that block's state, blocks that have no
+        # influence are absent
+        dydx = {}  # derivative of (block, port) output wrt state
+
+        def dudx(b):
+            # derivative of the block's inputs wrt state
+            return [dydx.get((plug.block, plug.port)) for plug in b.sources]
+
+        def chain(D, dudx, d=None):
+            # add D[i] @ dudx[i], summed over the inputs, to d
+            if d is None:
+                d = {}
+            for Di, dui in zip(D, dudx):
+                if dui is None:
+                    continue
+                Di = np.atleast_2d(Di)
+                for xb, M in dui.items():
+                    if xb in d:
+                        d[xb] = d[xb] + Di @ M
+                    else:
+                        d[xb] = Di @ M
+            return d
+
+        # the blocks rather than the kernel's evaluation list, in which blocks
+        # may have been fused.  Folded and eliminated blocks have no influence
+        skip = kernel.dead.union([b for b, *_ in kernel.folded])
+        jac = {}
+        for b in [b for group in self.plan for b in group if b not in skip]:
+            if b.blockclass == "transfer":
+                J = b.jacobian(t, b.inputs, b._x)
+                if J is None:
+                    return None
+                A, B, C = J
+                for j, Cj in enumerate(C):
+                    dydx[b, j] = {b: np.atleast_2d(Cj)}
+                jac[b] = (A, B)
+
+            elif b.blockclass == "function":
+                D = b.jacobian(t, b.inputs, None)
+                if D is None:
+                    return None
+                du = dudx(b)
+                for j, Dj in enumerate(D):
+                    dy = chain(Dj, du)
+                    if dy:
+                        dydx[b, j] = dy
+
+            elif b.blockclass == "subsystem":
+                # subsystem ports pass their inputs through unchanged
+                for j, du in enumerate(dudx(b)):
+                    if du is not None:
+                        dydx[b, j] = du
+
+        # the derivatives of the transfer block inputs are now known, assemble
+        # the dense blocks of the Jacobian as a sparse matrix
+        data, rows, cols = [], [], []
+        for b in self.blocklist:
+            if b.blockclass != "transfer":
+                continue
+            A, B = jac[b]
+            d = chain(B, dudx(b), {b: np.atleast_2d(A)})
+            r = b._xslice.start
+            for xb, M in d.items():
+                c = xb._xslice.start
+                i, j = np.indices(M.shape)
+                data.append(M.ravel())
+                rows.append(r + i.ravel())
+                cols.append(c + j.ravel())
+        return sp.csr_matrix(
+            (np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))),
+            shape=(self.nstates, self.nstates),
+        )
+
+    def codegen(self, filename=None):
+        """
+        Generate code that evaluates the block diagram
+
+        :param filename: write the source code to this file, defaults to None
+        :type filename: str, optional
+        :raises ValueError: the diagram has not been compiled, or is an ensemble
+        :return: generated module
+        :rtype: module
+
+        Creates a Python module that evaluates the compiled diagram as
+        straight-line code, with the wiring inlined and the block parameters
+        baked in as constants.  It has a function ``f(t, x)`` that returns the
+        derivative of the continuous state and a function ``outputs(t, x)``
+        that returns a dict of all block outputs, keyed by block name.  For
+        example::
+
+            bd.compile()
+            rhs = bd.codegen()
+            sol = scipy.integrate.solve_ivp(rhs.f, (0, 10), rhs.x0)
+
+        Blocks without a code template are evaluated by calling the block
+        object, and these are bound to the returned module.  The source code is
+        the attribute ``source`` of the module.
+
+        :seealso: :mod:`bdsim.codegen`
+        """
+        from bdsim import codegen
+
+        source = codegen.codegen(self)
+        if filename is not None:
+            with open(filename, "w") as f:
+                f.write(source)
+        return codegen.load(source, self.blocklist)
 
     def start(self, simstate=None):
         """
@@ -1163,6 +2025,10 @@ class BlockDiagram:
 
         """
 
+        if self._kernel is not None:
+            # block parameters may have changed, evaluate the folded blocks
+            self._kernel.refold = True
+
         for c in self.clocklist:
             try:
                 c.start(simstate)
@@ -5,10 +5,14 @@ Define real-time i/o blocks for use in block diagrams.  These are blocks that:
 - have no state variables
 - are a subclass of ``SourceBlock`` or ``SinkBlock``
 
+The reads and writes block, so each block also has a coroutine ``aoutput`` or
+``astep`` that does the I/O in a worker thread, which lets
+``BDRealTime.arun`` overlap the I/O of several blocks.
 """
 # The constructor of each class ``MyClass`` with a ``@block`` decorator becomes a method ``MYCLASS()`` of the BlockDiagram instance.
 
 from bdsim.components import SinkBlock, SourceBlock
+import asyncio
 import time
 import sys
 
@@ -53,6 +57,10 @@ class AnalogIn(SourceBlock):
     def output(self, t, inports, x):
         return [self.scale * self.pin.read() + self.offset]
 
+    async def aoutput(self, t, inports, x):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.output, t, inports, x)
+
 
 class AnalogOut(SinkBlock):
     nin = 1
@@ -68,6 +76,10 @@ class AnalogOut(SinkBlock):
     def step(self, t, inports):
         self.pin.write(self.scale * inports[0] + self.offset)
 
+    async def astep(self, t, inports):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.step, t, inports)
+
 
 class DigitalIn(FirmataIO, SourceBlock):
     nin = 0
@@ -83,6 +95,10 @@ class DigitalIn(FirmataIO, SourceBlock):
         else:
             return [self.pin.read() > 0]
 
+    async def aoutput(self, t, inports, x):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.output, t, inports, x)
+
 
 class DigitalOut(FirmataIO, SinkBlock):
     nin = 1
@@ -94,3 +110,7 @@ class DigitalOut(FirmataIO, SinkBlock):
 
     def step(self, t, inports):
         self.pin.write(inports[0] > 0)
+
+    async def astep(self, t, inports):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.step, t, inports)
@@ -65,6 +65,7 @@ class Item(FunctionBlock):
 
     nin = 1
     nout = 1
+    pure = True
 
     def __init__(self, item, **blockargs):
         """
@@ -130,6 +131,7 @@ class Dict(FunctionBlock):
 
     nin = 1
     nout = 1
+    pure = True
 
     def __init__(self, keys, **blockargs):
         """
@@ -185,6 +187,7 @@ class Mux(FunctionBlock):
 
     nin = -1
     nout = 1
+    pure = True
 
     def __init__(self, nin=1, **blockargs):
         """
@@ -205,6 +208,13 @@ class Mux(FunctionBlock):
                 out.extend(input.flatten().tolist())
         return [np.array(out)]
 
+    def codegen(self, u, x, const):
+        if not all(
+            [isinstance(input, (int, float, bool, np.ndarray)) for input in self.inputs]
+        ):
+            return None
+        return ["np.concatenate([" + ", ".join([f"np.ravel({i})" for i in u]) + "])"]
+
 
 # ------------------------------------------------------------------------ #
 class DeMux(FunctionBlock):
@@ -243,6 +253,7 @@ class DeMux(FunctionBlock):
 
     nin = 1
     nout = -1
+    pure = True
 
     def __init__(self, nout=1, **blockargs):
         """
@@ -261,6 +272,9 @@ class DeMux(FunctionBlock):
         ), "Input width not equal to number of output ports"
         return list(input)
 
+    def codegen(self, u, x, const):
+        return [f"{u[0]}[{i}]" for i in range(self.nout)]
+
 
 # ------------------------------------------------------------------------ #
 
@@ -298,6 +312,7 @@ class Index(FunctionBlock):
 
     nin = 1
     nout = 1
+    pure = True
 
     def __init__(self, index=[], **blockargs):
         """
@@ -324,6 +339,14 @@ class Index(FunctionBlock):
         else:
             return [[input[i] for i in self.index]]
 
+    def codegen(self, u, x, const):
+        if len(self.index) == 1:
+            return [f"{u[0]}[{const(self.index[0])}]"]
+        elif isinstance(self.inputs[0], np.ndarray):
+            return [f"{u[0]}[{const(np.array(self.index))}]"]
+        else:
+            return None
+
 
 # ------------------------------------------------------------------------ #
 
@@ -497,6 +520,7 @@ class InPort(SubsystemBlock):
 
     nin = 0
     nout = -1
+    pure = True
 
     def __init__(self, nout=1, **blockargs):
         """
@@ -549,6 +573,7 @@ class OutPort(SubsystemBlock):
 
     nin = -1
     nout = 0
+    pure = True
 
     def __init__(self, nin=1, **blockargs):
         """
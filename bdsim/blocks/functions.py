@@ -66,6 +66,7 @@ class Sum(FunctionBlock):
 
     nin = -1
     nout = 1
+    pure = True
 
     _modefuncs = {
         "r": lambda x: x,
@@ -154,6 +155,32 @@ class Sum(FunctionBlock):
 
         return [sum]
 
+    @property
+    def linear(self):
+        # angle wrapping is not linear
+        return self.mode is None
+
+    def codegen(self, u, x, const):
+        if self.mode is not None:
+            return None
+        expr = "-" + u[0] if self.signs[0] == "-" else u[0]
+        for sign, input in zip(self.signs[1:], u[1:]):
+            expr += f" {sign} {input}"
+        return [expr]
+
+    def jacobian(self, t, inports, x):
+        # angle wrapping does not change the derivative
+        n = max([np.size(input) for input in inports])
+        D = []
+        for sign, input in zip(self.signs, inports):
+            if np.size(input) == n:
+                Di = np.eye(n)
+            else:
+                # input is broadcast to the sum
+                Di = np.ones((n, 1))
+            D.append(-Di if sign == "-" else Di)
+        return [D]
+
 
 # ------------------------------------------------------------------------ #
 class Prod(FunctionBlock):
@@ -201,6 +228,7 @@ class Prod(FunctionBlock):
 
     nin = -1
     nout = 1
+    pure = True
 
     def __init__(self, ops: str = "**", matrix: bool = False, **blockargs):
         """
@@ -243,6 +271,14 @@ class Prod(FunctionBlock):
 
         return [prod]
 
+    def codegen(self, u, x, const):
+        if self.matrix:
+            return None
+        expr = "1.0 / " + u[0] if self.ops[0] == "/" else u[0]
+        for op, input in zip(self.ops[1:], u[1:]):
+            expr += f" {op} {input}"
+        return [expr]
+
 
 # ------------------------------------------------------------------------ #
 
@@ -287,6 +323,8 @@ class Gain(FunctionBlock):
 
     nin = 1
     nout = 1
+    linear = True
+    pure = True
 
     def __init__(
         self, K: Union[int, float, np.ndarray] = 1, premul: bool = False, **blockargs
@@ -313,6 +351,12 @@ class Gain(FunctionBlock):
             # array x array case
             if self.premul:
                 # premultiply by gain
+                # the block may come from a subsystem, so ask the compiled
+                # diagram that evaluates it
+                bd = self._diagram
+                if bd is not None and bd.ensemble is not None:
+                    # ensemble, one row of input per member
+                    return [input @ self.K.T]
                 return [self.K @ input]
             else:
                 # postmultiply by gain
@@ -320,6 +364,37 @@ class Gain(FunctionBlock):
         else:
             return [input * self.K]
 
+    def codegen(self, u, x, const):
+        input = self.inputs[0]
+        K = const(self.K)
+
+        if isinstance(input, np.ndarray) and isinstance(self.K, np.ndarray):
+            if self.premul:
+                return [f"{K} @ {u[0]}"]
+            else:
+                return [f"{u[0]} @ {K}"]
+        else:
+            return [f"{u[0]} * {K}"]
+
+    def jacobian(self, t, inports, x):
+        input = inports[0]
+
+        if isinstance(self.K, np.ndarray):
+            if not isinstance(input, np.ndarray):
+                # vector of gains times a scalar
+                if self.K.ndim > 1:
+                    return None
+                return [[self.K.reshape((-1, 1))]]
+            if input.ndim > 1 or self.K.ndim > 2:
+                return None
+            if self.K.ndim == 1:
+                # inner product
+                return [[self.K.reshape((1, -1))]]
+            return [[self.K if self.premul else self.K.T]]
+        else:
+            # elementwise gain
+            return [[self.K * np.eye(np.size(input))]]
+
 
 # ------------------------------------------------------------------------ #
 
@@ -368,6 +443,7 @@ class Pow(FunctionBlock):
 
     nin = 1
     nout = 1
+    pure = True
 
     def __init__(self, p: Union[int, float] = 1, matrix: bool = False, **blockargs):
         """
@@ -404,6 +480,11 @@ class Pow(FunctionBlock):
         else:
             return [input**self.p]
 
+    def codegen(self, u, x, const):
+        if self.matrix and isinstance(self.inputs[0], np.ndarray):
+            return None
+        return [f"{u[0]} ** {const(self.p)}"]
+
 
 # ------------------------------------------------------------------------ #
 
@@ -451,6 +532,7 @@ class Clip(FunctionBlock):
 
     nin = 1
     nout = 1
+    pure = True
 
     def __init__(
         self, min: ArrayLike = -math.inf, max: ArrayLike = math.inf, **blockargs
@@ -476,6 +558,13 @@ class Clip(FunctionBlock):
             out = min(self.max, max(input, self.min))
         return [out]
 
+    def codegen(self, u, x, const):
+        min, max = const(self.min), const(self.max)
+        if isinstance(self.inputs[0], np.ndarray):
+            return [f"np.clip({u[0]}, {min}, {max})"]
+        else:
+            return [f"min({max}, max({u[0]}, {min}))"]
+
 
 # ------------------------------------------------------------------------ #
 
@@ -57,6 +57,8 @@ class Inverse(FunctionBlock):
 
     nin = 1
     nout = 2
+    pure = True
+    expensive = True
 
     onames = ("inv", "cond")
 
@@ -136,6 +138,7 @@ class Transpose(FunctionBlock):
 
     nin = 1
     nout = 1
+    pure = True
 
     def __init__(self, **blockargs):
         """
@@ -192,6 +195,7 @@ class Norm(FunctionBlock):
 
     nin = 1
     nout = 1
+    pure = True
 
     def __init__(self, ord=None, axis=None, **blockargs):
         """
@@ -248,6 +252,7 @@ class Flatten(FunctionBlock):
 
     nin = 1
     nout = 1
+    pure = True
 
     def __init__(self, order="C", **blockargs):
         """
@@ -333,6 +338,7 @@ class Slice2(FunctionBlock):
 
     nin = 1
     nout = 1
+    pure = True
 
     def __init__(self, rows=None, cols=None, **blockargs):
         """
@@ -432,6 +438,7 @@ class Slice1(FunctionBlock):
 
     nin = 1
     nout = 1
+    pure = True
 
     def __init__(self, index, **blockargs):
         """
@@ -493,6 +500,8 @@ class Det(FunctionBlock):
 
     nin = 1
     nout = 1
+    pure = True
+    expensive = True
 
     def __init__(self, **blockargs):
         """
@@ -540,6 +549,8 @@ class Cond(FunctionBlock):
 
     nin = 1
     nout = 1
+    pure = True
+    expensive = True
 
     def __init__(self, **blockargs):
         """
@@ -40,6 +40,7 @@ class Constant(SourceBlock):
 
     nin = 0
     nout = 1
+    pure = True
 
     def __init__(self, value=0, **blockargs):
         """
@@ -59,6 +60,9 @@ class Constant(SourceBlock):
     def output(self, t, inports, x):
         return [self.value]
 
+    def codegen(self, u, x, const):
+        return [const(self.value)]
+
 
 # ------------------------------------------------------------------------ #
 
@@ -155,7 +159,8 @@ class WaveForm(SourceBlock, EventSource):
     a number in the range [0,1] where 1 corresponds to one cycle.
 
     .. note:: For discontinuous signals (square, triangle) the block declares
-        events for every discontinuity.
+        events for every discontinuity, one at a time as the simulation
+        proceeds.
 
     :seealso: :meth:`declare_events`
     """
@@ -239,16 +244,24 @@ class WaveForm(SourceBlock, EventSource):
             t1 = (0.25 + self.phase) / self.freq
             t2 = (0.75 + self.phase) / self.freq
         else:
+            self._edges = None
             return
 
-        # t1 < t2
-        T = 1.0 / self.freq
+        # t1 < t2, the edges in the first period
+        self._edges = (t1, t2)
+        self._edge = 0
         if simstate is not None:
-            while t1 < simstate.T:
-                simstate.declare_event(self, t1)
-                simstate.declare_event(self, t2)
-                t1 += T
-                t2 += T
+            self.next_event(simstate)
+
+    def next_event(self, simstate):
+        if self._edges is None:
+            return
+
+        # edges alternate between t1 and t2 of successive periods
+        t = self._edges[self._edge % 2] + (self._edge // 2) / self.freq
+        if t < simstate.T:
+            simstate.declare_event(self, t)
+            self._edge += 1
 
     def output(self, t, inports, x):
         T = 1.0 / self.freq
@@ -331,7 +344,8 @@ class Piecewise(SourceBlock, EventSource):
           a tuple with time zero otherwise the output will be undefined.
         - The 2-tuples can
 
-    .. note:: The block declares an event for the start of each segment.
+    .. note:: The block declares an event for the start of each segment, one
+        at a time.
 
     :seealso: :meth:`declare_events`
     """
@@ -358,9 +372,15 @@ class Piecewise(SourceBlock, EventSource):
     def start(self, simstate):
         super().start(simstate)
 
+        self._segment = 0
         if simstate is not None:
-            for t in self.t:
-                simstate.declare_event(self, t)
+            self.next_event(simstate)
+
+    def next_event(self, simstate):
+        # declare the start of the next segment
+        if self._segment < len(self.t):
+            simstate.declare_event(self, self.t[self._segment])
+            self._segment += 1
 
     def output(self, t, inports, x):
         i = sum([1 if t >= _t else 0 for _t in self.t]) - 1
@@ -125,17 +125,57 @@ class Integrator(TransferBlock):
         return [self.gain * x]
 
     def deriv(self, t, u, x):
-        xd = base.getvector(u[0])
+        xd = np.empty(x.shape)
+        self.deriv_into(t, u, x, xd)
+        return xd
+
+    def deriv_into(self, t, u, x, xd):
         if self.enable is not None and not self.enable(t, u, x):
             # if enable function returns False then integrator output is jammed at zero
             self._x = np.zeros(x.shape)
-            return np.zeros(x.shape)
+            xd[:] = 0
+            return
+        u = u[0]
+        if np.size(u) == xd.size:
+            # input matches the state, perhaps as a column vector
+            xd[:] = np.reshape(u, xd.shape)
+        else:
+            # input is broadcast to the state
+            xd[:] = u
         if self.min is not None:
             xd[x < self.min] = 0
         if self.max is not None:
             xd[x > self.max] = 0
+        xd *= self.gain
+
+    @property
+    def linear(self):
+        return self.enable is None and self.min is None and self.max is None
+
+    def codegen(self, u, x, const):
+        if not self.linear:
+            return None
+        gain = const(self.gain)
+        if np.size(self.inputs[0]) == self.nstates:
+            xd = f"{gain} * np.ravel({u[0]})"
+        else:
+            xd = f"{gain} * {u[0]}"
+        return [f"{gain} * {x}"], xd
 
-        return self.gain * xd
+    def jacobian(self, t, u, x):
+        n = self.nstates
+        if np.size(u[0]) == n:
+            B = np.eye(n)
+        else:
+            # input is broadcast to the state
+            B = np.ones((n, 1))
+        if self.enable is not None and not self.enable(t, u, x):
+            B[:] = 0
+        if self.min is not None:
+            B[x < self.min, :] = 0
+        if self.max is not None:
+            B[x > self.max, :] = 0
+        return np.zeros((n, n)), [self.gain * B], [self.gain * np.eye(n)]
 
 
 class PoseIntegrator(TransferBlock):
@@ -248,6 +288,7 @@ class LTI_SS(TransferBlock):
 
     nin = 1
     nout = 1
+    linear = True
 
     def __init__(self, A=None, B=None, C=None, x0=None, **blockargs):
         r"""
@@ -292,15 +333,33 @@ class LTI_SS(TransferBlock):
             self._x0 = x0
 
     def output(self, t, u, x):
+        if x.ndim > 1:
+            # ensemble, one row of x per member
+            return list((x @ self.C.T).T)
         return list(self.C @ x)
 
     def deriv(self, t, u, x):
-        # Reshape u and x to (N,1), i.e. column vectors, so
-        # no problems with broadcasting between A@x and B@u
-        x = x.reshape(-1, 1)
-        u = np.array(u).reshape(-1, 1)
-        xd = self.A @ x + self.B @ u
-        return xd.flatten()
+        xd = np.empty(x.shape)
+        self.deriv_into(t, u, x, xd)
+        return xd
+
+    def deriv_into(self, t, u, x, xd):
+        if x.ndim > 1:
+            # ensemble, one row of x and u per member
+            np.matmul(x, self.A.T, out=xd)
+            xd += np.reshape(u[0], (x.shape[0], -1)) @ self.B.T
+            return
+        # flatten u so there are no problems with broadcasting between A@x and B@u
+        np.matmul(self.A, x, out=xd)
+        xd += self.B @ np.ravel(u)
+
+    def codegen(self, u, x, const):
+        A, B = const(self.A), const(self.B)
+        y = [f"{const(Cj)} @ {x}" for Cj in self.C]
+        return y, f"{A} @ {x} + {B} @ np.ravel({u[0]})"
+
+    def jacobian(self, t, u, x):
+        return self.A, [self.B], list(self.C[:, np.newaxis, :])
 
 
 # ------------------------------------------------------------------------ #
@@ -411,11 +470,11 @@ class LTI_SISO(LTI_SS):
 
         # C = (N[1:] - N[0] * D[1:]).reshape((1, n))
 
-        A, B, C, D = scipy.signal.tf2ss(N, D)
-
         self.num = N
         self.den = D
 
+        A, B, C, D = scipy.signal.tf2ss(N, D)
+
         if len(np.flatnonzero(D)) > 0:
             raise ValueError("D matrix is not zero")
 
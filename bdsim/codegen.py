@@ -0,0 +1,227 @@
+"""
+Code generation
+
+Creates the source of a standalone Python module that evaluates a compiled
+block diagram.  The wiring is inlined as local variables and the block
+parameters are baked in as constants, so evaluating the diagram involves no
+per-block method calls.  The module defines:
+
+- ``f(t, x)``, the derivative of the continuous state, which can be passed
+  directly to ``scipy.integrate.solve_ivp``
+- ``outputs(t, x)``, a dict that maps each block name to a list of its output
+  values
+- ``x0``, the initial continuous state
+- ``blocks``, a dict of the blocks that have no code template, see below
+
+A block provides a code template by defining a method::
+
+    codegen(u, x, const)
+
+where ``u`` is a list of Python expressions, one per input port, ``x`` is an
+expression for the block's continuous state, and ``const(value)`` returns an
+expression for a constant value, such as a block parameter.  It returns a list
+of expressions, one per output port, or for a transfer block a tuple of the
+output list and an expression for the state derivative.  If it returns None,
+or the block has no such method, the generated code calls the block's
+``output`` and ``deriv`` methods instead.  The block objects must then be
+provided by::
+
+    module.blocks.update({b.name: b for b in bd.blocklist})
+
+which is done by :meth:`BlockDiagram.codegen` when it returns the module.
+Clocked blocks always use their ``output`` method, and output their current
+discrete state.
+
+The signal types, for example whether a signal is a scalar or an array, are
+those of the most recent evaluation of the diagram, which is done by
+:meth:`BlockDiagram.compile`.  A template may consult the block's current
+input values ``self.inputs`` to choose the expression.
+"""
+
+import math
+import types
+
+import numpy as np
+
+
+def constant(value, constants):
+    """
+    Expression for a constant value
+
+    :param value: the value
+    :type value: bool, int, float or ndarray
+    :param constants: module level constant definitions, appended to for arrays
+    :type constants: list of str
+    :raises ValueError: the value cannot be represented
+    :return: Python expression for the value
+    :rtype: str
+
+    Scalars are given as literals.  Arrays are defined as module level
+    constants named ``c0``, ``c1`` etc.
+    """
+    if isinstance(value, (bool, np.bool_)):
+        return repr(bool(value))
+    elif isinstance(value, (int, np.integer)):
+        return repr(int(value))
+    elif isinstance(value, (float, np.floating)):
+        value = float(value)
+        if math.isnan(value):
+            return "np.nan"
+        elif math.isinf(value):
+            return "np.inf" if value > 0 else "(-np.inf)"
+        return repr(value)
+    elif isinstance(value, np.ndarray) and value.dtype.kind in "biuf":
+        elements = ", ".join([constant(v, constants) for v in value.ravel()])
+        name = f"c{len(constants)}"
+        constants.append(
+            f"{name} = np.array([{elements}], dtype=np.{value.dtype}).reshape"
+            f"({value.shape})"
+        )
+        return name
+    raise ValueError(f"cannot represent {type(value)} as a constant")
+
+
+def codegen(bd):
+    """
+    Generate source code that evaluates a block diagram
+
+    :param bd: compiled block diagram
+    :type bd: BlockDiagram
+    :raises ValueError: the diagram has not been compiled, or is an ensemble
+    :return: source code of a Python module
+    :rtype: str
+
+    :seealso: :meth:`BlockDiagram.codegen`
+    """
+    if not bd.compiled:
+        raise ValueError("block diagram has not been compiled")
+    if bd.ensemble is not None:
+        raise ValueError("code generation is not supported for an ensemble")
+
+    # blocks in plan order, sink blocks are not evaluated
+    evallist = [b for group in bd.plan for b in group]
+
+    constants = []
+
+    def const(value):
+        return constant(value, constants)
+
+    signals = {}  # (block, port) to variable name
+    body = []  # statements that evaluate all the block outputs
+    derivs = []  # statements that compute the derivative
+    fallback = set()  # names of blocks called through the block object
+
+    def template(b, u, x):
+        if b.blockclass == "clocked" or not hasattr(b, "codegen"):
+            return None
+        try:
+            return b.codegen(u, x, const)
+        except ValueError:
+            # a parameter cannot be represented
+            return None
+
+    for k, b in enumerate(evallist):
+        for port in range(b.nout):
+            signals[b, port] = f"y{k}_{port}"
+
+    for k, b in enumerate(evallist):
+        # the inputs of transfer blocks are only used for the derivative, which
+        # is computed after all the block outputs
+        u = [signals[plug.block, plug.port] for plug in b.sources]
+        if b.blockclass == "transfer":
+            x = f"x[{b._xslice.start}:{b._xslice.stop}]"
+        else:
+            x = "None"
+        names = [signals[b, port] for port in range(b.nout)]
+
+        body.append(f"# {b.name}: {b.type}")
+        code = template(b, u, x)
+        if b.blockclass == "transfer" and code is not None:
+            y, xd = code
+        else:
+            y, xd = code, None
+
+        if y is None:
+            fallback.add(b.name)
+            if b.blockclass == "clocked":
+                x = f"blocks[{b.name!r}]._x"
+            if b.blockclass in ("source", "transfer", "clocked"):
+                # blocks in the first plan group are not given their inputs
+                inputs = "None"
+            else:
+                inputs = "[" + ", ".join(u) + "]"
+            body.append(f"y{k} = blocks[{b.name!r}].output(t, {inputs}, {x})")
+            y = [f"y{k}[{port}]" for port in range(b.nout)]
+        for name, expr in zip(names, y):
+            body.append(f"{name} = {expr}")
+
+        if b.blockclass == "transfer":
+            if xd is None:
+                fallback.add(b.name)
+                xd = f"blocks[{b.name!r}].deriv(t, [{', '.join(u)}], {x})"
+            derivs.append(f"xd[{b._xslice.start}:{b._xslice.stop}] = {xd}")
+
+    outputs = []
+    for b in evallist:
+        y = ", ".join([signals[b, port] for port in range(b.nout)])
+        outputs.append(f"        {b.name!r}: [{y}],\n")
+    outputs = "".join(outputs)
+
+    def indent(lines):
+        return "\n".join(["    " + line for line in lines])
+
+    x0 = const(bd.getstate0())
+    source = f'''"""
+Block diagram {bd.name!r}
+
+Generated by bdsim.  ``f(t, x)`` returns the derivative of the continuous
+state and ``outputs(t, x)`` the outputs of all blocks.
+"""
+
+import numpy as np
+
+# constants
+{chr(10).join(constants)}
+
+nstates = {bd.nstates}
+x0 = {x0}
+
+# blocks without a code template: {", ".join(sorted(fallback)) or "none"}
+blocks = {{}}
+
+
+def f(t, x):
+{indent(body)}
+
+    xd = np.empty(({bd.nstates},))
+{indent(derivs)}
+    return xd
+
+
+def outputs(t, x):
+{indent(body)}
+
+    return {{
+{outputs}    }}
+'''
+    return source
+
+
+def load(source, blocks=None):
+    """
+    Create a module from generated source code
+
+    :param source: source code created by :func:`codegen`
+    :type source: str
+    :param blocks: the diagram's blocks, used by the blocks without a code
+        template, defaults to None
+    :type blocks: list of Block, optional
+    :return: module
+    :rtype: module
+    """
+    module = types.ModuleType("bdsim_codegen")
+    exec(compile(source, "<bdsim codegen>", "exec"), module.__dict__)
+    module.source = source
+    if blocks is not None:
+        module.blocks.update({b.name: b for b in blocks})
+    return module
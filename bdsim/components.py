@@ -842,21 +842,28 @@ class Clock:
         s += f", clocking {len(self.blocklist)} blocks"
         return s
 
+    @property
+    def ndstates(self):
+        return sum([b.ndstates for b in self.blocklist])
+
     def getstate0(self):
         # get the state from each stateful block on this clock
-        x0 = np.array([])
+        x0 = np.zeros((self.ndstates,))
+        i = 0
         for b in self.blocklist:
-            x0 = np.r_[x0, b.getstate0()]
-            # print('x0', x0)
+            x0[i : i + b.ndstates] = b.getstate0()
+            i += b.ndstates
         return x0
 
     def getstate(self, t):
 
-        x = np.array([])
+        x = np.zeros((self.ndstates,))
+        i = 0
         for b in self.blocklist:
             # update dstate
             xb = b.next(t, b.inputs, b._x)
-            x = np.r_[x, xb.flatten()]
+            x[i : i + b.ndstates] = np.ravel(xb)
+            i += b.ndstates
 
         return x
 
@@ -880,9 +887,11 @@ class Clock:
         return i * self.T + self.offset
 
     def savestate(self, t):
-        # save clock state at time t
+        # compute the clock state at time t, save it and return it
+        x = self.getstate(t)
         self.t.append(t)
-        self.x.append(self.getstate(t))
+        self.x.append(x)
+        return x
 
 
 # ------------------------------------------------------------------------- #
@@ -892,6 +901,7 @@ class Block:
 
     varinputs = False
     varoutputs = False
+    expensive = False  # see BlockDiagram.workers
 
     __array_ufunc__ = None  # allow block operators with NumPy values
 
@@ -919,6 +929,7 @@ class Block:
         block.ndstates = 0
         block._sequence = None
         block._x = None  # state vector
+        block._diagram = None  # the compiled diagram that evaluates the block
 
         return block
 
@@ -1039,8 +1050,23 @@ class Block:
         self.__dict__["_parameters"][param] = handler
 
     def set_param(self, name, newvalue):
+        """
+        Set a block parameter
+
+        :param name: name of the parameter, as given to :meth:`add_param`
+        :type name: str
+        :param newvalue: new value of the parameter
+        :type newvalue: any
+
+        The parameter is changed by its handler, and the compiled data of the
+        block diagram that depends on the block's parameters is discarded, see
+        :meth:`BlockDiagram.invalidate`.  The diagram need not be compiled
+        again.
+        """
         print(f"setting parameter {name} of block {self.name} to {newvalue}")
         self._parameters[name](self, name, newvalue)
+        if self._diagram is not None:
+            self._diagram.invalidate(self)
 
     @property
     def info(self):
@@ -1957,6 +1983,10 @@ class SinkBlock(Block):
     A SinkBlock is a subclass of Block that represents a block that has inputs
     but no outputs. Typically used to save data to a variable, file or
     graphics.
+
+    A block that writes to a device can also define a coroutine
+    ``astep(t, inports)``, which :meth:`BDRealTime.arun` awaits instead of
+    calling ``step``, concurrently with the other I/O blocks.
     """
 
     blockclass = "sink"
@@ -1985,6 +2015,14 @@ class SourceBlock(Block):
     """
     A SourceBlock is a subclass of Block that represents a block that has outputs
     but no inputs.  Its output is a function of parameters and time.
+
+    If the output is a function of parameters only, ie. it is constant, the
+    block can set the attribute ``pure`` to True so that its output is
+    evaluated only once, see :attr:`BlockDiagram.fold`.
+
+    A block that reads from a device can also define a coroutine
+    ``aoutput(t, inports, x)``, which :meth:`BDRealTime.arun` awaits instead
+    of calling ``output``, concurrently with the other I/O blocks.
     """
 
     blockclass = "source"
@@ -2011,6 +2049,37 @@ class TransferBlock(Block):
     A TransferBlock is a subclass of Block that represents a block with inputs
     outputs and states. Typically used to describe a continuous time dynamic
     system, either linear or nonlinear.
+
+    A subclass may also define a method::
+
+        deriv_into(t, u, x, xd)
+
+    which writes the state derivative into the 1D array ``xd``, rather than
+    returning it like ``deriv``.  If present, it is used when evaluating the
+    block diagram and writes straight into the diagram's derivative buffer.
+
+    A subclass may also define a method::
+
+        jacobian(t, u, x) -> (A, B, C)
+
+    which returns the partial derivatives of the block's state derivative and
+    outputs at the given inputs and state:
+
+    - ``A`` is :math:`\\partial \\dot{x} / \\partial x`, an (n,n) array
+    - ``B`` is a list with one element per input port, :math:`\\partial \\dot{x} /
+      \\partial u_i`, an (n,m_i) array where :math:`m_i` is the number of
+      elements in the input
+    - ``C`` is a list with one element per output port, :math:`\\partial y_j /
+      \\partial x`, an (p_j,n) array where :math:`p_j` is the number of
+      elements in the output
+
+    If every transfer and function block in the diagram defines this method
+    the Jacobian of the whole diagram is available to implicit integrators,
+    see :meth:`BlockDiagram.jacobian`.
+
+    If the partial derivatives are constant, ie. the block is linear and time
+    invariant, the block can also set the attribute ``linear`` to True so that
+    it can be fused with other linear blocks, see :attr:`BlockDiagram.fuse`.
     """
 
     blockclass = "transfer"
@@ -2053,6 +2122,24 @@ class FunctionBlock(Block):
     A FunctionBlock is a subclass of Block that represents a block that has inputs
     and outputs but no state variables.  Typically used to describe operations
     such as gain, summation or various mappings.
+
+    A subclass may also define a method::
+
+        jacobian(t, u, x) -> D
+
+    which returns the partial derivatives of the block's outputs at the given
+    inputs.  ``D`` is a list with one element per output port, each a list
+    with one element per input port, where ``D[j][i]`` is :math:`\\partial y_j /
+    \\partial u_i`, a (p_j,m_i) array where :math:`p_j` and :math:`m_i` are the
+    number of elements in the output and input respectively.  As for a
+    transfer block, the attribute ``linear`` indicates that these are constant.
+
+    If the outputs are a function of the inputs and parameters only, and not of
+    time or any history, the block can set the attribute ``pure`` to True so
+    that it is evaluated only once if all its inputs are constant, see
+    :attr:`BlockDiagram.fold`.
+
+    :seealso: :class:`TransferBlock`
     """
 
     blockclass = "function"
@@ -2146,7 +2233,17 @@ class ClockedBlock(Block):
 
 
 class EventSource:
-    pass
+    """
+    An EventSource is a mixin class for blocks that declare simulation events,
+    typically at discontinuities in their output.
+
+    Events are generated lazily: the block's ``start`` method declares its
+    first event, and its ``next_event`` method is invoked each time one of its
+    events is popped from the event queue, to declare the following event.
+    """
+
+    def next_event(self, simstate):
+        pass
 
 
 # c = Clock(5)
@@ -0,0 +1,442 @@
+"""
+Linear block fusion
+
+Diagrams often contain connected groups of linear time-invariant blocks, for
+example the chains of ``SUM`` and ``GAIN`` blocks created by operator
+overloading, and the ``LTI_SISO`` blocks they connect.  The state derivatives
+and outputs of such a group are linear functions of its states and of the
+signals that enter it from other blocks, ie.
+
+.. math::
+
+    \\dot{x} &= A x + B u
+
+    y &= C x + D u
+
+where :math:`y` comprises the outputs of all blocks in the group.  When
+:attr:`BlockDiagram.fuse` is True, the evaluation kernel replaces each group
+with a single :class:`LinearGroup` that computes these with one matrix
+multiplication each, rather than calling every block.  The outputs of the
+blocks in the group are still set, so watched ports, sinks and other blocks
+see the same signals.
+
+A block can be fused if it has a ``linear`` attribute that is True, and a
+``jacobian`` method that returns its partial derivatives for its current
+input values, see :class:`TransferBlock`.  The matrices are computed from the
+Jacobians of the blocks, and the signal shapes are those of the most recent
+evaluation of the diagram.
+
+A group is not fused if some block outside the group is driven, through
+function blocks, by the group and also drives it, since the group could not
+then be evaluated in one step.
+"""
+
+import heapq
+
+import numpy as np
+
+
+class LinearGroup:
+    """
+    Fused group of linear blocks
+
+    Stands in for the blocks of the group in the evaluation kernel.  Its
+    :meth:`output` method is given the signals that drive the function blocks
+    of the group, and sets the outputs of all the blocks.  Its
+    :meth:`deriv_into` method is given those signals and the signals that
+    drive the transfer blocks of the group, and writes the derivatives of
+    their states.  It is given the whole continuous state vector of the
+    diagram.
+    """
+
+    type = "linear group"
+    blockclass = "function"
+    nstates = 0
+
+    def __init__(self, blocks, name):
+        """
+        :param blocks: blocks in the group, in plan order
+        :type blocks: list of Block
+        :param name: name of the group
+        :type name: str
+        """
+        self.blocks = blocks
+        self.name = name
+        self._x = None
+        self.output_values = []
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return f"{self.name}: " + ", ".join([str(b) for b in self.blocks])
+
+    @property
+    def nin(self):
+        return len(self.sources)
+
+    @property
+    def inputs(self):
+        return [plug.block.output_values[plug.port] for plug in self.sources]
+
+    def update(self):
+        """
+        Recompute the matrices of the group
+
+        :return: False if the signal shapes of the group have changed
+        :rtype: bool
+
+        The matrices are recomputed from the Jacobians of the blocks, after
+        their parameters have changed, see :meth:`BlockDiagram.invalidate`.
+        """
+        try:
+            fused = _linear_group(self.blocks, self.name)
+        except ValueError:
+            # the Jacobians do not match the signal shapes
+            return False
+        if fused.sources != self.sources or [
+            ports for b, ports in fused._outputs
+        ] != [ports for b, ports in self._outputs]:
+            return False
+        for name in ("A", "B", "C", "D"):
+            if getattr(fused, name).shape != getattr(self, name).shape:
+                return False
+        self.A, self.B, self.C, self.D = fused.A, fused.B, fused.C, fused.D
+        return True
+
+    def _input(self, u, size):
+        # the input signals as one vector, the signal shapes must not have
+        # changed since the group was fused
+        try:
+            if self._scalar:
+                U = np.array(u, dtype=float)
+            else:
+                U = np.concatenate([np.ravel(ui) for ui in u])
+        except ValueError:
+            U = None
+        if U is None or U.shape != (size,):
+            raise ValueError(
+                f"{self.name}: input signal shapes have changed since the blocks"
+                " were fused"
+            )
+        return U
+
+    def output(self, t, u, x):
+        if self._nout_inputs > 0:
+            Y = self.D @ self._input(u, self.D.shape[1])
+            if x is not None:
+                Y += self.C @ x[self._xindex]
+        else:
+            Y = self.C @ x[self._xindex]
+
+        if self._blockslices is not None:
+            # all outputs are scalars, taken from a list which is faster than
+            # indexing the array
+            out = Y.tolist()
+            for b, blockslice in self._blockslices:
+                b.output_values = out[blockslice]
+        else:
+            out = []
+            for b, ports in self._outputs:
+                values = [
+                    Y[start] if shape is None else Y[start:end].reshape(shape)
+                    for start, end, shape in ports
+                ]
+                b.output_values = values
+                out.extend(values)
+
+        # the member states are views into the diagram's state buffer
+        for b, xview in self._xviews:
+            if b._x is not xview:
+                b._x = xview
+        return out
+
+    def deriv_into(self, t, u, x, xd):
+        if len(u) > 0:
+            xd[self._xindex] = self.A @ x[self._xindex] + self.B @ self._input(
+                u, self.B.shape[1]
+            )
+        else:
+            xd[self._xindex] = self.A @ x[self._xindex]
+
+
+def _signal_size(value):
+    # number of elements in a numeric signal, or None
+    if isinstance(value, (bool, int, float, np.number)):
+        return 1
+    elif isinstance(value, np.ndarray) and value.dtype.kind in "biuf":
+        return value.size
+    return None
+
+
+def _fusible(b):
+    # True if the block can be fused at its current signal values
+    if not getattr(b, "linear", False) or not hasattr(b, "jacobian"):
+        return False
+    if b.blockclass not in ("transfer", "function"):
+        return False
+    values = getattr(b, "output_values", None)
+    if values is None or len(values) != b.nout:
+        return False
+    if any([_signal_size(v) is None for v in values]):
+        return False
+    if any([_signal_size(v) is None for v in b.inputs]):
+        return False
+    x = b._x if b.blockclass == "transfer" else None
+    return b.jacobian(0.0, b.inputs, x) is not None
+
+
+def _groups(evallist):
+    # connected groups of fusible blocks, each in plan order
+    fusible = [b for b, *_ in evallist if _fusible(b)]
+    parent = {b: b for b in fusible}
+
+    def find(b):
+        while parent[b] is not b:
+            parent[b] = parent[parent[b]]
+            b = parent[b]
+        return b
+
+    for b in fusible:
+        for plug in b.sources:
+            if plug.block in parent:
+                parent[find(plug.block)] = find(b)
+
+    groups = {}
+    for b in fusible:
+        groups.setdefault(find(b), []).append(b)
+    return [group for group in groups.values() if len(group) > 1]
+
+
+def _evaluation_sources(b):
+    # the plugs whose values must be known before the block's output is
+    # computed, blocks in the first plan group are given no inputs
+    if isinstance(b, LinearGroup):
+        return b.sources[: b._nout_inputs]
+    elif b.blockclass in ("source", "transfer", "clocked"):
+        return []
+    return b.sources
+
+
+def _linear_group(group, name):
+    # create the fused block and its matrices
+    members = set(group)
+    transfers = [b for b in group if b.blockclass == "transfer"]
+
+    # the states of the group
+    xindex = np.array(
+        [i for b in transfers for i in range(b._xslice.start, b._xslice.stop)],
+        dtype=int,
+    )
+    nx = len(xindex)
+    if nx > 0 and (xindex == np.arange(xindex[0], xindex[0] + nx)).all():
+        # contiguous, index by a slice which gives a view
+        xindex = slice(xindex[0], xindex[0] + nx)
+    xoffset = {}
+    i = 0
+    for b in transfers:
+        xoffset[b] = i
+        i += b.nstates
+
+    # the signals that enter the group, those that drive function blocks are
+    # needed to compute the outputs, all are needed for the derivative
+    inputs = []  # plugs
+    index = {}  # (block, port) to (offset, size)
+    m = 0
+
+    def external(plug):
+        nonlocal m
+        key = (plug.block, plug.port)
+        if key not in index:
+            size = _signal_size(plug.block.output_values[plug.port])
+            index[key] = (m, size)
+            inputs.append(plug)
+            m += size
+        return index[key]
+
+    for b in group:
+        if b.blockclass == "function":
+            for plug in b.sources:
+                if plug.block not in members:
+                    external(plug)
+    nout = m  # the inputs needed for the outputs come first
+    for b in transfers:
+        for plug in b.sources:
+            if plug.block not in members:
+                external(plug)
+
+    def signal(plug):
+        # the signal as (dy/dx, dy/du)
+        if plug.block in members:
+            return rep[plug.block, plug.port]
+        offset, size = index[plug.block, plug.port]
+        E = np.zeros((size, m))
+        E[:, offset : offset + size] = np.eye(size)
+        return np.zeros((size, nx)), E
+
+    rep = {}  # (block, port) to (dy/dx, dy/du)
+    derivs = {}
+    for b in group:
+        if b.blockclass == "transfer":
+            A, B, C = b.jacobian(0.0, b.inputs, b._x)
+            i, n = xoffset[b], b.nstates
+            for port, Cj in enumerate(C):
+                Cj = np.atleast_2d(Cj)
+                Cs = np.zeros((Cj.shape[0], nx))
+                Cs[:, i : i + n] = Cj
+                rep[b, port] = (Cs, np.zeros((Cj.shape[0], m)))
+            derivs[b] = (A, B)
+        else:
+            D = b.jacobian(0.0, b.inputs, None)
+            for port, Dj in enumerate(D):
+                Cs, Ds = 0, 0
+                for Di, plug in zip(Dj, b.sources):
+                    Di = np.atleast_2d(Di)
+                    Ci, Ei = signal(plug)
+                    Cs = Cs + Di @ Ci
+                    Ds = Ds + Di @ Ei
+                rep[b, port] = (Cs, Ds)
+
+    fused = LinearGroup(group, name)
+    fused._xindex = xindex
+    fused._xviews = []
+
+    # derivative
+    fused.A = np.zeros((nx, nx))
+    fused.B = np.zeros((nx, m))
+    for b in transfers:
+        A, B = derivs[b]
+        i, n = xoffset[b], b.nstates
+        fused.A[i : i + n, i : i + n] += A
+        for Bi, plug in zip(B, b.sources):
+            Bi = np.atleast_2d(Bi)
+            Ci, Ei = signal(plug)
+            fused.A[i : i + n, :] += Bi @ Ci
+            fused.B[i : i + n, :] += Bi @ Ei
+
+    # outputs, these depend only on the inputs of the function blocks
+    C, D = [], []
+    fused._outputs = []
+    start = 0
+    for b in group:
+        ports = []
+        for port in range(b.nout):
+            Cs, Ds = rep[b, port]
+            C.append(Cs)
+            D.append(Ds[:, :nout])
+            shape = np.shape(b.output_values[port])
+            if shape == ():
+                shape = None
+            ports.append((start, start + Cs.shape[0], shape))
+            start += Cs.shape[0]
+        fused._outputs.append((b, ports))
+    if all([shape is None for b, ports in fused._outputs for *_, shape in ports]):
+        fused._blockslices = []
+        start = 0
+        for b in group:
+            fused._blockslices.append((b, slice(start, start + b.nout)))
+            start += b.nout
+    else:
+        fused._blockslices = None
+    fused.C = np.vstack(C)
+    fused.D = np.vstack(D)
+    fused.nout = sum([b.nout for b in group])
+
+    # all the inputs, those for the outputs first
+    fused.sources = inputs
+    fused._scalar = all([np.ndim(p.block.output_values[p.port]) == 0 for p in inputs])
+    fused._nout_inputs = len([p for p in inputs if index[p.block, p.port][0] < nout])
+    return fused
+
+
+def _order(evallist, owner):
+    # evaluation order of the kernel entries, where owner maps the blocks of
+    # fused groups to their group, or None if there is a cycle
+    def unit(b):
+        return owner.get(b, b)
+
+    units = []
+    position = {}
+    for k, (b, *_) in enumerate(evallist):
+        u = unit(b)
+        if u not in position:
+            position[u] = k
+            units.append(u)
+
+    deps = {}
+    for u in units:
+        plugs = _evaluation_sources(u)
+        deps[u] = {unit(p.block) for p in plugs if unit(p.block) in position} - {u}
+
+    users = {u: [] for u in units}
+    for u in units:
+        for d in deps[u]:
+            users[d].append(u)
+
+    count = {u: len(deps[u]) for u in units}
+    ready = [(position[u], id(u), u) for u in units if count[u] == 0]
+    heapq.heapify(ready)
+    order = []
+    while ready:
+        _, _, u = heapq.heappop(ready)
+        order.append(u)
+        for v in users[u]:
+            count[v] -= 1
+            if count[v] == 0:
+                heapq.heappush(ready, (position[v], id(v), v))
+    if len(order) < len(units):
+        return None
+    return order
+
+
+def fuse(bd, kernel):
+    """
+    Fuse groups of linear blocks in an evaluation kernel
+
+    :param bd: block diagram
+    :type bd: BlockDiagram
+    :param kernel: evaluation kernel for the ``"plan"`` engine
+    :type kernel: BDStruct
+    :return: the fused groups
+    :rtype: list of LinearGroup
+
+    The ``evallist`` and ``transfers`` of the kernel are modified in place.
+
+    :seealso: :meth:`BlockDiagram.schedule_compile`
+    """
+    evallist = kernel.evallist
+    fusedlist = []
+    # block to the fused or parallel group it belongs to
+    owner = {b: group for group in kernel.parallel for b in group.blocks}
+    for group in _groups(evallist):
+        fused = _linear_group(group, f"linear.{len(fusedlist)}")
+        members = set(group)
+        order = _order(evallist, {**owner, **{b: fused for b in group}})
+        if order is None:
+            continue
+        for b in group:
+            owner[b] = fused
+
+        fused._xviews = [
+            (b, xview) for b, xview, *_ in kernel.transfers if b in members
+        ]
+        entries = {entry[0]: entry for entry in evallist}
+        sources = tuple((p.block, p.port) for p in _evaluation_sources(fused))
+        evallist[:] = [
+            (fused, sources, None) if u is fused else entries[u] for u in order
+        ]
+        kernel.transfers[:] = [
+            entry for entry in kernel.transfers if entry[0] not in members
+        ]
+        if len(fused._xviews) > 0:
+            kernel.transfers.append(
+                (
+                    fused,
+                    kernel.xbuf,
+                    kernel.xdbuf,
+                    tuple((p.block, p.port) for p in fused.sources),
+                    True,
+                )
+            )
+        fusedlist.append(fused)
+    return fusedlist
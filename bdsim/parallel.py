@@ -0,0 +1,178 @@
+"""
+Parallel evaluation of plan groups
+
+The blocks in a group of the execution plan do not depend on each other, see
+:meth:`BlockDiagram.schedule_generate`, so they can be evaluated at the same
+time.  This is worthwhile only for blocks that take a long time to evaluate
+and that release the Python global interpreter lock while doing so, for
+example NumPy linear algebra on large matrices, image processing or a
+``FUNCTION`` block that calls native code.  A block declares this by setting
+its ``expensive`` attribute to True, for example::
+
+    f = bd.FUNCTION(detect)
+    f.expensive = True
+
+When :attr:`BlockDiagram.workers` is set, the evaluation kernel replaces the
+expensive blocks of each plan group, if there are at least two, with a single
+:class:`ParallelGroup`.  This times its blocks over the first few evaluations,
+and then evaluates those that take longer than :attr:`ParallelGroup.mincost`
+on a thread pool, and the others inline, since dispatching a block to a thread
+costs tens of microseconds.
+"""
+
+import time
+
+
+class ParallelGroup:
+    """
+    Expensive blocks of a plan group
+
+    Stands in for the blocks in the evaluation kernel.  Its :meth:`output`
+    method gathers the inputs of every block, evaluates them, and sets their
+    outputs.
+    """
+
+    type = "parallel group"
+    blockclass = "function"
+    nstates = 0
+
+    mincost = 200e-6  # seconds, cheaper blocks are evaluated inline
+    ncalibrate = 3  # number of evaluations that are timed
+
+    def __init__(self, entries, pool, name):
+        """
+        :param entries: kernel entries ``(block, sources, outslice)`` of the
+            blocks, in plan order
+        :type entries: list of tuple
+        :param pool: thread pool
+        :type pool: concurrent.futures.ThreadPoolExecutor
+        :param name: name of the group
+        :type name: str
+        """
+        self.blocks = [b for b, *_ in entries]
+        self.name = name
+        self.pool = pool
+        self._x = None
+        self.output_values = []
+        self.nout = sum([b.nout for b in self.blocks])
+        self.sources = [
+            plug for b, srcs, _ in entries if srcs is not None for plug in b.sources
+        ]
+
+        self._members = [(b, srcs) for b, srcs, _ in entries]
+        self._cost = [float("inf")] * len(self._members)
+        self._ncalls = 0
+        self._inline = self._members
+        self._pooled = []
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return f"{self.name}: " + ", ".join([str(b) for b in self.blocks])
+
+    @property
+    def nin(self):
+        return len(self.sources)
+
+    @property
+    def inputs(self):
+        return [plug.block.output_values[plug.port] for plug in self.sources]
+
+    @staticmethod
+    def _evaluate(b, srcs, t):
+        if srcs is None:
+            out = b.output(t, None, b._x)
+        else:
+            out = b.output(t, [s.output_values[p] for s, p in srcs], b._x)
+        if not isinstance(out, (tuple, list)) or len(out) != b.nout:
+            raise AssertionError(
+                f"block {b} output must be a list of length {b.nout}: {out}"
+            )
+        b.output_values = out
+        return out
+
+    def _calibrate(self, t):
+        # evaluate the blocks inline and time them, after the last timed
+        # evaluation split them by cost
+        for i, (b, srcs) in enumerate(self._members):
+            t0 = time.perf_counter()
+            self._evaluate(b, srcs, t)
+            self._cost[i] = min(self._cost[i], time.perf_counter() - t0)
+        self._ncalls += 1
+        if self._ncalls == self.ncalibrate:
+            pooled = [
+                member
+                for member, cost in zip(self._members, self._cost)
+                if cost >= self.mincost
+            ]
+            if len(pooled) > 1:
+                self._pooled = pooled
+                self._inline = [m for m in self._members if m not in pooled]
+
+    def output(self, t, u, x):
+        if self._ncalls < self.ncalibrate:
+            self._calibrate(t)
+        elif len(self._pooled) > 0:
+            # the calling thread evaluates the cheap blocks, and the last of
+            # the expensive blocks rather than wait idle
+            *pooled, last = self._pooled
+            futures = [self.pool.submit(self._evaluate, b, s, t) for b, s in pooled]
+            for b, srcs in self._inline:
+                self._evaluate(b, srcs, t)
+            self._evaluate(*last, t)
+            for future in futures:
+                future.result()
+        else:
+            for b, srcs in self._inline:
+                self._evaluate(b, srcs, t)
+
+        out = []
+        for b in self.blocks:
+            out.extend(b.output_values)
+        return out
+
+
+def parallelize(bd, kernel, pool):
+    """
+    Group the expensive blocks of each plan group in an evaluation kernel
+
+    :param bd: block diagram
+    :type bd: BlockDiagram
+    :param kernel: evaluation kernel for the ``"plan"`` engine
+    :type kernel: BDStruct
+    :param pool: thread pool
+    :type pool: concurrent.futures.ThreadPoolExecutor
+    :return: the parallel groups
+    :rtype: list of ParallelGroup
+
+    The ``evallist`` of the kernel is modified in place.  Each group takes the
+    place of its first block, which is safe since the blocks of a plan group
+    depend only on blocks of earlier plan groups.
+
+    :seealso: :meth:`BlockDiagram.schedule_compile`
+    """
+    bysequence = {}
+    for entry in kernel.evallist:
+        b = entry[0]
+        if getattr(b, "expensive", False):
+            bysequence.setdefault(b._sequence, []).append(entry)
+
+    groups = {}  # first block of each group to the group
+    members = set()
+    for entries in bysequence.values():
+        if len(entries) < 2:
+            continue
+        group = ParallelGroup(entries, pool, f"parallel.{len(groups)}")
+        groups[group.blocks[0]] = group
+        members.update(group.blocks)
+
+    evallist = []
+    for entry in kernel.evallist:
+        b = entry[0]
+        if b in groups:
+            evallist.append((groups[b], None, None))
+        elif b not in members:
+            evallist.append(entry)
+    kernel.evallist[:] = evallist
+    return list(groups.values())
@@ -0,0 +1,500 @@
+"""
+Recording of simulation results
+
+A :class:`Recorder` collects the time, continuous state, clocked state and
+watched signals of a simulation run into growable NumPy buffers, one per
+channel, and returns them in a :class:`~bdsim.components.BDStruct`.
+
+A :class:`StreamRecorder` writes the channels to a directory of ``.npy`` files
+as the simulation runs, and :func:`load` returns them as memory-mapped arrays.
+"""
+
+import os
+import json
+import struct
+
+import numpy as np
+
+from bdsim.components import BDStruct
+
+
+class Channel:
+    """
+    Growable array for one recorded signal
+
+    Values are appended into a contiguous NumPy buffer which grows by at least
+    ``chunksize`` elements, and geometrically, when it is full so that appending
+    is O(1) amortized.  The recorded values are available as a view of the
+    buffer.
+
+    For example::
+
+        >>> c = Channel(dtype=np.float32)
+        >>> c.append([1, 2])
+        >>> c.append([3, 4])
+        >>> c.data
+        array([[1., 2.],
+               [3., 4.]], dtype=float32)
+    """
+
+    def __init__(self, dtype=None, chunksize=1024):
+        """
+        :param dtype: type for numeric values, defaults to float64
+        :type dtype: numpy.dtype or str, optional
+        :param chunksize: minimum number of elements to grow the buffer by,
+            defaults to 1024
+        :type chunksize: int, optional
+
+        The shape of each element is given by the first value appended.  Values
+        that are not numeric, for example an ``SE3`` instance, are stored in
+        an array of Python objects.
+        """
+        self.dtype = dtype
+        self.chunksize = chunksize
+        self._buf = None
+        self._n = 0
+
+    def __len__(self):
+        """
+        Number of recorded values
+
+        :return: number of values appended to the channel
+        :rtype: int
+        """
+        return self._n
+
+    def _allocate(self, value):
+        # choose the buffer type and shape from the first value
+        a = np.asarray(value)
+        if a.dtype.kind in "biuf":
+            dtype = self.dtype or np.float64
+            shape = a.shape
+        elif a.dtype.kind == "c":
+            dtype = a.dtype
+            shape = a.shape
+        else:
+            dtype = object
+            shape = ()
+        return np.empty((self.chunksize,) + shape, dtype=dtype)
+
+    def append(self, value):
+        """
+        Append a value to the channel
+
+        :param value: value to record
+        :type value: any
+        """
+        buf = self._buf
+        if buf is None:
+            buf = self._buf = self._allocate(value)
+        elif self._n == buf.shape[0]:
+            buf = self._buf = self._grow(buf)
+        buf[self._n] = value
+        self._n += 1
+
+    def _grow(self, buf):
+        n = buf.shape[0]
+        newbuf = np.empty((n + max(n, self.chunksize),) + buf.shape[1:], buf.dtype)
+        newbuf[:n] = buf
+        return newbuf
+
+    @property
+    def data(self):
+        """
+        Recorded values
+
+        :return: recorded values, one per row
+        :rtype: ndarray
+
+        The result is a view of the channel's buffer, not a copy.  If nothing
+        has been recorded the result has shape (0,).
+        """
+        if self._buf is None:
+            return np.zeros((0,), dtype=self.dtype or np.float64)
+        return self._buf[: self._n]
+
+    def close(self):
+        """
+        Release unused buffer space
+
+        The buffer is shrunk in place to the number of recorded values, unless
+        there are references to it, for example a view returned by
+        :attr:`data`.
+        """
+        if self._buf is not None and self._buf.shape[0] > self._n:
+            try:
+                self._buf.resize((self._n,) + self._buf.shape[1:])
+            except ValueError:
+                pass  # buffer is referenced, leave it as is
+
+
+class Recorder:
+    """
+    Record the results of a simulation run
+
+    The recorder has a :class:`Channel` for time, the continuous state vector,
+    each watched signal, and the time and state of each clock.
+
+    The time channel is always float64.  The type of the state and numeric
+    watched signal channels is given by ``dtype``, for example::
+
+        out = sim.run(bd, recorder=Recorder(dtype=np.float32))
+
+    :seealso: :meth:`BDSim.run`
+    """
+
+    def __init__(self, dtype=None, chunksize=1024):
+        """
+        :param dtype: type for recorded states and numeric signals, defaults to
+            float64
+        :type dtype: numpy.dtype or str, optional
+        :param chunksize: minimum number of elements to grow a channel buffer
+            by, defaults to 1024
+        :type chunksize: int, optional
+        """
+        self.dtype = dtype
+        self.chunksize = chunksize
+
+    def __len__(self):
+        """
+        Number of recorded time steps
+
+        :return: number of time steps recorded
+        :rtype: int
+        """
+        return len(self.t)
+
+    def channel(self, name, dtype=None):
+        """
+        Create a recording channel
+
+        :param name: name of the channel
+        :type name: str
+        :param dtype: type for numeric values, defaults to the recorder's type
+        :type dtype: numpy.dtype or str, optional
+        :return: recording channel
+        :rtype: Channel
+        """
+        return Channel(dtype=dtype or self.dtype, chunksize=self.chunksize)
+
+    def start(self, bd, watchlist=[]):
+        """
+        Prepare to record a simulation run
+
+        :param bd: the block diagram being simulated
+        :type bd: BlockDiagram
+        :param watchlist: the input ports being watched
+        :type watchlist: list of Plug
+
+        Creates empty channels, discarding the results of a previous run.
+        """
+        self.xnames = list(bd.statenames)
+        self.ynames = [str(plug) for plug in watchlist]
+        self.t = self.channel("t", dtype=np.float64)
+        if bd.nstates > 0:
+            self.x = self.channel("x")
+        else:
+            self.x = None
+        self.y = [self.channel("y" + str(i)) for i in range(len(watchlist))]
+        self.clocks = {
+            clock: (
+                self.channel(clock.name + ".t", dtype=np.float64),
+                self.channel(clock.name + ".x"),
+            )
+            for clock in bd.clocklist
+        }
+
+    def record(self, t, x=None, y=[]):
+        """
+        Record a time step
+
+        :param t: simulation time
+        :type t: float
+        :param x: continuous state vector, defaults to None
+        :type x: ndarray, optional
+        :param y: values of watched signals
+        :type y: list
+        """
+        self.t.append(t)
+        if self.x is not None:
+            self.x.append(x)
+        for channel, value in zip(self.y, y):
+            channel.append(value)
+
+    def record_clock(self, clock, t, x):
+        """
+        Record a clock tick
+
+        :param clock: the clock that ticked
+        :type clock: Clock
+        :param t: simulation time
+        :type t: float
+        :param x: the clock's discrete state vector
+        :type x: ndarray
+        """
+        ct, cx = self.clocks[clock]
+        ct.append(t)
+        cx.append(x)
+
+    def channels(self):
+        # all channels, with their names in the results
+        channels = [("t", self.t)]
+        if self.x is not None:
+            channels.append(("x", self.x))
+        for clock, (ct, cx) in self.clocks.items():
+            name = clock.name.replace(".", "")
+            channels.append((name + ".t", ct))
+            channels.append((name + ".x", cx))
+        for i, channel in enumerate(self.y):
+            channels.append(("y" + str(i), channel))
+        return channels
+
+    def close(self):
+        """
+        Finish recording
+
+        Releases unused buffer space.
+        """
+        for name, channel in self.channels():
+            channel.close()
+
+    def results(self):
+        """
+        Recorded results
+
+        :return: recorded results
+        :rtype: BDStruct
+
+        The results have attributes:
+
+        - ``t`` the time vector: ndarray, shape=(M,)
+        - ``x`` the state vector: ndarray, shape=(M,N), or shape=(0,) if there
+          are no continuous states
+        - ``clockN`` a ``BDStruct`` with attributes ``t`` and ``x`` for each clock
+        - ``yN`` for each watched signal
+
+        The arrays are views of the channel buffers.
+        """
+        out = _results([(name, channel.data) for name, channel in self.channels()])
+        out.xnames = self.xnames
+        out.ynames = self.ynames
+        return out
+
+
+def _results(arrays):
+    # assemble named arrays into a results struct, names of the form
+    # "clockN.t" are placed in a clock sub-struct
+    out = BDStruct(name="results")
+    for name, data in arrays:
+        if "." in name:
+            # a clock channel
+            clockname, attr = name.split(".")
+            if not hasattr(out, clockname):
+                out.add(clockname, BDStruct(clockname))
+            out[clockname][attr] = data
+        else:
+            out[name] = data
+    if not hasattr(out, "x"):
+        out.x = np.array([])
+    return out
+
+
+class FileChannel(Channel):
+    """
+    Recorded signal streamed to a ``.npy`` file
+
+    Values are appended to an in-memory buffer of ``chunksize`` elements which
+    is written to the end of the file when it is full.  The file has a
+    fixed-length header which is rewritten with the number of values when the
+    channel is closed, so the file is a standard ``.npy`` file that can be
+    read with ``numpy.load``.
+
+    Values that are not numeric are kept in memory and pickled into the file
+    when the channel is closed.
+    """
+
+    HEADERLEN = 128  # length of the .npy header, bytes
+
+    def __init__(self, path, dtype=None, chunksize=1024):
+        """
+        :param path: name of the ``.npy`` file
+        :type path: str
+        :param dtype: type for numeric values, defaults to float64
+        :type dtype: numpy.dtype or str, optional
+        :param chunksize: number of values buffered before writing to the file,
+            defaults to 1024
+        :type chunksize: int, optional
+        """
+        super().__init__(dtype=dtype, chunksize=chunksize)
+        self.path = path
+        self._file = None
+        self._nfile = 0  # number of values written to the file
+
+    def __len__(self):
+        return self._nfile + self._n
+
+    def append(self, value):
+        buf = self._buf
+        if buf is not None and self._n == buf.shape[0] and buf.dtype != object:
+            self._flush()
+        super().append(value)
+
+    def _header(self):
+        # fixed length .npy version 1.0 header describing the file contents
+        buf = self._buf
+        header = repr(
+            {
+                "descr": np.lib.format.dtype_to_descr(buf.dtype),
+                "fortran_order": False,
+                "shape": (self._nfile,) + buf.shape[1:],
+            }
+        )
+        n = self.HEADERLEN - len(np.lib.format.magic(1, 0)) - 2
+        header = header.ljust(n - 1) + "\n"
+        assert len(header) == n, "header too long for " + self.path
+        return np.lib.format.magic(1, 0) + struct.pack("<H", n) + header.encode()
+
+    def _flush(self):
+        # write the buffered values to the end of the file
+        if self._file is None:
+            self._file = open(self.path, "wb")
+            self._file.write(self._header())
+        self._file.write(self._buf[: self._n].tobytes())
+        self._nfile += self._n
+        self._n = 0
+
+    @property
+    def data(self):
+        """
+        Recorded values
+
+        :return: recorded values, one per row
+        :rtype: ndarray
+
+        Once the channel is closed the result is a read-only memory-mapped
+        view of the file.  While recording, only the values not yet written
+        to the file are returned.
+        """
+        if self._file is not None or self._buf is None or self._buf.dtype == object:
+            # still recording, or not numeric, return the values in memory
+            return super().data
+        if self._nfile == 0:
+            # an empty file cannot be memory mapped
+            return np.load(self.path)
+        return np.load(self.path, mmap_mode="r")
+
+    def close(self):
+        """
+        Finish recording
+
+        Writes any buffered values and the final header to the file.
+        """
+        if self._buf is None or self._buf.dtype == object:
+            np.save(self.path, super().data, allow_pickle=True)
+            return
+        if self._file is None and self._nfile > 0:
+            return  # already closed
+        self._flush()
+        self._file.seek(0)
+        self._file.write(self._header())
+        self._file.close()
+        self._file = None
+        self._buf = self._buf[:0]
+
+
+class StreamRecorder(Recorder):
+    """
+    Stream the results of a simulation run to disk
+
+    Each channel is written to a ``.npy`` file in the directory ``path`` as the
+    simulation runs, so memory use does not grow with the length of the run.
+    The directory also contains an index file ``results.json``.
+
+    For example::
+
+        out = sim.run(bd, 1000, recorder=StreamRecorder("run1"))
+
+    and later, perhaps in another process::
+
+        out = load("run1")
+
+    In both cases the results are memory-mapped arrays with the same layout as
+    those returned by :class:`Recorder`.
+
+    :seealso: :func:`load`
+    """
+
+    def __init__(self, path, dtype=None, chunksize=4096):
+        """
+        :param path: directory to write the results to, created if it does not
+            exist
+        :type path: str
+        :param dtype: type for recorded states and numeric signals, defaults to
+            float64
+        :type dtype: numpy.dtype or str, optional
+        :param chunksize: number of values buffered per channel before writing
+            to disk, defaults to 4096
+        :type chunksize: int, optional
+        """
+        super().__init__(dtype=dtype, chunksize=chunksize)
+        self.path = path
+
+    def channel(self, name, dtype=None):
+        return FileChannel(
+            os.path.join(self.path, name + ".npy"),
+            dtype=dtype or self.dtype,
+            chunksize=self.chunksize,
+        )
+
+    def start(self, bd, watchlist=[]):
+        os.makedirs(self.path, exist_ok=True)
+        super().start(bd, watchlist)
+
+    def close(self):
+        """
+        Finish recording
+
+        Writes the buffered values of each channel and the index file.
+        """
+        index = {"channels": {}, "xnames": self.xnames, "ynames": self.ynames}
+        for name, channel in self.channels():
+            channel.close()
+            index["channels"][name] = os.path.basename(channel.path)
+        with open(os.path.join(self.path, "results.json"), "w") as f:
+            json.dump(index, f, indent=2)
+
+
+def load(path, mmap_mode="r"):
+    """
+    Load results streamed to disk
+
+    :param path: directory written by a :class:`StreamRecorder`
+    :type path: str
+    :param mmap_mode: memory-map mode passed to ``numpy.load``, defaults to "r"
+    :type mmap_mode: str, optional
+    :return: recorded results
+    :rtype: BDStruct
+
+    The results have the same attributes as those returned by
+    :meth:`BDSim.run`.  Numeric arrays are memory-mapped so only the parts
+    that are accessed are read from disk.
+
+    :seealso: :class:`StreamRecorder`
+    """
+    with open(os.path.join(path, "results.json")) as f:
+        index = json.load(f)
+
+    arrays = []
+    for name, file in index["channels"].items():
+        file = os.path.join(path, file)
+        try:
+            data = np.load(file, mmap_mode=mmap_mode)
+        except ValueError:
+            # empty or pickled arrays cannot be memory mapped
+            data = np.load(file, allow_pickle=True)
+        arrays.append((name, data))
+
+    out = _results(arrays)
+    out.xnames = index["xnames"]
+    out.ynames = index["ynames"]
+    return out
@@ -24,9 +24,11 @@ import math
 
 import threading
 import time
-import threading
+import asyncio
 
 from bdsim.run_sim import BDSim, TimeQ, blockname
+from bdsim.timing import Profiler
+from bdsim.telemetry import RingBuffer
 
 
 # class TimeQRT(TimeQ):
@@ -134,7 +136,10 @@ class BDRealTimeState:
         self.eventq = TimeQ()
 
     def declare_event(self, block, t):
-        self.eventq.push((t, block))
+        # only clock ticks are events in real time, there is no integrator to
+        # restart at a discontinuity
+        if isinstance(block, Clock):
+            self.eventq.push((t, block))
 
 
 class SimpleStats:
@@ -167,6 +172,243 @@ class SimpleStats:
         return self._max
 
 
+class Ticker:
+    """
+    Periodic timer with absolute deadlines
+
+    The deadline of sample ``k`` is ``k * dt`` after the timer is started, so
+    timing errors do not accumulate.  The timer sleeps until shortly before
+    the deadline, and then optionally busy-waits for the last ``spin`` seconds
+    to reduce the wakeup jitter of the operating system's sleep.  All times
+    are read from :func:`time.perf_counter_ns`.
+
+    If the deadline of the next sample has already passed when :meth:`wait` is
+    called, the sample has overrun, and the ``overrun`` policy is applied:
+
+    - ``"catchup"``, the next sample is started immediately, and following
+      samples are started immediately until the timer is back on schedule
+    - ``"skip"``, the samples whose deadlines have passed are skipped, and the
+      timer waits for the next deadline
+    - ``"abort"``, :meth:`wait` raises a ``RuntimeError``
+    """
+
+    policies = ("catchup", "skip", "abort")
+
+    def __init__(self, dt, spin=0.0, overrun="catchup"):
+        """
+        :param dt: sample interval in seconds
+        :type dt: float
+        :param spin: busy-wait interval before each deadline in seconds,
+            defaults to 0
+        :type spin: float, optional
+        :param overrun: overrun policy, defaults to "catchup"
+        :type overrun: str, optional
+        """
+        if overrun not in self.policies:
+            raise ValueError(f"unknown overrun policy {overrun}")
+        self.period = int(round(dt * 1e9))
+        self.spin = int(round(spin * 1e9))
+        self.overrun = overrun
+
+    def start(self):
+        """
+        Start the timer
+
+        The deadline of sample 0 is now.
+        """
+        self.t0 = time.perf_counter_ns()
+        self.k = 0
+        self.noverrun = 0  # number of samples that overran
+        self.nskipped = 0  # number of samples skipped
+        self.late = 0  # time the last sample started after its deadline, ns
+
+    def wait(self):
+        """
+        Wait for the deadline of the next sample
+
+        :raises RuntimeError: the sample overran and the policy is "abort"
+        :return: index of the next sample, and True if the previous sample
+            overran
+        :rtype: int, bool
+        """
+        k, deadline, now, overrun = self._next()
+        if not overrun or self.overrun == "skip":
+            self._sleep(now, deadline)
+        return self._started(k, deadline, overrun)
+
+    async def wait_async(self):
+        """
+        Wait for the deadline of the next sample in an event loop
+
+        :raises RuntimeError: the sample overran and the policy is "abort"
+        :return: index of the next sample, and True if the previous sample
+            overran
+        :rtype: int, bool
+
+        As :meth:`wait` but other tasks run while it sleeps.
+        """
+        k, deadline, now, overrun = self._next()
+        if not overrun or self.overrun == "skip":
+            wake = deadline - self.spin
+            if now < wake:
+                await asyncio.sleep((wake - now) * 1e-9)
+            while time.perf_counter_ns() < deadline:
+                pass
+        return self._started(k, deadline, overrun)
+
+    def _next(self):
+        # the next sample and its deadline, apply the overrun policy
+        k = self.k + 1
+        deadline = self.t0 + k * self.period
+        now = time.perf_counter_ns()
+        overrun = now > deadline
+        if overrun:
+            self.noverrun += 1
+            if self.overrun == "abort":
+                raise RuntimeError(
+                    f"real-time overrun of sample {self.k}, by"
+                    f" {(now - deadline) * 1e-6:.3f} ms"
+                )
+            elif self.overrun == "skip":
+                n = (now - deadline) // self.period + 1
+                self.nskipped += n
+                k += n
+                deadline += n * self.period
+        return k, deadline, now, overrun
+
+    def _started(self, k, deadline, overrun):
+        self.late = time.perf_counter_ns() - deadline
+        self.k = k
+        return k, overrun
+
+    def wait_until(self, t):
+        """
+        Wait until a time
+
+        :param t: time in seconds after the timer was started
+        :type t: float
+        :raises RuntimeError: the deadline has passed and the policy is "abort"
+        :return: True if the deadline has already passed
+        :rtype: bool
+
+        Used to wait for events which are not periodic, for example the
+        ticks of several clocks.  If the deadline has passed and the policy is
+        "skip", the caller should skip the event, it is counted in
+        ``nskipped``.
+        """
+        deadline = self.t0 + int(round(t * 1e9))
+        now = time.perf_counter_ns()
+        overrun = now > deadline
+        if overrun:
+            self.noverrun += 1
+            if self.overrun == "abort":
+                raise RuntimeError(
+                    f"real-time overrun at t={t:.6f}, by"
+                    f" {(now - deadline) * 1e-6:.3f} ms"
+                )
+            elif self.overrun == "skip":
+                self.nskipped += 1
+        else:
+            self._sleep(now, deadline)
+
+        self.late = time.perf_counter_ns() - deadline
+        return overrun
+
+    def _sleep(self, now, deadline):
+        # sleep until the spin interval before the deadline, then busy-wait
+        wake = deadline - self.spin
+        if now < wake:
+            time.sleep((wake - now) * 1e-9)
+        while time.perf_counter_ns() < deadline:
+            pass
+
+
+async def _gather(coros, timeout):
+    """
+    Run coroutines concurrently with a deadline
+
+    :param coros: coroutines
+    :type coros: list
+    :param timeout: time to wait in seconds, or None to wait until all finish
+    :type timeout: float
+    :return: the result of each coroutine, None if it did not finish in time,
+        and the number that did not finish
+    :rtype: list, int
+
+    The coroutines that do not finish in time are cancelled.
+    """
+    if len(coros) == 0:
+        return [], 0
+    tasks = [asyncio.ensure_future(coro) for coro in coros]
+    done, pending = await asyncio.wait(tasks, timeout=timeout)
+    for task in pending:
+        task.cancel()
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+    return [task.result() if task in done else None for task in tasks], len(pending)
+
+
+def _partitions(bd, kernel, clocks):
+    """
+    Blocks evaluated at a tick of some clocks
+
+    :param bd: block diagram
+    :type bd: BlockDiagram
+    :param kernel: evaluation kernel of the block diagram
+    :type kernel: BDStruct
+    :param clocks: the clocks that tick
+    :type clocks: list of Clock
+    :return: partitions of the kernel evaluated before and after the tick
+    :rtype: tuple, tuple
+
+    Before the tick the blocks that the inputs of the clocked blocks depend
+    on, through unclocked blocks, are evaluated so that the clocks can compute
+    their next state.  After the tick the clocked blocks, and the blocks that
+    depend on them through unclocked blocks, are evaluated.  The outputs of
+    all other blocks are held.  Blocks that depend on no clocked block, and
+    that no clocked block depends on, are evaluated after every tick.  Each
+    partition is a tuple ``(evallist, sinks)`` for
+    :meth:`BlockDiagram.schedule_evaluate`.
+    """
+
+    def cone(clocks, upstream):
+        # the blocks reached from the clocked blocks through unclocked blocks
+        blocks = set()
+        stack = []
+        for clock in clocks:
+            for b in clock.blocklist:
+                if upstream:
+                    stack.extend([p for p in b._parents if p is not None])
+                else:
+                    blocks.add(b)
+                    stack.extend(
+                        [w.end.block for wires in b.output_wires for w in wires]
+                    )
+        while stack:
+            b = stack.pop()
+            if b in blocks or b.blockclass == "clocked":
+                continue
+            blocks.add(b)
+            if upstream:
+                stack.extend([p for p in b._parents if p is not None])
+            else:
+                stack.extend([w.end.block for wires in b.output_wires for w in wires])
+        return blocks
+
+    def select(blocks):
+        def member(b):
+            return any([m in blocks for m in getattr(b, "blocks", [b])])
+
+        evallist = [entry for entry in kernel.evallist if member(entry[0])]
+        sinks = [entry for entry in kernel.sinks if entry[0] in blocks]
+        return evallist, sinks
+
+    # blocks that are not associated with any clock
+    free = set(bd.blocklist) - cone(bd.clocklist, True) - cone(bd.clocklist, False)
+
+    return select(cone(clocks, True)), select(cone(clocks, False) | free)
+
+
 class BDRealTime(BDSim):
     def run(
         self,
@@ -176,14 +418,18 @@ class BDRealTime(BDSim):
         block=None,
         checkfinite=True,
         watch=[],
-        samples=True,
+        samples=None,
+        spin=0.0,
+        overrun="catchup",
+        profile=False,
+        telemetry=None,
     ):
         """
         Run the block diagram
 
         :param T: maximum integration time, defaults to 10.0
         :type T: float, optional
-        :param dt: maximum time step
+        :param dt: sample interval, ignored if the diagram has clocks
         :type dt: float, optional
         :param solver: integration method, defaults to ``RK45``
         :type solver: str, optional
@@ -197,6 +443,21 @@ class BDRealTime(BDSim):
         :type watch: list
         :param solver_args: arguments passed to ``scipy.integrate``
         :type solver_args: dict
+        :param samples: show overrun of each sample after the run, defaults to
+            True unless ``telemetry`` is given
+        :type samples: bool
+        :param spin: busy-wait interval before each sample in seconds, defaults
+            to 0
+        :type spin: float
+        :param overrun: policy for a sample that overruns, one of "catchup",
+            "skip" or "abort", defaults to "catchup"
+        :type overrun: str
+        :param profile: record the execution time of every block, defaults to
+            False
+        :type profile: bool
+        :param telemetry: ring buffer to write the watched signals to, defaults
+            to None
+        :type telemetry: :class:`~bdsim.telemetry.RingBuffer`
         :return: time history of signals and states
         :rtype: Sim class
 
@@ -233,13 +494,316 @@ class BDRealTime(BDSim):
                 - 's' debug state vector
                 - 'd' debug state derivative
 
+        The diagram is evaluated at the sample times ``k * dt``, paced by a
+        :class:`Ticker` with absolute deadlines so that timing errors do not
+        accumulate.  The ``spin`` and ``overrun`` arguments are passed to it.
+        If ``samples`` is True, a string with one character per sample, "." if
+        the sample met its deadline and "x" if it overran, is printed after
+        the run, nothing is printed while running.
+
+        If the diagram has clocks, see :meth:`BlockDiagram.clock`, they set the
+        pace instead of ``dt``, and the diagram is evaluated at their ticks,
+        which are taken from an event queue as in the offline simulator.  At a
+        tick only the blocks that are due are evaluated: first the blocks that
+        the inputs of the clocked blocks of the ticking clocks depend on, then
+        the clocks compute their next state, then the clocked blocks and the
+        blocks that depend on them are evaluated.  The outputs of blocks on
+        other, slower, clocks are held.  Blocks that are not connected to any
+        clocked block are evaluated at every tick.  The results have an
+        attribute ``clockN`` for each clock, with attributes ``t`` and ``x``
+        which are the tick times and the clock's state after each tick, as
+        saved in the clock's ``t`` and ``x`` attributes by
+        :meth:`~bdsim.components.Clock.savestate`.
+
+        .. note:: The outputs of the clocked blocks change at the tick that
+            computes their new state, as in the offline simulator.  Earlier
+            versions of the real-time runner evaluated the diagram at a
+            tick, then advanced the clock states, and so held the new
+            outputs until the following tick.
+
+        If ``telemetry`` is given, the time and the watched signals of each
+        sample are written to this :class:`~bdsim.telemetry.RingBuffer`
+        instead, where another thread or process can read them while the
+        diagram runs.  It is allocated at the first sample if necessary.  The
+        results then have no ``t``, ``yN`` or ``clockN`` attributes, and
+        ``samples`` defaults to False, so that memory use does not grow with
+        the length of the run.
+
+        If ``profile`` is True, the execution time of every block and every
+        group of the execution plan is recorded in a histogram, and the
+        percentiles are printed after the run.  The results have an attribute
+        ``profile`` which is the :class:`~bdsim.timing.Profiler`.
+
         .. note:: Simulation stops if the step time falls below ``minsteplength``
             which typically indicates that the solver is struggling with a very
             harsh non-linearity.
         """
 
+        clocked = len(bd.clocklist) > 0
+        if clocked:
+            # the clocks set the pace
+            dt = min([clock.T for clock in bd.clocklist])
+        state = self._prepare(
+            bd, T, dt, watch, samples, spin, overrun, profile, telemetry
+        )
+        ticker = state.ticker
+        record = state.record
+        samples = state.samples
+        sampled = state.sampled
+        stats = state.stats
+        lateness = state.lateness
+
+        print("run")
+        self.running = True
+        ticker.start()
+
+        if clocked:
+            partitions = {}
+
+            # evaluate all the blocks at time zero
+            te_0 = time.perf_counter_ns()
+            bd.schedule_evaluate([], 0.0)
+            record(0.0)
+            stats.update((time.perf_counter_ns() - te_0) * 1e-9)
+            kernel = bd._kernel
+
+            while self.running:
+                # get the next tick and the clocks that tick then
+                t, clocks = state.eventq.pop(dt=1e-6)
+                if t is None or t > T:
+                    break
+
+                late = ticker.wait_until(t)
+                if samples:
+                    sampled.append(late)
+                if late and overrun == "skip":
+                    for clock in clocks:
+                        clock.next_event(state)
+                    continue
+                lateness.update(ticker.late * 1e-9)
+
+                key = frozenset(clocks)
+                if key not in partitions:
+                    partitions[key] = _partitions(bd, kernel, clocks)
+                before, after = partitions[key]
+
+                # evaluate the inputs of the clocked blocks, update the state
+                # of the clocks, and evaluate the blocks that depend on them
+                te_0 = time.perf_counter_ns()
+                bd.schedule_evaluate([], t, partition=before)
+                for clock in clocks:
+                    # clock ticked, get the new state, and save it unless the
+                    # samples go to telemetry
+                    if telemetry is None:
+                        clock._x = clock.savestate(t)
+                    else:
+                        clock._x = clock.getstate(t)
+                    clock.next_event(state)
+                bd.schedule_evaluate([], t, partition=after)
+                if kernel.profile is not None:
+                    kernel.profile.end()
+                record(t)
+
+                # compute stats on time to execute the block diagram
+                stats.update((time.perf_counter_ns() - te_0) * 1e-9)
+        else:
+            # the samples up to and including T, allowing for rounding error
+            nsamples = math.floor(T / dt + 1e-9)
+            k = 0
+
+            while self.running:
+                t = k * dt  # time of this sample
+
+                # evaluate the block diagram
+                te_0 = time.perf_counter_ns()
+                bd.schedule_evaluate([], t)
+                record(t)
+
+                # compute stats on time to execute the block diagram
+                stats.update((time.perf_counter_ns() - te_0) * 1e-9)
+
+                # check whether to continue, and pause till next sample time
+                if k >= nsamples:
+                    break
+                k, late = ticker.wait()
+                if samples:
+                    sampled.append(late)
+                if k > nsamples:
+                    break
+                lateness.update(ticker.late * 1e-9)
+
+        return self._results(bd, state)
+
+    async def arun(
+        self,
+        bd,
+        T=5,
+        dt=None,
+        watch=[],
+        samples=None,
+        spin=0.0,
+        overrun="catchup",
+        profile=False,
+        telemetry=None,
+        timeout=None,
+    ):
+        """
+        Run the block diagram in an asyncio event loop
+
+        :param T: run time, defaults to 5
+        :type T: float, optional
+        :param dt: sample interval
+        :type dt: float
+        :param watch: list of output ports to log
+        :type watch: list
+        :param samples: show overrun of each sample after the run, defaults to
+            True unless ``telemetry`` is given
+        :type samples: bool
+        :param spin: busy-wait interval before each sample in seconds, defaults
+            to 0
+        :type spin: float
+        :param overrun: policy for a sample that overruns, one of "catchup",
+            "skip" or "abort", defaults to "catchup"
+        :type overrun: str
+        :param profile: record the execution time of every block, defaults to
+            False
+        :type profile: bool
+        :param telemetry: ring buffer to write the watched signals to, defaults
+            to None
+        :type telemetry: :class:`~bdsim.telemetry.RingBuffer`
+        :param timeout: deadline for the I/O of each sample in seconds,
+            defaults to ``dt/2``
+        :type timeout: float
+        :raises ValueError: ``dt`` is not given, or the diagram has clocked
+            blocks
+        :return: time history of signals
+        :rtype: BDStruct
+
+        A coroutine version of :meth:`run` for diagrams whose source and sink
+        blocks do slow I/O, for example to a microcontroller.  Source blocks
+        that define a coroutine ``aoutput(t, inports, x)`` and sink blocks that
+        define a coroutine ``astep(t, inports)`` are awaited instead of
+        calling their ``output`` or ``step`` methods.  At each sample:
+
+        - the ``aoutput`` coroutines are awaited concurrently, for up to
+          ``timeout`` seconds.  A block that does not finish in time keeps its
+          previous output.  There is no deadline at the first sample, so that
+          every block has an output.
+        - the other blocks are evaluated, as by :meth:`run`
+        - the ``astep`` coroutines are awaited concurrently, for up to
+          ``timeout`` seconds
+
+        I/O operations that do not finish in time are cancelled and counted,
+        and the count is printed after the run.  Other tasks in the event
+        loop run while the diagram waits for the next sample.  A blocking
+        read can be made a coroutine by running it in a thread, for example::
+
+            async def aoutput(self, t, inports, x):
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(None, self.output, t, inports, x)
+
+        To run the diagram from synchronous code::
+
+            out = asyncio.run(sim.arun(bd, 10, dt=0.05))
+
+        The other arguments and the results are as for :meth:`run`.
+        """
+        if dt is None:
+            raise ValueError("the sample interval dt must be given")
+        if len(bd.clocklist) > 0:
+            raise ValueError("clocked blocks are not supported by arun")
+        if timeout is None:
+            timeout = dt / 2
+
+        state = self._prepare(
+            bd, T, dt, watch, samples, spin, overrun, profile, telemetry
+        )
+        ticker = state.ticker
+        record = state.record
+        samples = state.samples
+        stats = state.stats
+
+        # the I/O blocks are taken out of the evaluation kernel
+        kernel = bd._kernel
+        signals = kernel.signals
+        sources = [
+            (b, outslice)
+            for b, srcs, outslice in kernel.evallist
+            if hasattr(b, "aoutput")
+        ]
+        sinks = [(b, srcs) for b, srcs in kernel.sinks if hasattr(b, "astep")]
+        io = set([b for b, _ in sources + sinks])
+        partition = (
+            [entry for entry in kernel.evallist if entry[0] not in io],
+            [entry for entry in kernel.sinks if entry[0] not in io],
+        )
+
+        def inputs(srcs):
+            if signals is None:
+                return [s.output_values[p] for s, p in srcs]
+            else:
+                return srcs(signals)
+
+        self.running = True
+        nsamples = math.floor(T / dt + 1e-9)
+        k = 0
+        ticker.start()
+
+        while self.running:
+            t = k * dt  # time of this sample
+
+            # read the inputs
+            te_0 = time.perf_counter_ns()
+            outs, ntimeout = await _gather(
+                [b.aoutput(t, None, b._x) for b, _ in sources],
+                timeout if k > 0 else None,
+            )
+            state.niotimeout += ntimeout
+            for (b, outslice), out in zip(sources, outs):
+                if out is None:
+                    continue  # hold the previous output
+                if not isinstance(out, (tuple, list)) or len(out) != b.nout:
+                    raise AssertionError(
+                        f"block {b} output must be a list of length {b.nout}: {out}"
+                    )
+                b.output_values = out
+                if signals is not None:
+                    signals[outslice] = out
+
+            # evaluate the rest of the block diagram
+            bd.schedule_evaluate([], t, partition=partition)
+            if kernel.profile is not None:
+                kernel.profile.end()
+            record(t)
+
+            # write the outputs
+            _, ntimeout = await _gather(
+                [b.astep(t, inputs(srcs)) for b, srcs in sinks], timeout
+            )
+            state.niotimeout += ntimeout
+
+            # compute stats on time to execute the block diagram
+            stats.update((time.perf_counter_ns() - te_0) * 1e-9)
+
+            # check whether to continue, and pause till next sample time
+            if k >= nsamples:
+                break
+            k, late = await ticker.wait_async()
+            if samples:
+                state.sampled.append(late)
+            if k > nsamples:
+                break
+            state.lateness.update(ticker.late * 1e-9)
+
+        return self._results(bd, state)
+
+    def _prepare(self, bd, T, dt, watch, samples, spin, overrun, profile, telemetry):
+        # create the state of a real-time run, process the watchlist, start
+        # the blocks
         assert bd.compiled, "Network has not been compiled"
 
+        ticker = Ticker(dt, spin=spin, overrun=overrun)
+
         state = BDRealTimeState()
         self.state = state
         self.bd = bd
@@ -247,6 +811,15 @@ class BDRealTime(BDSim):
         state.T = T
         state.dt = dt
         state.options = self.options
+        state.ticker = ticker
+        # the overrun flags would grow with the length of the run
+        state.samples = telemetry is None if samples is None else samples
+        state.profile = profile
+        state.telemetry = telemetry
+        state.sampled = bytearray()  # overrun flag of each sample
+        state.stats = SimpleStats()  # time to execute the block diagram
+        state.lateness = SimpleStats()  # time each sample started late
+        state.niotimeout = 0  # number of I/O operations that timed out
 
         # process the watchlist
         #  elements can be:
@@ -276,278 +849,112 @@ class BDRealTime(BDSim):
         state.watchlist = watchlist
         state.watchnamelist = watchnamelist
 
-        # for clock in bd.clocklist:
-        #     clock.start(state)
+        # the watched blocks must be evaluated
+        bd.watched = watchlist
 
-        # tell all blocks we're starting a BlockDiagram
+        # the clocks start from their initial state, with no saved states
+        for clock in bd.clocklist:
+            clock._x = clock.getstate0()
+            clock.t = []
+            clock.x = []
+
+        # tell all blocks we're starting a BlockDiagram, the clocks declare
+        # their first tick
         bd.start(state)
 
+        if profile:
+            kernel = bd._kernel
+            if kernel is None:
+                kernel = bd.schedule_compile()
+            kernel.profile = Profiler(kernel)
+        elif bd._kernel is None:
+            bd.schedule_compile()
+
         state.tlist = []
         state.xlist = []
         state.plist = [[] for p in state.watchlist]
 
-        print("run")
-        nok = 0
-        decimate = 0
-        noverrun = 0
-        self.running = True
-        stats = SimpleStats()
-        t0 = time.time()
-        t = 0
-
-        while self.running:
-            # evaluate the block diagram
-            te_0 = time.time()
-            bd.schedule_evaluate([], t)
-
-            # record the ports on the watchlist
-            for i, p in enumerate(state.watchlist):
-                b = p.block
-                output = b.output(t, b.inputs, b._x)[p.port]
-                state.plist[i].append(output)
-
-            state.tlist.append(t)
-
-            # check execution time for this sample step
-            te_1 = time.time()
-            dte = te_1 - te_0
-            stats.update(dte)  # compute stats on time to execute the block diagram
-            if samples:
-                if dte > dt:
-                    print("x", end="")  # overrun
-                else:
-                    print(".", end="")
-                sys.stdout.flush()
-
-            if dte > dt:
-                noverrun += 1
-            else:
-                nok += 1
-
-            # check whether to continue, and pause till next sample time
-            tnow = time.time() - t0
-            if tnow > T:
-                break
+        if telemetry is None:
 
-            t += dt  # time of next sample
+            def record(t):
+                # record the ports on the watchlist
+                for i, p in enumerate(state.watchlist):
+                    state.plist[i].append(p.block.output_values[p.port])
 
-            t_sleep = t - tnow
-            if t_sleep < 0:  # be tolerant to a sample overrun
-                t_sleep = 0
-            time.sleep(t_sleep)  # sleep till next tick
+                state.tlist.append(t)
 
-        # save buffered data in a Struct
+        else:
+            values = [None] * len(watchlist)
+
+            def record(t):
+                # write the ports on the watchlist to the ring buffer
+                for i, p in enumerate(watchlist):
+                    values[i] = p.block.output_values[p.port]
+                if telemetry.data is None:
+                    telemetry.allocate([np.size(v) for v in values])
+                telemetry.write(t, values)
+
+        state.record = record
+        return state
+
+    def _results(self, bd, state):
+        # save the buffered data of a real-time run in a Struct, and print
+        # its performance
         out = BDStruct(name="results")
-        out.t = np.array(state.tlist)
-        # out.x = np.array(state.xlist)
-        # out.xnames = bd.statenames
-
-        # save the watchlist into variables named y0, y1 etc.
-        for i, p in enumerate(watchlist):
-            out["y" + str(i)] = np.array(state.plist[i])
-        out.ynames = watchnamelist
-
+        telemetry = state.telemetry
+        watchlist = state.watchlist
+        if telemetry is None:
+            out.t = np.array(state.tlist)
+            # out.x = np.array(state.xlist)
+            # out.xnames = bd.statenames
+
+            # save the watchlist into variables named y0, y1 etc.
+            for i, p in enumerate(watchlist):
+                out["y" + str(i)] = np.array(state.plist[i])
+        else:
+            out.telemetry = telemetry
+        out.ynames = state.watchnamelist
+
+        # save clocked states
+        if telemetry is None:
+            for clock in bd.clocklist:
+                name = clock.name.replace(".", "")
+                data = BDStruct(name)
+                data.t = np.array(clock.t)
+                data.x = np.array(clock.x)
+                out.add(name, data)
+
+        if state.samples:
+            print("".join(["x" if late else "." for late in state.sampled]))
+
+        ticker = state.ticker
+        stats = state.stats
+        lateness = state.lateness
+        noverrun = ticker.noverrun
+        nok = stats.n - noverrun
         if noverrun > 0:
             print(fg("red"))
         else:
             print(fg("yellow"))
         print("run time performance:")
         print(f"  overrun    {noverrun} / {nok} ({noverrun/(nok+noverrun)*100:.1f}%)")
+        if ticker.nskipped > 0:
+            print(f"  skipped    {ticker.nskipped}")
+        if state.niotimeout > 0:
+            print(f"  io timeout {state.niotimeout}")
+        if lateness.n > 0:
+            print(f"  late_max   {lateness.max*1000:.3f} ms")
+            print(f"  late_mean  {lateness.mean*1000:.3f} ms")
         print(f"  t_max      {stats.max*1000:.1f} ms")
         print(f"  t_mean     {stats.mean*1000:.1f} ms")
         print(f"  t_sdev     {stats.sdev*1000:.1f} ms")
-        print(f"  t_max / dt {stats.max/dt*100:.1f}%")
+        print(f"  t_max / dt {stats.max/state.dt*100:.1f}%")
         print(attr(0))
 
-        return out
+        if state.profile:
+            kernel = bd._kernel
+            kernel.profile.report()
+            out.profile = kernel.profile
+            kernel.profile = None
 
-        # assert bd.compiled, "Network has not been compiled"
-
-        # state = BDRealTimeState()
-        # self.state = state
-
-        # # process the watchlist
-        # #  elements can be:
-        # #   - block or Plug reference
-        # #   - str in the form BLOCKNAME[PORT]
-        # watchlist = []
-        # watchnamelist = []
-        # re_block = re.compile(r"(?P<name>[^[]+)(\[(?P<port>[0-9]+)\])")
-        # for w in watch:
-        #     if isinstance(w, str):
-        #         # a name was given, with optional port number
-        #         m = re_block.match(w)
-        #         if m is None:
-        #             raise ValueError("watch block[port] not found: " + w)
-        #         name = m.group("name")
-        #         port = int(m.group("port"))
-        #         b = bd.blocknames[name]
-        #         plug = b[port]
-        #     elif isinstance(w, Block):
-        #         # a block was given, defaults to port 0
-        #         plug = w[0]
-        #     elif isinstance(w, Plug):
-        #         # a plug was given
-        #         plug = w
-        #     watchlist.append(plug)
-        #     watchnamelist.append(str(plug))
-        # state.watchlist = watchlist
-        # state.watchnamelist = watchnamelist
-
-        # for clock in bd.clocklist:
-        #     clock.start(state)
-
-        # state.tlist = []
-        # state.xlist = []
-        # state.plist = [[] for p in state.watchlist]
-
-        # print("run")
-        # t0 = time.time()
-        # stop = t0
-        # tmax = 0
-        # nok = 0
-        # n = 0
-        # tsum = 0
-        # tsum2 = 0
-        # tmax = 0
-        # noverrun = 0
-        # self.running = True
-        # while self.running:
-        #     tnext, sources = self.state.eventq.pop()
-
-        #     if tnext is None:
-        #         print("E", end="")
-        #         time.sleep(0.02)
-        #         continue
-
-        #     if tnext > T:
-        #         break
-
-        #     # print('dequeue', t)
-        #     stop = t0 + tnext
-        #     ts = time.time()
-        #     sleep_time = stop - ts
-        #     if sleep_time > 0:
-        #         # print('sleeping for', sleep_time)
-        #         time.sleep(sleep_time)
-        #         tmax = max(tmax, time.time() - ts)
-        #         # if tmax > 0.2:
-        #         #     print(tmax, sleep_time)
-        #         print(".", end="")
-        #         nok += 1
-        #     else:
-        #         # print('timer overrun')
-        #         print("x", end="")
-        #         noverrun += 1
-
-        #     # self.t = t
-        #     # self.clocks = clocks
-        #     # self.sem.release()
-
-        #     # evaluate the block diagram
-        #     te_0 = time.time()
-        #     bd.evaluate_plan([], tnext)
-        #     te_1 = time.time()
-
-        #     dt = te_1 - te_0
-        #     n += 1
-        #     tsum += dt
-        #     tsum2 += dt * dt
-        #     tmax = max(tmax, dt)
-
-        #     # visit all the blocks and clocks that have an event now
-        #     for source in sources:
-        #         # if isinstance(source, Clock):
-        #         #     # clock ticked, save its state
-        #         #     clock.savestate(tnext)
-        #         source.next_event(self.state)
-
-        #     # visit all the blocks and clocks that have an event now
-        #     for source in sources:
-        #         if isinstance(source, Clock):
-        #             # clock ticked, save its state
-        #             clock.savestate(tnext)
-        #             clock.next_event(self.state)
-
-        #             # get the new state
-        #             clock._x = clock.getstate()
-
-        #     # stash the results
-        #     state.tlist.append(tnext)
-
-        #     # record the ports on the watchlist
-        #     for i, p in enumerate(state.watchlist):
-        #         state.plist[i].append(p.block.output(tnext)[p.port])
-
-        #     sys.stdout.flush()
-
-        # # save buffered data in a Struct
-        # out = BDStruct(name="results")
-        # # out.t = np.array(state.tlist)
-        # # out.x = np.array(state.xlist)
-        # # out.xnames = bd.statenames
-
-        # # save clocked states
-        # for c in bd.clocklist:
-        #     name = c.name.replace(".", "")
-        #     clockdata = BDStruct(name)
-        #     clockdata.t = np.array(c.t)
-        #     clockdata.x = np.array(c.x)
-        #     out.add(name, clockdata)
-
-        # # save the watchlist into variables named y0, y1 etc.
-        # for i, p in enumerate(watchlist):
-        #     out["y" + str(i)] = np.array(state.plist[i])
-        # out.ynames = watchnamelist
-
-        # print(fg("yellow"))
-        # print(f"tmax {tmax}")
-        # print(f"n ok      {nok} ({nok/(nok+noverrun)*100:.1f}%)")
-        # print(f"n overrun {noverrun} ({noverrun/(nok+noverrun)*100:.1f}%)")
-        # print(f"t mean {tsum/n*1000:.1f} ms")
-        # print(f"t sdev {math.sqrt((tsum2 - tsum**2/n)/(n-1)*1000):.1f} ms")
-        # print(f"t max {tmax*1000:.1f} ms")
-        # print(attr(0))
-
-        # return out
-        # self.state.eventq.start()
-
-        # n = 0
-        # tsum = 0
-        # tsum2 = 0
-        # tmax = 0
-
-        # while True:
-        #     t, clocks = self.state.eventq.wait()
-        #     # print('run wakes up', t, clocks)
-        #     state.t = t
-
-        #     if t > T:
-        #         break
-
-        #     # evaluate the block diagram
-        #     t0 = time.time()
-        #     bd.evaluate_plan([], t)
-        #     t1 = time.time()
-
-        #     # visit all the blocks and clocks that have an event now
-        #     for clock in clocks:
-        #         # if isinstance(source, Clock):
-        #         #     # clock ticked, save its state
-        #         #     clock.savestate(tnext)
-        #         clock.next_event(self.state)
-
-        #     # update some stats about block diagram execution time
-        #     dt = t1 - t0
-        #     n += 1
-        #     tsum += dt
-        #     tsum2 += dt*dt
-        #     tmax = max(tmax, dt)
-
-        # self.state.eventq.stop()
-
-        # print(fg('yellow'))
-        # print(f't mean {tsum/n*1000:.1f} ms')
-        # print(f't sdev {math.sqrt((tsum2 - tsum**2/n)/(n-1)*1000):.1f} ms')
-        # print(f't max {tmax*1000:.1f} ms')
-        # print(attr(0))
+        return out
@@ -9,9 +9,24 @@ import argparse
 import types
 import warnings
 import time
+import heapq
+import itertools
+import copy
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 
 from bdsim.blockdiagram import BlockDiagram
-from bdsim.components import OptionsBase, Block, Clock, BDStruct, Plug, clocklist
+from bdsim.recorder import Recorder, StreamRecorder
+from bdsim.solvers import fixedstep_solvers, jacobian_solvers, extend
+from bdsim.components import (
+    OptionsBase,
+    Block,
+    Clock,
+    BDStruct,
+    Plug,
+    EventSource,
+    clocklist,
+)
 import spatialmath.base as smb
 import tempfile
 import subprocess
@@ -104,15 +119,16 @@ class TimeQ:
     """
     Time-ordered queue for events
 
-    The list comprises tuples of (time, block) to reflect an event associated
+    The queue comprises tuples of (time, block) to reflect an event associated
     with the specified block at the specified time.
 
-    The list is not ordered, and is sorted on a pop event.
+    The queue is a binary heap, so push and pop are O(log n).  Events at the
+    same time are popped in the order that they were pushed.
     """
 
     def __init__(self):
         self.q = []
-        self.dirty = False
+        self.counter = itertools.count()  # tie breaker for events at same time
 
     def __len__(self):
         """
@@ -133,12 +149,13 @@ class TimeQ:
         if len(self) == 0:
             return f"TimeQ: len={len(self)}"
         else:
-            return f"TimeQ: len={len(self)}, first out {self.q[0]}"
+            t, _, block = self.q[0]
+            return f"TimeQ: len={len(self)}, first out {(t, block)}"
 
     def __repr__(self):
         events = []
-        for t in self.q:
-            events.append(str(t))
+        for t, _, block in sorted(self.q, key=lambda x: x[:2]):
+            events.append(str((t, block)))
         return "\n".join(events)
 
     def push(self, value):
@@ -150,8 +167,8 @@ class TimeQ:
 
         Push a block and a time onto the queue.
         """
-        self.q.append(value)
-        self.dirty = True
+        t, block = value
+        heapq.heappush(self.q, (t, next(self.counter), block))
 
     def pop(self, dt=0):
         """
@@ -168,15 +185,11 @@ class TimeQ:
         if len(self) == 0:
             return None, []
 
-        if self.dirty:
-            self.q.sort(key=lambda x: x[0])
-            self.dirty = False
-
-        qfirst = self.q.pop(0)
-        t = qfirst[0]
-        blocks = [qfirst[1]]
-        while len(self.q) > 0 and self.q[0][0] < (t + dt):
-            blocks.append(self.q.pop(0)[1])
+        q = self.q
+        t, _, block = heapq.heappop(q)
+        blocks = [block]
+        while len(q) > 0 and q[0][0] < (t + dt):
+            blocks.append(heapq.heappop(q)[2])
         return t, blocks
 
     def pop_until(self, t):
@@ -185,25 +198,17 @@ class TimeQ:
 
         :param t: time
         :type t: float
-        :return: list of blocks remaining sorted by receding time
+        :return: list of (time, block) tuples popped, in time order
         :rtype: list
 
         Pops all items with time less than or equal to ``t``.
         """
-        if len(self) == 0:
-            return []
-
-        if self.dirty:
-            self.q.sort(key=lambda x: x[0])
-            self.dirty = False
-
-        i = 0
-        while True:
-            if self.q[i][0] > t:
-                out = self.q[:i]
-                self.q = self.q[i:]
-                return out
-            i += 1
+        q = self.q
+        out = []
+        while len(q) > 0 and q[0][0] <= t:
+            tb, _, block = heapq.heappop(q)
+            out.append((tb, block))
+        return out
 
 
 # convert class name to BLOCK name
@@ -299,6 +304,7 @@ class BDSim:
         --quiet, -q          quiet      False     suppress reports
         -o                   outfile    None      output pickled simulation results to bd.out
         --out OUTFILE        outfile    None      file to save pickled simulation results
+        --stream DIR         stream     None      stream simulation results to .npy files in DIR
         --set P, -s P        setparam   []        override block parameter using ``P=block:param=value``
         --global G           setglob    []        override global parameter using ``G=var=value``
         ===================  =========  ========  ===========================================
@@ -402,6 +408,13 @@ class BDSim:
         checkfinite=True,
         minstepsize=1e-12,
         watch=[],
+        engine=None,
+        recorder=None,
+        decimate=1,
+        t_eval=None,
+        ensemble=None,
+        x0=None,
+        restart=False,
     ):
         """
         Run the block diagram
@@ -422,6 +435,27 @@ class BDSim:
         :type watch: list
         :param solver_args: arguments passed to ``scipy.integrate``
         :type solver_args: dict
+        :param engine: block diagram evaluation engine, "plan" or "signals",
+            defaults to the diagram's current engine
+        :type engine: str, optional
+        :param recorder: recorder for the results, defaults to a new ``Recorder``,
+            or a ``StreamRecorder`` if the ``stream`` option is set
+        :type recorder: Recorder, optional
+        :param decimate: record only every ``decimate``'th integration step,
+            defaults to 1
+        :type decimate: int, optional
+        :param t_eval: times at which to record the results, defaults to every
+            integration step
+        :type t_eval: array_like, optional
+        :param ensemble: number of copies of the system to simulate at once,
+            defaults to None
+        :type ensemble: int, optional
+        :param x0: initial continuous state, defaults to the initial states of
+            the blocks
+        :type x0: array_like(n) or array_like(N,n), optional
+        :param restart: create a new integrator after every event, defaults to
+            False
+        :type restart: bool, optional
         :return: time history of signals and states
         :rtype: Sim class
 
@@ -434,6 +468,26 @@ class BDSim:
         ``first_step`` parameters to the underlying integrator using the
         ``solver_args`` parameter.
 
+        The ``solver`` is the name of a ``scipy.integrate`` solver class, or
+        one of the fixed-step solvers "euler", "heun" or "rk4" which take steps
+        of exactly ``dt``, see :mod:`bdsim.solvers`.
+
+        Events, such as clock ticks, split the simulation into intervals.  The
+        integrator is continued from one interval to the next, keeping its
+        step size, for the fixed-step solvers and ``RK23``, ``RK45`` and
+        ``DOP853``.  For other solvers, or if ``restart`` is True, a new
+        integrator is created for each interval.
+
+        The implicit solvers ``BDF``, ``Radau`` and ``LSODA`` are given the
+        Jacobian of the diagram, see :meth:`BlockDiagram.jacobian`, if every
+        block can provide its partial derivatives and ``jac`` is not given in
+        ``solver_args``.  Otherwise the solver estimates the Jacobian by finite
+        differences, and is given the Jacobian's sparsity pattern, which
+        follows from the wiring of the diagram, so that states that cannot
+        influence each other are perturbed together.  The pattern is passed as
+        ``jac_sparsity``, or for ``LSODA`` which supports only banded
+        Jacobians, as ``lband`` and ``uband``.
+
         Results are returned in a class with attributes:
 
         - ``t`` the time vector: ndarray, shape=(M,)
@@ -446,12 +500,34 @@ class BDSim:
         If there are no dynamic elements in the diagram, ie. no states, then ``x`` and ``xnames`` are not
         present.
 
+        By default the results are recorded at every step taken by the
+        integrator, which depends on the solver and the dynamics.  With
+        ``decimate`` only every N'th step is recorded.  With ``t_eval`` the
+        results are recorded at the given times only, the continuous state is
+        interpolated using the integrator's dense output and the diagram is
+        evaluated at each time to give the watched signals.  For example::
+
+            out = sim.run(bd, 10, t_eval=np.linspace(0, 10, 101))
+
+        With ``ensemble`` set to N, N members, copies of the system, are
+        simulated together by a single integrator whose state is the (N,n)
+        array of all their states.  The members differ by their initial
+        states, given by an (N,n) array ``x0``, or by block parameters that
+        are arrays with a leading dimension of N.  The recorded ``x`` then has
+        shape (M,N,n), and watched signals have a second dimension of N.  The
+        members share the integrator's step size.  See
+        :attr:`BlockDiagram.ensemble` for the blocks that can be used.
+
         The ``watch`` argument is a list of one or more input ports whose value during simulation
         will be recorded.  The elements of the list can be:
             - a ``Block`` reference, which is interpretted as input port 0
             - a ``Plug`` reference, ie. a block with an index or attribute
             - a string of the form "block[i]" which is port i of the block named block.
 
+        At each recorded step the diagram, without the sink blocks, is
+        evaluated once at the state accepted by the integrator and the watched
+        values are taken from the block outputs.
+
         The debug string comprises single letter flags:
 
                 - 'p' debug network value propagation
@@ -465,6 +541,10 @@ class BDSim:
 
         assert bd.compiled, "Network has not been compiled"
 
+        if engine is not None:
+            bd.engine = engine
+        bd.ensemble = ensemble
+
         # get simulation time
         #  --simtime=T  or --simtime=T,dt
         if self.options.simtime is not None:
@@ -496,10 +576,21 @@ class BDSim:
         simstate.bdtime = 0.0
         simstate.gtime = 0.0  # last graphics update
         simstate.solver = solver
-        simstate.solver_args = solver_args
+        simstate.solver_args = dict(solver_args)  # the caller's dict is not changed
         simstate.minstepsize = minstepsize
         simstate.stop = None  # allow any block to stop.BlockDiagram by setting this to the block's name
         simstate.checkfinite = checkfinite
+        assert decimate >= 1, "decimate must be a positive integer"
+        simstate.decimate = int(decimate)
+        simstate.nsteps = 0  # number of integration steps
+        if t_eval is not None:
+            t_eval = np.sort(np.array(t_eval, dtype=float).ravel())
+        simstate.t_eval = t_eval
+        simstate.t_eval_index = 0  # next time in t_eval to record
+        simstate.integrator = None  # integrator that is continued across events
+        simstate.restart = restart
+        simstate.nstarts = 0  # number of integrators created
+        simstate.h_abs = None  # step size proposed by the integrator
         # state.options = copy.copy(self.options)
         simstate.options = self.options
         self.bd = bd
@@ -550,7 +641,18 @@ class BDSim:
         simstate.watchlist = watchlist
         simstate.watchnamelist = watchnamelist
 
-        x0 = bd.getstate0()
+        # the watched blocks must be evaluated
+        bd.watched = watchlist
+
+        if x0 is None:
+            x0 = bd.getstate0()
+        else:
+            # initial state given, broadcast to all members of an ensemble
+            if bd.ensemble is None:
+                shape = (bd.nstates,)
+            else:
+                shape = (bd.ensemble, bd.nstates)
+            x0 = np.broadcast_to(np.array(x0, dtype=float), shape).ravel()
         if not self.options.quiet:
             print(fg("yellow"))
             print(f">>> Start simulation: T = {T}, dt = {dt}")
@@ -578,10 +680,14 @@ class BDSim:
         # tell all blocks we're starting a BlockDiagram
         self.bd.start(simstate)
 
-        # initialize list of time and states
-        simstate.tlist = []
-        simstate.xlist = []
-        simstate.plist = [[] for p in simstate.watchlist]
+        # initialize the recorder for time, states and watched signals
+        if recorder is None:
+            if self.options.stream is not None:
+                recorder = StreamRecorder(self.options.stream)
+            else:
+                recorder = Recorder()
+        recorder.start(bd, watchlist)
+        simstate.recorder = recorder
 
         self.progress = Progress(enable=self.options.progress)
         self.progress.start(T)
@@ -594,9 +700,12 @@ class BDSim:
             # we have simulation events, solve it in chunks
             simstate.declare_event(None, T)  # add an event at end of simulation
 
-            # ignore all the events at zero
+            # ignore all the events at zero, but let their sources schedule
+            # their next event
             tprev = 0
-            simstate.eventq.pop_until(tprev)
+            for t, source in simstate.eventq.pop_until(tprev):
+                if isinstance(source, (Clock, EventSource)):
+                    source.next_event(simstate)
 
             # get the state vector
             x = x0
@@ -615,12 +724,13 @@ class BDSim:
                 # visit all the blocks and clocks that have an event now
                 for source in sources:
                     if isinstance(source, Clock):
-                        # clock ticked, save its state
-                        source.savestate(tnext)
-                        source.next_event(self.simstate)
-
-                        # get the new state
+                        # clock ticked, get the new state and save it
                         source._x = source.getstate(tnext)
+                        recorder.record_clock(source, tnext, source._x)
+                        source.next_event(self.simstate)
+                    elif isinstance(source, EventSource):
+                        # events are generated lazily, schedule the next one
+                        source.next_event(self.simstate)
                 tprev = tnext
 
                 # are we done?
@@ -640,28 +750,15 @@ class BDSim:
                 "  block diagram exec time:  "
                 f" {simstate.bdtime / simstate.count * 1000.0:.3f} ms"
             )
-            print(f"  time steps:                {len(simstate.tlist)}")
+            print(f"  time steps:                {len(recorder)}")
             print(f"  integration intervals:     {nintervals}")
+            print(f"  integrator starts:         {simstate.nstarts}")
             print(attr(0))
 
-        # save buffered data in a Struct
-        out = BDStruct(name="results")
-        out.t = np.array(simstate.tlist)
-        out.x = np.array(simstate.xlist)
-        out.xnames = bd.statenames
-
-        # save clocked states
-        for c in bd.clocklist:
-            name = c.name.replace(".", "")
-            clockdata = BDStruct(name)
-            clockdata.t = np.array(c.t)
-            clockdata.x = np.array(c.x)
-            out.add(name, clockdata)
-
-        # save the watchlist into variables named y0, y1 etc.
-        for i, p in enumerate(watchlist):
-            out["y" + str(i)] = np.array(simstate.plist[i])
-        out.ynames = watchnamelist
+        # get the recorded data in a Struct, the watchlist is saved into
+        # variables named y0, y1 etc.
+        recorder.close()
+        out = recorder.results()
 
         # the command line options -o or --out saves results as a pickle file
         #  -o defaults to bd.out
@@ -744,12 +841,143 @@ class BDSim:
                 raise ValueError("cannot parse value " + value)
 
             # change the value
-            setattr(block, param, new_value)
+            if param in block._parameters:
+                block._parameters[param](block, param, new_value)
+            else:
+                setattr(block, param, new_value)
+            bd.invalidate(block)
             print(
                 f"changed value of {block.name}:{param} from {prev_value} ->"
                 f" {new_value}"
             )
 
+    def sweep(self, bd, params, T=10.0, workers=None, **runargs):
+        """
+        Run the block diagram for a grid of parameter values
+
+        :param bd: the compiled block diagram
+        :type bd: BlockDiagram
+        :param params: parameter values, see below
+        :type params: dict or list of dict
+        :param T: maximum integration time, defaults to 10.0
+        :type T: float, optional
+        :param workers: number of worker processes, defaults to the number of
+            CPUs
+        :type workers: int, optional
+        :param runargs: other arguments passed to :meth:`run`
+        :return: results of all runs
+        :rtype: BDStruct
+
+        ``params`` is a dict that maps a block parameter, written as
+        ``"block:param"`` like the ``--set`` command line option, to a sequence
+        of values.  The diagram is run for every combination of values.
+        Alternatively ``params`` is a list of dicts, one per run, that map a
+        block parameter to a value.  The initial state of a block is set by its
+        ``x0`` parameter.
+
+        For example::
+
+            out = sim.sweep(
+                bd,
+                {"gain:K": [1, 2, 5], "plant:x0": [0, 1]},
+                T=5,
+                t_eval=np.linspace(0, 5, 51),
+            )
+
+        The runs are distributed across a pool of processes.  Each run uses a
+        deep copy of the diagram, graphics are disabled, and the ``stream``
+        and ``outfile`` options are ignored.
+
+        The results have the same attributes as those returned by :meth:`run`,
+        with the results of the runs stacked along a new first axis, and an
+        attribute ``params`` which is the list of parameter values for each
+        run.  Arrays whose shape varies between runs, such as ``t`` and ``x``
+        when recording every integration step, are given as lists instead.
+        Use ``t_eval`` to record all runs on the same time grid.
+
+        .. note:: Where available, worker processes are forked so the diagram
+            need not be picklable.
+
+        :seealso: :meth:`montecarlo` :meth:`run`
+        """
+        if isinstance(params, dict):
+            names = list(params.keys())
+            params = [
+                dict(zip(names, values))
+                for values in itertools.product(*params.values())
+            ]
+        return self._runmany(bd, params, T, workers, runargs)
+
+    def montecarlo(self, bd, n, sampler, T=10.0, workers=None, seed=None, **runargs):
+        """
+        Run the block diagram for randomly sampled parameter values
+
+        :param bd: the compiled block diagram
+        :type bd: BlockDiagram
+        :param n: number of runs
+        :type n: int
+        :param sampler: function that returns the parameter values for a run
+        :type sampler: callable
+        :param T: maximum integration time, defaults to 10.0
+        :type T: float, optional
+        :param workers: number of worker processes, defaults to the number of
+            CPUs
+        :type workers: int, optional
+        :param seed: seed for the random number generator, defaults to None
+        :type seed: int, optional
+        :param runargs: other arguments passed to :meth:`run`
+        :return: results of all runs
+        :rtype: BDStruct
+
+        ``sampler`` is called with a NumPy random ``Generator`` and returns a
+        dict that maps a block parameter, written as ``"block:param"``, to a
+        value.  For example::
+
+            out = sim.montecarlo(
+                bd,
+                1000,
+                lambda rng: {"plant:x0": rng.normal(size=2)},
+                T=5,
+                t_eval=np.linspace(0, 5, 51),
+                seed=0,
+            )
+
+        The parameters are sampled in this process, so the results are
+        reproducible for a given ``seed``.
+
+        :seealso: :meth:`sweep` :meth:`run`
+        """
+        rng = np.random.default_rng(seed)
+        params = [sampler(rng) for i in range(n)]
+        return self._runmany(bd, params, T, workers, runargs)
+
+    def _runmany(self, bd, params, T, workers, runargs):
+        # run the diagram once for each dict in params, in a process pool
+        assert bd.compiled, "Network has not been compiled"
+
+        # blocks and plugs on the watchlist are passed to the workers by name
+        watch = runargs.get("watch", [])
+        runargs["watch"] = [
+            str(w[0]) if isinstance(w, Block) else str(w) for w in watch
+        ]
+
+        if "fork" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("fork")
+        else:
+            context = None
+
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=context,
+            initializer=_runmany_init,
+            initargs=(self, bd),
+        ) as executor:
+            outs = list(executor.map(_runmany_run, [(p, T, runargs) for p in params]))
+
+        out = _stack(outs, "sweep")
+        out.params = params
+        return out
+
     def run_interval(self, bd, t0, T, x0, simstate=None):
         """
         Integrate system over interval
@@ -777,9 +1005,11 @@ class BDSim:
 
                 # block diagram contains states, solve it using numerical integration
 
-                scipy_integrator = integrate.__dict__[
-                    simstate.solver
-                ]  # get user specified integrator
+                # get user specified integrator
+                if simstate.solver.lower() in fixedstep_solvers:
+                    scipy_integrator = fixedstep_solvers[simstate.solver.lower()]
+                else:
+                    scipy_integrator = integrate.__dict__[simstate.solver]
 
                 def ydot(t, y):
                     simstate.t = t
@@ -794,13 +1024,32 @@ class BDSim:
                     simstate.solver_args["max_step"] = simstate.dt
 
                 # print(f"run interval: from {t0} to {t0+T}, args={state.solver_args}, x0={x0}")
-                integrator = scipy_integrator(
-                    ydot, t0=t0, y0=x0, t_bound=T, **simstate.solver_args
-                )
+                # continue with the integrator from the previous interval if
+                # possible, this retains its step size
+                integrator = simstate.integrator
+                if (
+                    integrator is None
+                    or simstate.restart
+                    or integrator.t != t0
+                    or not extend(integrator, T, simstate.h_abs)
+                ):
+                    integrator = scipy_integrator(
+                        ydot,
+                        t0=t0,
+                        y0=x0,
+                        t_bound=T,
+                        **simstate.solver_args,
+                        **self._jacobian(bd, simstate, t0, x0),
+                    )
+                    simstate.integrator = integrator
+                    simstate.nstarts += 1
 
                 # integrate
                 while integrator.status == "running":
                     # step the integrator, calls _deriv and evaluate block diagram multiple times
+                    # keep the step size it proposes in case the step is
+                    # shortened to end at the event time
+                    simstate.h_abs = getattr(integrator, "h_abs", None)
                     message = integrator.step()
 
                     if integrator.status == "failed":
@@ -811,16 +1060,11 @@ class BDSim:
                         )
                         break
 
-                    # stash the results
+                    # stash the results, and the ports on the watchlist
                     simstate.t = integrator.t
-                    simstate.tlist.append(integrator.t)
-                    simstate.xlist.append(integrator.y)
-
-                    # record the ports on the watchlist
-                    for i, p in enumerate(simstate.watchlist):
-                        b = p.block
-                        out = b.output(integrator.t, b.inputs, b._x)[p.port]
-                        simstate.plist[i].append(out)
+                    self._record(
+                        bd, simstate, integrator.t, integrator.y, integrator=integrator
+                    )
 
                     # update all blocks that need to know
                     if (integrator.t - simstate.gtime) > (simstate.T / 200):
@@ -872,14 +1116,8 @@ class BDSim:
                     t1 = time.time()
                     simstate.bdtime += t1 - t0
 
-                    # stash the results
-                    simstate.tlist.append(t)
-
-                    # record the ports on the watchlist
-                    for i, p in enumerate(simstate.watchlist):
-                        b = p.block
-                        out = b.output(integrator.t, b.inputs, b._x)[p.port]
-                        simstate.plist[i].append(out)
+                    # stash the results, and the ports on the watchlist
+                    self._record(bd, simstate, t)
 
                     # update all blocks that need to know
                     bd.step(t)
@@ -909,14 +1147,8 @@ class BDSim:
                 t1 = time.time()
                 simstate.bdtime += t1 - t0
 
-                # stash the results
-                simstate.tlist.append(t)
-
-                # record the ports on the watchlist
-                for i, p in enumerate(simstate.watchlist):
-                    b = p.block
-                    out = b.output(integrator.t, b.inputs, b._x)[p.port]
-                    simstate.plist[i].append(out)
+                # stash the results, and the ports on the watchlist
+                self._record(bd, simstate, t)
 
                 # update all blocks that need to know
                 if (t - simstate.gtime) > (simstate.T / 200):
@@ -941,6 +1173,95 @@ class BDSim:
             print("unrecoverable error in evaluation: ", err)
             raise
 
+    def _record(self, bd, simstate, t, x=None, integrator=None):
+        # record the results of an accepted step at time t, either every
+        # decimate'th step, or at the points of the t_eval grid that have been
+        # passed.  The state at a grid point is interpolated using the
+        # integrator's dense output.  The state of an ensemble is recorded as
+        # an array with one row per member
+        recorder = simstate.recorder
+        t_eval = simstate.t_eval
+
+        def record(t, x, y):
+            if x is not None and bd.ensemble is not None:
+                x = x.reshape((bd.ensemble, -1))
+            recorder.record(t, x, y)
+
+        if t_eval is None:
+            simstate.nsteps += 1
+            if simstate.nsteps % simstate.decimate == 0:
+                # the integrator last evaluated the diagram at one of its
+                # stages, not at the accepted step
+                y = self._watched(bd, simstate, t, x, integrator is not None)
+                record(t, x, y)
+            return
+
+        i = simstate.t_eval_index
+        dense = None
+        while i < len(t_eval) and t_eval[i] <= t:
+            tk = t_eval[i]
+            xk = x
+            if integrator is not None and tk != t:
+                if dense is None:
+                    dense = integrator.dense_output()
+                xk = dense(tk)
+            y = self._watched(bd, simstate, tk, xk, integrator is not None or tk != t)
+            record(tk, xk, y)
+            i += 1
+        simstate.t_eval_index = i
+
+    @staticmethod
+    def _watched(bd, simstate, t, x, evaluate):
+        # values of the ports on the watchlist, if evaluate is True the diagram
+        # is first evaluated at time t and state x, without the sink blocks
+        if len(simstate.watchlist) == 0:
+            return []
+        if evaluate:
+            bd.schedule_evaluate(
+                [] if x is None else x, t, sinks=False, simstate=simstate
+            )
+        return [p.block.output_values[p.port] for p in simstate.watchlist]
+
+    @staticmethod
+    def _jacobian(bd, simstate, t, x):
+        # solver arguments that describe the Jacobian of the diagram, for the
+        # solvers that use it
+        args = {}
+        solver_args = simstate.solver_args
+        if simstate.solver not in jacobian_solvers:
+            return args
+
+        if "jac" not in solver_args and bd.jacobian(t, x) is not None:
+            # the diagram provides the Jacobian
+            dense = jacobian_solvers[simstate.solver]
+
+            def jac(t, y):
+                J = bd.jacobian(t, y)
+                if J is None:
+                    raise RuntimeError(f"Jacobian is not available at t={t:.4f}")
+                return J.toarray() if dense else J
+
+            args["jac"] = jac
+
+        elif solver_args.get("jac") is None and not any(
+            k in solver_args for k in ("jac_sparsity", "lband", "uband")
+        ):
+            # the solver estimates the Jacobian by finite differences, give it
+            # the sparsity pattern from the wiring
+            sparsity = bd._kernel.sparsity
+            n = sparsity.shape[0]
+            if sparsity.nnz == n * n:
+                pass  # dense, nothing to gain
+            elif simstate.solver == "LSODA":
+                # LSODA supports only a banded Jacobian
+                i, j = sparsity.nonzero()
+                lband, uband = max((i - j).max(), 0), max((j - i).max(), 0)
+                if lband + uband + 1 < n:
+                    args["lband"], args["uband"] = int(lband), int(uband)
+            else:
+                args["jac_sparsity"] = sparsity
+        return args
+
     def blockdiagram(self, name="main") -> BlockDiagram:
         """
         Instantiate a new block diagram object.
@@ -1413,6 +1734,71 @@ class BDSim:
             bd.report_schedule(**kwargs)
 
 
+# the simulator and diagram in a worker process of BDSim._runmany
+_runmany_sim = None
+_runmany_bd = None
+
+
+def _runmany_init(sim, bd):
+    global _runmany_sim, _runmany_bd
+
+    # the runs are returned to the parent process rather than streamed or
+    # saved, the workers would otherwise all write to the same files
+    sim.options.set(
+        graphics=False,
+        animation=False,
+        progress=False,
+        quiet=True,
+        stream=None,
+        outfile=None,
+    )
+    _runmany_sim = sim
+    _runmany_bd = bd
+
+
+def _runmany_run(args):
+    # run a copy of the diagram with the given block parameters
+    params, T, runargs = args
+    bd = copy.deepcopy(_runmany_bd)
+    for name, value in params.items():
+        blockname, param = name.split(":")
+        block = bd.blocknames[blockname]
+        if param == "x0" and hasattr(block, "_x0"):
+            # initial state
+            param = "_x0"
+            value = np.array(value, dtype=float).ravel()
+        if not hasattr(block, param):
+            raise ValueError(f"block {block.name} has no parameter '{param}'")
+        # change the value, as update_parameters does
+        if param in block._parameters:
+            block._parameters[param](block, param, value)
+        else:
+            setattr(block, param, value)
+        bd.invalidate(block)
+    return _runmany_sim.run(bd, T, **runargs)
+
+
+def _stack(structs, name):
+    # combine a list of result structs, stacking arrays of the same shape
+    out = BDStruct(name=name)
+    for key, value in structs[0].__dict__.items():
+        if key.startswith("_"):
+            continue
+        values = [s[key] for s in structs]
+        if isinstance(value, BDStruct):
+            out[key] = _stack(values, key)
+        elif isinstance(value, np.ndarray):
+            if all(v.shape == value.shape for v in values):
+                out[key] = np.stack(values)
+            else:
+                out[key] = values
+        elif all(v == value for v in values):
+            out[key] = value
+        else:
+            out[key] = values
+    return out
+
+
 class Options(OptionsBase):
     def __init__(self, sysargs=True, **options):
         default_options = {
@@ -1429,6 +1815,7 @@ class Options(OptionsBase):
             "simtime": None,
             "blocks": False,
             "outfile": None,
+            "stream": None,
             "quiet": False,
             "setparam": [],
             "setglob": [],
@@ -1601,6 +1988,12 @@ class Options(OptionsBase):
                 dest="outfile",
                 help="file to save pickled simulation results",
             )
+            parser.add_argument(
+                "--stream",
+                type=str,
+                metavar="DIR",
+                help="stream simulation results to .npy files in DIR",
+            )
             parser.add_argument(
                 "--set",
                 "-s",
@@ -0,0 +1,269 @@
+"""
+Fixed-step integrators
+
+These integrators take steps of a fixed length and have the same interface as
+the ``scipy.integrate`` solvers used by :meth:`BDSim.run`, ie. ``step()``,
+``dense_output()``, and the attributes ``t``, ``y``, ``status`` and
+``step_size``.  They are selected by name, for example::
+
+    out = sim.run(bd, 10, dt=0.001, solver="rk4")
+
+The step length is the ``dt`` argument of :meth:`BDSim.run`.  Step times are
+computed as ``t0 + k * dt`` so they do not drift, and the last step is
+shortened to end exactly at ``t_bound``.  Starting a new integrator at a clock
+tick therefore has no cost, and the steps stay aligned with the ticks if the
+clock period is a multiple of ``dt``.
+
+There is no error control, the accuracy depends only on the step length and
+the order of the method.
+"""
+
+import numpy as np
+import scipy.integrate as integrate
+
+
+class FixedStep:
+    """
+    Base class for fixed-step integrators
+
+    Subclasses implement :meth:`_step` which advances the state by one step
+    and sets the derivative at the start of the step, ``self._f0``.
+    """
+
+    order = None
+
+    def __init__(self, fun, t0, y0, t_bound, max_step=np.inf, **extraneous):
+        """
+        :param fun: function computing the state derivative ``fun(t, y)``
+        :type fun: callable
+        :param t0: initial time
+        :type t0: float
+        :param y0: initial state
+        :type y0: array_like(n)
+        :param t_bound: final time
+        :type t_bound: float
+        :param max_step: step length
+        :type max_step: float
+        :param extraneous: other solver options, ignored
+        :raises ValueError: the step length is not given
+
+        The step length is passed as ``max_step`` like the maximum step length
+        of the ``scipy.integrate`` solvers.
+        """
+        if not np.isfinite(max_step) or max_step <= 0:
+            raise ValueError("fixed-step solver requires a positive step length dt")
+
+        self.fun = fun
+        self.t0 = t0
+        self.t = t0
+        self.y = np.array(y0, dtype=float)
+        self.t_bound = t_bound
+        self.h = max_step
+        self.n = self.y.size
+
+        self.k = 1  # index of the next step time t0 + k * h
+
+        self.t_old = None
+        self.y_old = np.empty_like(self.y)
+        self.step_size = None
+        self.status = "running" if t_bound > t0 else "finished"
+
+        self._f0 = None  # derivative at start of current step
+        self._f1 = None  # derivative at end of current step, if known
+
+    def step(self):
+        """
+        Take one integration step
+
+        :return: message, None if successful
+        :rtype: str
+        """
+        if self.status != "running":
+            raise RuntimeError("attempt to step on a finished solver")
+
+        t = self.t0 + self.k * self.h
+        eps = 1e-9 * self.h
+        if t >= self.t_bound - eps:
+            # last step, shortened to end at t_bound
+            if t <= self.t_bound + eps:
+                self.k += 1
+            t = self.t_bound
+            self.status = "finished"
+        else:
+            self.k += 1
+
+        self.t_old = self.t
+        self.y_old[:] = self.y
+        self.step_size = t - self.t
+
+        # the derivative at the end of the previous step, if computed for dense
+        # output, is the derivative at the start of this step
+        self._f0 = self._f1
+        self._f1 = None
+        self._step(self.t_old, self.step_size)
+        self.t = t
+        return None
+
+    def _f0_eval(self, t, y):
+        # derivative at the start of the step, if not already known
+        if self._f0 is None:
+            self._f0 = self.fun(t, y)
+        return self._f0
+
+    def dense_output(self):
+        """
+        Interpolant over the last step
+
+        :return: function of time that returns the state
+        :rtype: callable
+
+        The interpolant is a cubic Hermite polynomial using the state and
+        derivative at each end of the step.
+        """
+        if self._f1 is None:
+            self._f1 = self.fun(self.t, self.y)
+
+        t0, h = self.t_old, self.step_size
+        y0, y1 = self.y_old.copy(), self.y.copy()
+        f0, f1 = self._f0, self._f1
+
+        def interpolant(t):
+            s = (t - t0) / h
+            h00 = (1 + 2 * s) * (1 - s) ** 2
+            h10 = s * (1 - s) ** 2
+            h01 = s**2 * (3 - 2 * s)
+            h11 = s**2 * (s - 1)
+            return h00 * y0 + h10 * h * f0 + h01 * y1 + h11 * h * f1
+
+        return interpolant
+
+
+class Euler(FixedStep):
+    """
+    Forward Euler integrator, first order
+    """
+
+    order = 1
+
+    def _step(self, t, h):
+        f0 = self._f0_eval(t, self.y)
+        self.y += h * f0
+
+
+class Heun(FixedStep):
+    """
+    Heun's method, a second order Runge-Kutta integrator
+    """
+
+    order = 2
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._ytmp = np.empty_like(self.y)
+
+    def _step(self, t, h):
+        y = self.y
+        ytmp = self._ytmp
+
+        f0 = self._f0_eval(t, y)
+        np.multiply(h, f0, out=ytmp)
+        ytmp += y
+        f1 = self.fun(t + h, ytmp)
+
+        y += 0.5 * h * (f0 + f1)
+
+
+class RK4(FixedStep):
+    """
+    Classical fourth order Runge-Kutta integrator
+    """
+
+    order = 4
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._ytmp = np.empty_like(self.y)
+        self._ksum = np.empty_like(self.y)
+
+    def _step(self, t, h):
+        y = self.y
+        ytmp = self._ytmp
+        ksum = self._ksum
+
+        k1 = self._f0_eval(t, y)
+        np.multiply(0.5 * h, k1, out=ytmp)
+        ytmp += y
+        k2 = self.fun(t + 0.5 * h, ytmp)
+
+        np.multiply(0.5 * h, k2, out=ytmp)
+        ytmp += y
+        k3 = self.fun(t + 0.5 * h, ytmp)
+
+        np.multiply(h, k3, out=ytmp)
+        ytmp += y
+        k4 = self.fun(t + h, ytmp)
+
+        # y += h/6 (k1 + 2 k2 + 2 k3 + k4)
+        np.add(k2, k3, out=ksum)
+        ksum *= 2
+        ksum += k1
+        ksum += k4
+        ksum *= h / 6
+        y += ksum
+
+
+def extend(integrator, t_bound, h_abs=None):
+    """
+    Continue integration to a new final time
+
+    :param integrator: an integrator that has finished
+    :type integrator: FixedStep or scipy.integrate.OdeSolver
+    :param t_bound: new final time
+    :type t_bound: float
+    :param h_abs: step size proposed by the integrator before its last step,
+        defaults to None
+    :type h_abs: float, optional
+    :return: True if the integrator can continue, else False
+    :rtype: bool
+
+    Sets a new final time for an integrator so that integration can continue
+    after an event, for example a clock tick, without creating a new
+    integrator.  The derivative at the integrator's current time is discarded
+    since the event may have changed it, but the step size is retained.
+
+    The last step may have been shortened, perhaps to almost zero, to end at
+    the previous final time.  If ``h_abs`` is given the integrator continues
+    with at least this step size.
+
+    This is supported for the fixed-step integrators and the explicit
+    Runge-Kutta integrators ``RK23``, ``RK45`` and ``DOP853``.
+    """
+    if isinstance(integrator, FixedStep):
+        integrator._f0 = None
+        integrator._f1 = None
+    elif isinstance(integrator, (integrate.RK23, integrate.RK45, integrate.DOP853)):
+        # the first stage of the next step
+        integrator.f = integrator.fun(integrator.t, integrator.y)
+        if h_abs is not None:
+            integrator.h_abs = max(integrator.h_abs, h_abs)
+    else:
+        return False
+    integrator.t_bound = t_bound
+    integrator.status = "running" if t_bound > integrator.t else "finished"
+    return True
+
+
+# fixed-step integrators by name, as accepted by BDSim.run
+fixedstep_solvers = {
+    "euler": Euler,
+    "heun": Heun,
+    "rk4": RK4,
+}
+
+# scipy.integrate solvers that use the Jacobian of the state derivative, those
+# that require it as a dense array are True
+jacobian_solvers = {
+    "BDF": False,
+    "Radau": False,
+    "LSODA": True,
+}
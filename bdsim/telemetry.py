@@ -0,0 +1,291 @@
+"""
+Telemetry from the real-time loop
+
+A :class:`RingBuffer` holds the most recent samples of the watched signals of
+a real-time run, see :meth:`BDRealTime.run`, in a preallocated NumPy array.
+Each sample is a row whose first element is the time and whose other elements
+are the watched signals, flattened.  The real-time loop is the single
+producer: it writes a row in place and then advances a counter, so writing
+neither blocks nor allocates memory, and memory use does not grow with the
+length of the run.  When the buffer is full the oldest samples are
+overwritten.
+
+A :class:`RingReader` reads the samples written since its last read, in
+another thread, or in another process if the buffer is in shared memory, and
+counts the samples that were overwritten before it could read them.  A
+:class:`TelemetryWriter` is a thread that streams the samples to a file or a
+socket, for example::
+
+    ring = RingBuffer(capacity=10_000)
+    writer = TelemetryWriter(ring, "telemetry.bin")
+    writer.start()
+    out = sim.run(bd, 3600, dt=0.001, watch=[u, y], telemetry=ring)
+    writer.stop()
+
+    data = np.fromfile("telemetry.bin").reshape((-1, ring.width))
+"""
+
+import threading
+
+import numpy as np
+
+
+class RingBuffer:
+    """
+    Single-producer ring buffer of telemetry samples
+
+    :ivar capacity: number of samples held
+    :vartype capacity: int
+    :ivar width: number of elements in each sample, including the time
+    :vartype width: int
+    :ivar data: the samples, one per row
+    :vartype data: ndarray(capacity, width)
+    :ivar name: name of the shared memory block, or None
+    :vartype name: str
+
+    The buffer is allocated when the sizes of the signals are known, either
+    by the constructor or by :meth:`allocate`.  The number of samples written
+    is a 64-bit integer updated by a single aligned store after the sample is
+    written, so a reader never needs a lock.
+    """
+
+    def __init__(self, capacity=4096, sizes=None, dtype=np.float64, shared=False):
+        """
+        :param capacity: number of samples held, defaults to 4096
+        :type capacity: int, optional
+        :param sizes: number of elements of each signal, defaults to None
+        :type sizes: list of int, optional
+        :param dtype: type of the samples, defaults to float64
+        :type dtype: numpy.dtype or str, optional
+        :param shared: allocate the buffer in shared memory so that it can be
+            read by another process, defaults to False
+        :type shared: bool, optional
+        """
+        self.capacity = capacity
+        self.dtype = np.dtype(dtype)
+        self.shared = shared
+        self.name = None
+        self.width = None
+        self.data = None
+        self._shm = None
+        self._owner = True
+        if sizes is not None:
+            self.allocate(sizes)
+
+    @classmethod
+    def attach(cls, name, capacity, sizes, dtype=np.float64):
+        """
+        Attach to a ring buffer in shared memory
+
+        :param name: name of the shared memory block, the :attr:`name` of the
+            buffer
+        :type name: str
+        :param capacity: number of samples held by the buffer
+        :type capacity: int
+        :param sizes: number of elements of each signal
+        :type sizes: list of int
+        :param dtype: type of the samples, defaults to float64
+        :type dtype: numpy.dtype or str, optional
+        :return: the ring buffer
+        :rtype: RingBuffer
+
+        Used by a reader in another process.
+        """
+        from multiprocessing import shared_memory
+
+        ring = cls(capacity, dtype=dtype, shared=True)
+        ring._owner = False
+        ring._shm = shared_memory.SharedMemory(name=name)
+        ring._layout(sizes, ring._shm.buf)
+        return ring
+
+    def allocate(self, sizes):
+        """
+        Allocate the buffer
+
+        :param sizes: number of elements of each signal
+        :type sizes: list of int
+        """
+        self.close()
+        width = 1 + sum(sizes)
+        nbytes = 8 + self.capacity * width * self.dtype.itemsize
+        if self.shared:
+            from multiprocessing import shared_memory
+
+            self._shm = shared_memory.SharedMemory(create=True, size=nbytes)
+            self.name = self._shm.name
+            buffer = self._shm.buf
+        else:
+            buffer = bytearray(nbytes)
+        self._layout(sizes, buffer)
+        self._head[0] = 0
+
+    def _layout(self, sizes, buffer):
+        # the count of samples written, followed by the samples
+        self.width = 1 + sum(sizes)
+        self._head = np.ndarray((1,), dtype=np.int64, buffer=buffer)
+        self.data = np.ndarray(
+            (self.capacity, self.width), dtype=self.dtype, buffer=buffer, offset=8
+        )
+
+        # where each signal goes in a row, scalars by index
+        self._slices = []
+        i = 1
+        for n in sizes:
+            self._slices.append(i if n == 1 else slice(i, i + n))
+            i += n
+
+    def __len__(self):
+        """
+        Number of samples written
+
+        :return: number of samples written since the buffer was allocated
+        :rtype: int
+
+        Only the last :attr:`capacity` of them are held.
+        """
+        if self.data is None:
+            return 0
+        return int(self._head[0])
+
+    def write(self, t, values):
+        """
+        Write a sample
+
+        :param t: time
+        :type t: float
+        :param values: value of each signal
+        :type values: list
+
+        Overwrites the oldest sample if the buffer is full.
+        """
+        head = self._head
+        row = self.data[head[0] % self.capacity]
+        row[0] = t
+        for s, value in zip(self._slices, values):
+            if s.__class__ is slice:
+                row[s] = np.ravel(value)
+            else:
+                row[s] = value
+        head[0] += 1  # publish the sample
+
+    def close(self):
+        """
+        Release the shared memory
+
+        The shared memory block is removed when the buffer that created it is
+        closed.
+        """
+        if self._shm is not None:
+            self._head = self.data = None
+            self._shm.close()
+            if self._owner:
+                self._shm.unlink()
+            self._shm = None
+
+
+class RingReader:
+    """
+    Reader of a ring buffer
+
+    :ivar cursor: number of samples written before the next to be read
+    :vartype cursor: int
+    :ivar lost: number of samples overwritten before they were read
+    :vartype lost: int
+
+    Reads the samples of a :class:`RingBuffer` written since the last read.  A
+    buffer can have any number of readers, they do not affect the producer.
+    """
+
+    def __init__(self, ring):
+        """
+        :param ring: the ring buffer
+        :type ring: RingBuffer
+        """
+        self.ring = ring
+        self.cursor = 0
+        self.lost = 0
+
+    def read(self):
+        """
+        Read the new samples
+
+        :return: the samples written since the last read, one per row
+        :rtype: ndarray(N, width)
+
+        The samples are copied from the buffer.  Samples that were overwritten
+        before they could be read, including any overwritten while they were
+        copied, are skipped and counted in :attr:`lost`.
+        """
+        ring = self.ring
+        if ring.data is None:
+            return np.zeros((0, 0), dtype=ring.dtype)
+        capacity = ring.capacity
+        head = int(ring._head[0])
+        start = max(self.cursor, head - capacity)
+        rows = ring.data[np.arange(start, head) % capacity]
+
+        # the producer writes sample n over sample n - capacity before it
+        # advances the count past n
+        valid = int(ring._head[0]) - capacity + 1
+        if valid > start:
+            rows = rows[valid - start :]
+            start = valid
+        self.lost += start - self.cursor
+        self.cursor = max(start, head)
+        return rows
+
+
+class TelemetryWriter(threading.Thread):
+    """
+    Stream a ring buffer to a file
+
+    A thread that periodically reads the new samples from a
+    :class:`RingBuffer` and writes them as raw bytes, one row after another,
+    to a file.  The file can be any binary file object, for example
+    ``socket.makefile("wb")`` to stream to a local socket.
+    """
+
+    def __init__(self, ring, file, interval=0.05):
+        """
+        :param ring: the ring buffer
+        :type ring: RingBuffer
+        :param file: path or binary file object to write to
+        :type file: str or file object
+        :param interval: time between reads in seconds, defaults to 0.05
+        :type interval: float, optional
+        """
+        super().__init__(daemon=True)
+        self.reader = RingReader(ring)
+        self.file = file
+        self.interval = interval
+        self._done = threading.Event()
+
+    def run(self):
+        if isinstance(self.file, str):
+            f = open(self.file, "wb")
+        else:
+            f = self.file
+        try:
+            while not self._done.wait(self.interval):
+                self._drain(f)
+            self._drain(f)
+        finally:
+            if f is not self.file:
+                f.close()
+            else:
+                f.flush()
+
+    def _drain(self, f):
+        rows = self.reader.read()
+        if rows.size > 0:
+            f.write(rows.tobytes())
+
+    def stop(self):
+        """
+        Stop the thread
+
+        The samples not yet read are written before the thread stops.
+        """
+        self._done.set()
+        self.join()
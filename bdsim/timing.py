@@ -0,0 +1,217 @@
+"""
+Execution time histograms
+
+A :class:`Profiler` records the time taken by every block of a compiled block
+diagram each time it is evaluated, and the time taken by every group of the
+execution plan, see :meth:`BlockDiagram.schedule_generate`.  The times are
+counted in :class:`Histogram` buckets whose width grows with the value, like
+an HDR histogram, so a histogram has a fixed size and gives percentiles with
+a bounded relative error over a wide range of times.
+
+The profiler is attached to the evaluation kernel, for example::
+
+    kernel = bd._kernel
+    kernel.profile = Profiler(kernel)
+
+and :meth:`BlockDiagram.schedule_evaluate` then times the blocks.
+``BDRealTime.run(profile=True)`` does this, prints a report after the run and
+returns the profiler as the attribute ``profile`` of its results.
+"""
+
+import numpy as np
+from ansitable import ANSITable, Column
+
+
+class Histogram:
+    """
+    Histograms of times with logarithmic buckets
+
+    Holds a histogram for each of ``n`` items.  Times are integers, in
+    nanoseconds.  Times less than :math:`2^b` each have a bucket, and above
+    that each power of two range is split into :math:`2^{b-1}` buckets, so the
+    relative error of a value is less than :math:`2^{1-b}`.  For the default
+    :math:`b=5` that is about 6%.  Times greater than ``maxvalue`` are counted
+    in the last bucket.
+    """
+
+    def __init__(self, n, bits=5, maxvalue=2**40):
+        """
+        :param n: number of histograms
+        :type n: int
+        :param bits: number of bits resolved, defaults to 5
+        :type bits: int, optional
+        :param maxvalue: largest value resolved in ns, defaults to about 18 min
+        :type maxvalue: int, optional
+        """
+        self.bits = bits
+        self._half = 1 << (bits - 1)
+        self.nbuckets = self._index(maxvalue) + 1
+        self.counts = np.zeros((n, self.nbuckets), dtype=np.int64)
+        self.max = np.zeros((n,), dtype=np.int64)
+
+    def _index(self, value):
+        shift = value.bit_length() - self.bits
+        if shift <= 0:
+            return value
+        return shift * self._half + (value >> shift)
+
+    def _upper(self, index):
+        # the largest value counted in the buckets
+        index = np.asarray(index)
+        shift = np.maximum(index // self._half - 1, 0)
+        m = index - shift * self._half
+        return ((m + 1) << shift) - 1
+
+    def record(self, i, value):
+        """
+        Count a time
+
+        :param i: index of the histogram
+        :type i: int
+        :param value: time in ns
+        :type value: int
+        """
+        j = self._index(value)
+        if j >= self.nbuckets:
+            j = self.nbuckets - 1
+        self.counts[i, j] += 1
+        if value > self.max[i]:
+            self.max[i] = value
+
+    def __len__(self):
+        return self.counts.shape[0]
+
+    @property
+    def n(self):
+        """
+        Number of times counted
+
+        :return: number of times counted in each histogram
+        :rtype: ndarray(n)
+        """
+        return self.counts.sum(axis=1)
+
+    def percentile(self, p):
+        """
+        Percentile of the times
+
+        :param p: percentile, in the range 0 to 100
+        :type p: float
+        :return: percentile of each histogram in seconds, NaN if it is empty
+        :rtype: ndarray(n)
+
+        The value is the upper limit of the bucket that holds the percentile,
+        so it errs on the high side.
+        """
+        cumulative = self.counts.cumsum(axis=1)
+        total = cumulative[:, -1]
+        rank = np.ceil(total * p / 100.0).clip(min=1)
+        index = (cumulative < rank[:, np.newaxis]).sum(axis=1)
+        value = np.minimum(self._upper(index), self.max) * 1e-9
+        return np.where(total > 0, value, np.nan)
+
+
+class Profiler:
+    """
+    Execution times of the blocks of an evaluation kernel
+
+    :ivar names: names of the blocks, in evaluation order
+    :vartype names: list of str
+    :ivar groups: plan group of each block
+    :vartype groups: list of int
+    :ivar blocks: execution time of each block
+    :vartype blocks: Histogram
+    :ivar plan: execution time of each plan group
+    :vartype plan: Histogram
+
+    Fused and parallel groups of blocks, see :mod:`bdsim.fusion` and
+    :mod:`bdsim.parallel`, are timed as one block.  The time of a plan group is
+    the sum of the times of its blocks in one evaluation.
+    """
+
+    def __init__(self, kernel, bits=5):
+        """
+        :param kernel: evaluation kernel
+        :type kernel: BDStruct
+        :param bits: number of bits resolved by the histograms, defaults to 5
+        :type bits: int, optional
+        """
+        blocks = [b for b, *_ in kernel.folded + kernel.evallist]
+        blocks.extend([b for b, _ in kernel.sinks])
+
+        def sequence(b):
+            if hasattr(b, "blocks"):
+                return max([m._sequence for m in b.blocks])
+            return b._sequence
+
+        self.names = [str(b) for b in blocks]
+        self.groups = [sequence(b) for b in blocks]
+        self._index = {b: i for i, b in enumerate(blocks)}
+        self._plan = sorted(set(self.groups))
+        plan = {g: i for i, g in enumerate(self._plan)}
+        self._group = [plan[g] for g in self.groups]
+        self._sum = [0] * len(self._plan)
+        self.blocks = Histogram(len(blocks), bits=bits)
+        self.plan = Histogram(len(self._plan), bits=bits)
+
+    def record(self, block, dt):
+        """
+        Record the execution time of a block
+
+        :param block: the block
+        :type block: Block
+        :param dt: execution time in ns
+        :type dt: int
+        """
+        i = self._index[block]
+        self.blocks.record(i, dt)
+        self._sum[self._group[i]] += dt
+
+    def end(self):
+        """
+        End an evaluation of the diagram
+
+        Records the execution time of each plan group.
+        """
+        for g, dt in enumerate(self._sum):
+            if dt > 0:
+                self.plan.record(g, dt)
+                self._sum[g] = 0
+
+    percentiles = (50, 99, 99.9)
+
+    def report(self, **kwargs):
+        """
+        Print the execution time percentiles
+
+        Prints a table of the 50th, 99th and 99.9th percentiles and the maximum
+        of the execution time of each block, and of each plan group, in
+        microseconds.
+        """
+
+        def table(title, names, hist):
+            table = ANSITable(
+                Column(title, headalign="^", colalign="<"),
+                Column("n", headalign="^", colalign=">"),
+                *[
+                    Column(f"p{p:g} (μs)", headalign="^", colalign=">", fmt="{:.1f}")
+                    for p in self.percentiles
+                ],
+                Column("max (μs)", headalign="^", colalign=">", fmt="{:.1f}"),
+                border="thin",
+            )
+            n = hist.n
+            values = [hist.percentile(p) * 1e6 for p in self.percentiles]
+            for i, name in enumerate(names):
+                if n[i] > 0:
+                    table.row(
+                        name, n[i], *[v[i] for v in values], hist.max[i] * 1e-3
+                    )
+            table.print(**kwargs)
+
+        table(
+            "block",
+            [f"{name} [{g}]" for name, g in zip(self.names, self.groups)],
+            self.blocks,
+        )
+        table("plan group", [str(g) for g in self._plan], self.plan)
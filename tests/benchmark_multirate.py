@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Benchmark a multirate simulation: continuous plant with a fast discrete-time
+controller.
+
+The clock splits the simulation into one integration interval per tick.
+Compares creating a new integrator for each interval (restart=True, the
+previous behaviour) with continuing one integrator across the ticks.
+
+Run as::
+
+    python tests/benchmark_multirate.py [T [period]]
+
+defaults to a 10 s simulation with a 1 kHz clock.
+"""
+
+import sys
+import time
+
+import numpy as np
+
+import bdsim
+
+
+def benchmark(T=10.0, period=1e-3, solver="RK45", restart=False):
+    sim = bdsim.BDSim(graphics=False, progress=False, quiet=True)
+    bd = sim.blockdiagram()
+
+    # second order plant under discrete-time proportional control
+    clock = bd.clock(period, "s")
+    plant = bd.LTI_SISO(1, [1, 2, 1])
+    demand = bd.STEP(T=0.1)
+    error = bd.SUM("+-")
+    controller = bd.ZOH(clock)
+    gain = bd.GAIN(5)
+
+    bd.connect(demand, error[0])
+    bd.connect(plant, error[1])
+    bd.connect(error, gain)
+    bd.connect(gain, controller)
+    bd.connect(controller, plant)
+
+    bd.compile(report=False, verbose=False)
+
+    t0 = time.perf_counter()
+    out = sim.run(bd, T, solver=solver, restart=restart)
+    elapsed = time.perf_counter() - t0
+
+    return sim.simstate, out, elapsed
+
+
+if __name__ == "__main__":
+    T = float(sys.argv[1]) if len(sys.argv) > 1 else 10.0
+    period = float(sys.argv[2]) if len(sys.argv) > 2 else 1e-3
+
+    print(f"T = {T} s, clock period = {period} s")
+    print(f"{'solver':8s} {'mode':10s} {'starts':>8s} {'evals':>8s} {'time':>8s}")
+    for solver in ("RK45", "RK23", "rk4"):
+        results = []
+        for restart in (True, False):
+            simstate, out, elapsed = benchmark(T, period, solver, restart)
+            mode = "restart" if restart else "continue"
+            print(
+                f"{solver:8s} {mode:10s} {simstate.nstarts:8d}"
+                f" {simstate.count:8d} {elapsed:7.2f}s"
+            )
+            results.append(out)
+        print(
+            f"  final state difference {np.abs(results[0].x[-1] - results[1].x[-1]).max():.2e}"
+        )
@@ -2,6 +2,7 @@
 
 import numpy as np
 import math
+import tempfile
 
 import bdsim
 import unittest
@@ -126,6 +127,369 @@ class BDSimTest(unittest.TestCase):
         self.assertIsInstance(out.ynames, list)
         self.assertEqual(len(out.ynames), 0)
 
+    def test_sim_engine(self):
+        # same results from both evaluation engines
+
+        sim = bdsim.BDSim(graphics=None, progress=False)
+        bd = sim.blockdiagram()
+
+        integ = bd.INTEGRATOR(x0=1)
+        gain = bd.GAIN(-2)
+        step = bd.STEP(T=1)
+        sum = bd.SUM("++")
+        bd.connect(step, sum[0])
+        bd.connect(gain, sum[1])
+        bd.connect(sum, integ)
+        bd.connect(integ, gain)
+
+        bd.compile()
+        out1 = sim.run(bd, 2, engine="plan", watch=[gain])
+        out2 = sim.run(bd, 2, engine="signals", watch=[gain])
+        self.assertEqual(bd.engine, "signals")
+
+        nt.assert_equal(out1.t, out2.t)
+        nt.assert_equal(out1.x, out2.x)
+        nt.assert_equal(out1.y0, out2.y0)
+
+    def test_sim_watch(self):
+        # watched blocks are evaluated once per step, not once per port
+        sim = bdsim.BDSim(graphics=None, progress=False)
+        bd = sim.blockdiagram()
+
+        ncalls = 0
+
+        def f(x):
+            nonlocal ncalls
+            ncalls += 1
+            return 2 * x, 3 * x
+
+        integ = bd.INTEGRATOR()
+        wave = bd.WAVEFORM(wave="sine", freq=0.5)
+        func = bd.FUNCTION(f, nin=1, nout=2)
+        bd.connect(wave, integ)
+        bd.connect(integ, func)
+        bd.connect(func[0], bd.NULL())
+        bd.connect(func[1], bd.NULL())
+
+        bd.compile()
+        ncalls = 0
+        out = sim.run(bd, 4, watch=[func[0], func[1]])
+
+        self.assertEqual(ncalls, sim.simstate.count + len(out.t))
+        nt.assert_almost_equal(out.y0, 2 * out.x)
+        nt.assert_almost_equal(out.y1, 3 * out.x)
+
+    def test_sim_restart(self):
+        # one integrator is continued across clock ticks
+        def run(**kwargs):
+            sim = bdsim.BDSim(graphics=None, progress=False)
+            bd = sim.blockdiagram()
+
+            clock = bd.clock(0.05, "s")
+            plant = bd.LTI_SISO(1, [1, 2, 1])
+            error = bd.SUM("+-")
+            zoh = bd.ZOH(clock)
+            bd.connect(bd.STEP(T=0.1), error[0])
+            bd.connect(plant, error[1])
+            bd.connect(error, zoh)
+            bd.connect(zoh, plant)
+
+            bd.compile()
+            out = sim.run(bd, 2, **kwargs)
+            return out, sim.simstate.nstarts
+
+        for solver in ("RK45", "rk4"):
+            out1, nstarts = run(dt=0.01, solver=solver, restart=True)
+            self.assertEqual(nstarts, 40)
+            out2, nstarts = run(dt=0.01, solver=solver)
+            self.assertEqual(nstarts, 1)
+            nt.assert_almost_equal(out1.x[-1], out2.x[-1], decimal=6)
+
+        # other solvers are restarted at each tick
+        out, nstarts = run(solver="LSODA")
+        self.assertEqual(nstarts, 40)
+
+    def test_sim_jacobian(self):
+        # stiff system, implicit solvers are given the diagram's Jacobian
+        sim = bdsim.BDSim(graphics=None, progress=False)
+        bd = sim.blockdiagram()
+
+        A = np.array([[-1000.0, 1], [0, -1]])
+        plant = bd.LTI_SS(A=A, B=np.r_[0.0, 1], C=np.r_[1.0, 1], x0=[1, 1])
+        error = bd.SUM("+-")
+        gain = bd.GAIN(2)
+        bd.connect(bd.STEP(), error[0])
+        bd.connect(plant, error[1])
+        bd.connect(error, gain)
+        bd.connect(gain, plant)
+
+        bd.compile()
+        for solver in ("BDF", "Radau", "LSODA"):
+            out1 = sim.run(bd, 2, solver=solver)
+            count1 = sim.simstate.count
+            # estimate the Jacobian by finite differences
+            out2 = sim.run(bd, 2, solver=solver, solver_args={"jac": None})
+            count2 = sim.simstate.count
+            self.assertLess(count1, count2)
+            nt.assert_almost_equal(out1.x[-1], out2.x[-1], decimal=4)
+
+    def test_sim_sparsity(self):
+        # independent stiff plants, the solvers estimate the Jacobian by
+        # finite differences, perturbing the plants together
+        sim = bdsim.BDSim(graphics=None, progress=False)
+        bd = sim.blockdiagram()
+
+        A = np.array([[-1000.0, 1], [0, -1]])
+        for i in range(5):
+            plant = bd.LTI_SS(A=A, B=np.r_[0.0, 1], C=np.r_[1.0, 1], x0=[1, 1])
+            gain = bd.FUNCTION(lambda x: -2 * x)
+            bd.connect(plant, gain)
+            bd.connect(gain, plant)
+
+        bd.compile()
+        for solver in ("BDF", "Radau", "LSODA"):
+            out1 = sim.run(bd, 2, solver=solver)
+            count1 = sim.simstate.count
+            # estimate the Jacobian by finite differences of all states
+            args = {"lband": None} if solver == "LSODA" else {"jac_sparsity": None}
+            out2 = sim.run(bd, 2, solver=solver, solver_args=args)
+            count2 = sim.simstate.count
+            self.assertLess(count1, count2)
+            nt.assert_almost_equal(out1.x[-1], out2.x[-1], decimal=4)
+
+    def test_sim_decimate(self):
+        sim = bdsim.BDSim(graphics=None, progress=False)
+        bd = sim.blockdiagram()
+
+        integ = bd.INTEGRATOR()
+        step = bd.STEP(T=1)
+        bd.connect(step, integ)
+
+        bd.compile()
+        out1 = sim.run(bd, 2)
+        out2 = sim.run(bd, 2, decimate=10)
+
+        self.assertEqual(len(out2.t), len(out1.t) // 10)
+        nt.assert_equal(out2.t, out1.t[9::10])
+        nt.assert_equal(out2.x, out1.x[9::10])
+
+    def test_sim_t_eval(self):
+        sim = bdsim.BDSim(graphics=None, progress=False)
+        bd = sim.blockdiagram()
+
+        integ = bd.INTEGRATOR()
+        wave = bd.WAVEFORM(wave="sine", freq=0.5)
+        gain = bd.GAIN(2)
+        bd.connect(wave, integ)
+        bd.connect(integ, gain)
+        bd.connect(gain, bd.NULL())
+
+        bd.compile()
+        t = np.linspace(0, 4, 41)
+        out = sim.run(bd, 4, t_eval=t, watch=[gain])
+
+        nt.assert_equal(out.t, t)
+        self.assertEqual(out.x.shape, (41, 1))
+        nt.assert_almost_equal(out.x[:, 0], (1 - np.cos(np.pi * t)) / np.pi, decimal=5)
+
+        # watched signals are evaluated at the grid times
+        nt.assert_almost_equal(out.y0, 2 * out.x)
+
+
+class EnsembleTest(unittest.TestCase):
+    def test_ensemble(self):
+        sim = bdsim.BDSim(graphics=None, progress=False)
+        bd = sim.blockdiagram()
+
+        integ = bd.INTEGRATOR(x0=[1, 0])
+        gain = bd.GAIN(np.array([[0, 1], [-1, -0.1]]), premul=True)
+        func = bd.FUNCTION(lambda x: x[..., 0])
+        lti = bd.LTI_SS(A=np.array([[-1.0]]), B=np.array([1.0]), C=np.array([2.0]))
+        bd.connect(integ, gain)
+        bd.connect(gain, integ)
+        bd.connect(integ, func)
+        bd.connect(func, lti)
+        bd.connect(lti, bd.NULL())
+
+        bd.compile()
+        x0 = np.random.default_rng(0).normal(size=(5, 3))
+        t = np.linspace(0, 5, 11)
+        out = sim.run(bd, 5, ensemble=5, x0=x0, t_eval=t, watch=[lti])
+        self.assertEqual(bd.ensemble, 5)
+        self.assertEqual(out.x.shape, (11, 5, 3))
+        self.assertEqual(out.y0.shape, (11, 5))
+
+        # same as simulating each member on its own
+        for i in range(5):
+            out1 = sim.run(bd, 5, x0=x0[i], t_eval=t, watch=[lti])
+            self.assertIsNone(bd.ensemble)
+            nt.assert_almost_equal(out.x[:, i, :], out1.x, decimal=5)
+            nt.assert_almost_equal(out.y0[:, i], out1.y0, decimal=5)
+
+    def test_ensemble_subsystem(self):
+        # a premultiplying gain imported from a subsystem
+        sim = bdsim.BDSim(graphics=None, progress=False)
+        ss = sim.blockdiagram(name="oscillator")
+        gain = ss.GAIN(np.array([[0, 1], [-1, -0.1]]), premul=True)
+        ss.connect(ss.INPORT(1), gain)
+        ss.connect(gain, ss.OUTPORT(1))
+
+        bd = sim.blockdiagram()
+        integ = bd.INTEGRATOR(x0=[1, 0])
+        sub = bd.SUBSYSTEM(ss, name="sub")
+        bd.connect(integ, sub)
+        bd.connect(sub, integ)
+
+        bd.compile()
+        x0 = np.random.default_rng(0).normal(size=(3, 2))
+        t = np.linspace(0, 5, 11)
+        out = sim.run(bd, 5, ensemble=3, x0=x0, t_eval=t)
+        for i in range(3):
+            out1 = sim.run(bd, 5, x0=x0[i], t_eval=t)
+            nt.assert_almost_equal(out.x[:, i, :], out1.x, decimal=5)
+
+    def test_ensemble_x0(self):
+        sim = bdsim.BDSim(graphics=None, progress=False)
+        bd = sim.blockdiagram()
+
+        integ = bd.INTEGRATOR(x0=[1, 2])
+        bd.connect(bd.CONSTANT(1), integ)
+
+        bd.compile()
+        out = sim.run(bd, 1, ensemble=3, t_eval=[0, 1])
+
+        # block initial state is broadcast to all members
+        nt.assert_almost_equal(out.x[0], np.tile([1, 2], (3, 1)))
+        nt.assert_almost_equal(out.x[1], np.tile([2, 3], (3, 1)))
+
+
+class SweepTest(unittest.TestCase):
+    def diagram(self):
+        sim = bdsim.BDSim(graphics=None, progress=False)
+        bd = sim.blockdiagram()
+
+        integ = bd.INTEGRATOR(x0=1, name="integ")
+        gain = bd.GAIN(-2, name="gain")
+        bd.connect(integ, gain)
+        bd.connect(gain, integ)
+
+        bd.compile()
+        return sim, bd
+
+    def test_sweep(self):
+        sim, bd = self.diagram()
+        t = np.linspace(0, 1, 11)
+
+        out = sim.sweep(
+            bd,
+            {"gain:K": [-1, -2], "integ:x0": [1, 2]},
+            T=1,
+            t_eval=t,
+            watch=[bd.blocknames["gain"]],
+            workers=2,
+        )
+
+        self.assertEqual(len(out.params), 4)
+        self.assertEqual(out.params[1], {"gain:K": -1, "integ:x0": 2})
+        self.assertEqual(out.t.shape, (4, 11))
+        self.assertEqual(out.x.shape, (4, 11, 1))
+        self.assertEqual(out.y0.shape, (4, 11, 1))
+        self.assertEqual(out.xnames, ["integx0"])
+
+        for i, p in enumerate(out.params):
+            nt.assert_almost_equal(
+                out.x[i, :, 0], p["integ:x0"] * np.exp(p["gain:K"] * t), decimal=3
+            )
+
+        # the original diagram is unchanged
+        self.assertEqual(bd.blocknames["gain"].K, -2)
+
+    def test_sweep_handler(self):
+        # the transfer function block rebuilds its state-space model when
+        # its numerator is changed
+        sim = bdsim.BDSim(graphics=None, progress=False)
+        bd = sim.blockdiagram()
+        tf = bd.LTI_SISO(1, [1, 1], name="tf")
+        bd.connect(bd.STEP(), tf)
+        bd.compile()
+
+        out = sim.sweep(bd, {"tf:num": [[1], [2], [5]]}, T=3, t_eval=[3], watch=[tf])
+        y = out.y0[:, -1]
+        nt.assert_almost_equal(y / y[0], [1, 2, 5], decimal=3)
+
+    def test_sweep_stream(self):
+        # the workers neither stream nor save their results
+        sim, bd = self.diagram()
+        with tempfile.TemporaryDirectory() as dir:
+            sim.options.set(stream=dir, outfile=str(Path(dir) / "bd.out"))
+            out = sim.sweep(bd, {"gain:K": [-1, -2, -3, -4]}, T=1, workers=4)
+            self.assertEqual(len(out.x), 4)
+            self.assertEqual(list(Path(dir).iterdir()), [])
+        self.assertIsNotNone(sim.options.stream)
+
+    def test_montecarlo(self):
+        sim, bd = self.diagram()
+        t = np.linspace(0, 1, 11)
+
+        def sampler(rng):
+            return {"integ:x0": rng.uniform(1, 2)}
+
+        out1 = sim.montecarlo(bd, 3, sampler, T=1, t_eval=t, seed=0, workers=2)
+        out2 = sim.montecarlo(bd, 3, sampler, T=1, t_eval=t, seed=0, workers=2)
+
+        self.assertEqual(out1.x.shape, (3, 11, 1))
+        nt.assert_equal(out1.x, out2.x)
+        nt.assert_equal(out1.x[:, 0, 0], [p["integ:x0"] for p in out1.params])
+
+
+class TimeQTest(unittest.TestCase):
+    def test_pop(self):
+        q = bdsim.TimeQ()
+        self.assertEqual(len(q), 0)
+        self.assertEqual(q.pop(), (None, []))
+
+        q.push((3, "c"))
+        q.push((1, "a"))
+        q.push((2, "b1"))
+        q.push((2, "b2"))  # same time, pops in order pushed
+        q.push((2 + 1e-7, "b3"))
+        self.assertEqual(len(q), 5)
+        self.assertEqual(str(q), "TimeQ: len=5, first out (1, 'a')")
+
+        self.assertEqual(q.pop(), (1, ["a"]))
+        self.assertEqual(q.pop(dt=1e-6), (2, ["b1", "b2", "b3"]))
+        self.assertEqual(q.pop(dt=1e-6), (3, ["c"]))
+        self.assertEqual(len(q), 0)
+
+    def test_pop_until(self):
+        q = bdsim.TimeQ()
+        self.assertEqual(q.pop_until(1), [])
+
+        for t in [4, 0, 2, 1, 0, 3]:
+            q.push((t, str(t)))
+
+        self.assertEqual(q.pop_until(0), [(0, "0"), (0, "0")])
+        self.assertEqual(q.pop_until(2.5), [(1, "1"), (2, "2")])
+        self.assertEqual(q.pop_until(10), [(3, "3"), (4, "4")])
+        self.assertEqual(len(q), 0)
+
+    def test_sim_events(self):
+        sim = bdsim.BDSim(graphics=None, progress=False)
+        bd = sim.blockdiagram()
+
+        wave = bd.WAVEFORM(wave="square", freq=10, min=0, max=1)
+        integ = bd.INTEGRATOR()
+        bd.connect(wave, integ)
+
+        bd.compile()
+        out = sim.run(bd, 10, dt=0.05)
+
+        # integral of a 50% duty cycle square wave
+        self.assertAlmostEqual(out.x[-1, 0], 5, delta=0.1)
+
+        # events are declared one at a time
+        self.assertLessEqual(len(sim.simstate.eventq), 1)
+
 
 # ---------------------------------------------------------------------------------------#
 if __name__ == "__main__":
@@ -720,6 +720,355 @@ class WiringTest(unittest.TestCase):
         self.assertEqual(dst.inputs, [1.5])
 
 
+class EvaluateTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.sim = bdsim.BDSim(animation=False)  # create simulator
+
+    def test_kernel(self):
+        bd = self.sim.blockdiagram()
+
+        const1 = bd.CONSTANT(2)
+        const2 = bd.CONSTANT([1, 2])
+        int1 = bd.INTEGRATOR(x0=1)
+        int2 = bd.INTEGRATOR(x0=[4, 5])
+        gain = bd.GAIN(3)
+        dst = bd.NULL(2)
+
+        bd.connect(const1, int1)
+        bd.connect(const2, int2)
+        bd.connect(int1, gain)
+        bd.connect(gain, dst[0])
+        bd.connect(int2, dst[1])
+
+        bd.compile(verbose=False)
+        self.assertEqual(len(bd._kernel.evallist), 6 - 1)  # no sink blocks
+        self.assertEqual(len(bd._kernel.transfers), 2)
+        self.assertEqual(len(bd._kernel.sinks), 1)
+
+        x = np.r_[6, 7, 8]
+        xd = bd.schedule_evaluate(x=x, t=0)
+        nt.assert_equal(xd, [2, 1, 2])
+        nt.assert_equal(int1._x, [6])
+        nt.assert_equal(int2._x, [7, 8])
+        self.assertEqual(dst.inputs[0], 18)
+        nt.assert_equal(dst.inputs[1], [7, 8])
+
+        # the state vector passed in is never aliased
+        int2._x[0] = 100
+        nt.assert_equal(x, [6, 7, 8])
+
+        bd.schedule_evaluate(x=[1, 2, 3], t=0)
+        self.assertEqual(dst.inputs[0], 3)
+        nt.assert_equal(dst.inputs[1], [2, 3])
+
+    def test_kernel_deepcopy(self):
+        from copy import deepcopy
+
+        bd = self.sim.blockdiagram()
+
+        int1 = bd.INTEGRATOR(x0=1)
+        gain = bd.GAIN(-2)
+        bd.connect(int1, gain)
+        bd.connect(gain, int1)
+        bd.compile(verbose=False)
+
+        bd2 = deepcopy(bd)
+        self.assertIsNone(bd2._kernel)
+        nt.assert_equal(bd2.schedule_evaluate(x=[3], t=0), [-6])
+        nt.assert_equal(bd.schedule_evaluate(x=[4], t=0), [-8])
+
+    def test_kernel_deriv(self):
+        from bdsim.blocks.transfers import Integrator
+
+        class MyIntegrator(Integrator):
+            # overrides deriv but not deriv_into
+            def deriv(self, t, u, x):
+                return -x
+
+        bd = self.sim.blockdiagram()
+
+        const = bd.CONSTANT([1, 2])
+        int1 = bd.INTEGRATOR(x0=[0, 0], gain=2)
+        int2 = MyIntegrator(x0=[0, 0, 0], bd=bd)
+        lti = bd.LTI_SS(A=-np.eye(2), B=np.eye(2), C=np.r_[1, 1])
+        bd.connect(const, int1)
+        bd.connect(int1, int2)
+        bd.connect(int1, lti)
+
+        bd.compile(verbose=False)
+        inplace = {b: flag for b, _, _, _, flag in bd._kernel.transfers}
+        self.assertTrue(inplace[int1])
+        self.assertFalse(inplace[int2])
+        self.assertTrue(inplace[lti])
+
+        xd = bd.schedule_evaluate(x=[1, 2, 3, 4, 5, 6, 7], t=0)
+        nt.assert_equal(xd, [2, 4, -3, -4, -5, 2 - 6, 4 - 7])
+        self.assertIsNot(xd, bd._kernel.xdbuf)
+        nt.assert_equal(bd.getstate0(), np.zeros((7,)))
+
+    def test_engine_signals(self):
+        bd = self.sim.blockdiagram()
+
+        const = bd.CONSTANT([2, 3, 4, 5])
+        demux = bd.DEMUX(4)
+        int1 = bd.INTEGRATOR(x0=1)
+        sum = bd.SUM("+-")
+        dst1 = bd.NULL(4)
+        dst2 = bd.NULL(1)
+
+        bd.connect(const, demux)
+        bd.connect(demux[0:4], dst1[3:-1:-1])  # reversed, not contiguous
+        bd.connect(demux[0], sum[0])
+        bd.connect(int1, sum[1])
+        bd.connect(sum, int1)
+        bd.connect(int1, dst2)
+
+        self.assertEqual(bd.engine, "plan")
+        bd.compile(verbose=False)
+        self.assertIsNone(bd._kernel.signals)
+
+        bd.engine = "signals"
+        self.assertIsNone(bd._kernel)
+
+        xd = bd.schedule_evaluate(x=[5], t=0)
+        self.assertEqual(len(bd._kernel.signals), 7)
+        nt.assert_equal(xd, [2 - 5])
+        self.assertEqual(list(dst1.inputs), [5, 4, 3, 2])
+        self.assertEqual(dst2.inputs, [5])
+
+        with self.assertRaises(ValueError):
+            bd.engine = "foo"
+
+    def test_kernel_validate(self):
+        bd = self.sim.blockdiagram()
+
+        src = bd.FUNCTION(lambda: 1, nin=0)
+        src.output = lambda t, inports, x: 1  # not a list
+        dst = bd.NULL(1)
+        bd.connect(src, dst)
+
+        with self.assertRaises(AssertionError):
+            bd.compile(verbose=False)
+
+    def test_jacobian(self):
+        bd = self.sim.blockdiagram()
+
+        step = bd.STEP()
+        lti = bd.LTI_SS(A=np.array([[-1, 2], [0, -3]]), B=np.r_[0, 1], C=np.r_[1, 1])
+        sum = bd.SUM("+-")
+        gain = bd.GAIN(4)
+        int1 = bd.INTEGRATOR(x0=[0, 0])
+        gain2 = bd.GAIN(np.array([[1, 2], [3, 4]]), premul=True)
+        clock = bd.clock(0.1, "s")
+        zoh = bd.ZOH(clock)
+
+        bd.connect(step, sum[0])
+        bd.connect(lti, sum[1], zoh)
+        bd.connect(sum, gain)
+        bd.connect(gain, lti)
+        bd.connect(int1, gain2)
+        bd.connect(gain2, int1)
+        bd.connect(zoh, bd.NULL())
+        bd.compile(verbose=False)
+        self.assertTrue(bd._kernel.jacobian)
+
+        x = np.r_[1.0, 2, 3, 4]
+        J = bd.jacobian(1, x)
+        self.assertEqual(J.shape, (4, 4))
+
+        # compare with finite differences
+        Jfd = np.zeros((4, 4))
+        for i in range(4):
+            dx = np.zeros((4,))
+            dx[i] = 1e-6
+            Jfd[:, i] = (
+                bd.schedule_evaluate(x + dx, 1, sinks=False)
+                - bd.schedule_evaluate(x - dx, 1, sinks=False)
+            ) / 2e-6
+        nt.assert_almost_equal(J.toarray(), Jfd)
+        nt.assert_equal(
+            J.toarray(), [[-1, 2, 0, 0], [-4, -7, 0, 0], [0, 0, 1, 2], [0, 0, 3, 4]]
+        )
+
+        # a function block without a Jacobian
+        bd = self.sim.blockdiagram()
+        int1 = bd.INTEGRATOR(x0=1)
+        func = bd.FUNCTION(lambda x: -x)
+        bd.connect(int1, func)
+        bd.connect(func, int1)
+        bd.compile(verbose=False)
+        self.assertFalse(bd._kernel.jacobian)
+        self.assertIsNone(bd.jacobian(0, [1]))
+
+    def test_jacobian_subsystem(self):
+        # the state is fed back through the ports of a subsystem
+        ss = self.sim.blockdiagram(name="subsystem")
+        inp = ss.INPORT(1)
+        gain = ss.GAIN(np.array([[0, 1], [-1, -0.1]]), premul=True)
+        outp = ss.OUTPORT(1)
+        ss.connect(inp, gain)
+        ss.connect(gain, outp)
+
+        bd = self.sim.blockdiagram()
+        int1 = bd.INTEGRATOR(x0=[0, 0])
+        sub = bd.SUBSYSTEM(ss, name="sub")
+        bd.connect(int1, sub)
+        bd.connect(sub, int1)
+        bd.compile(verbose=False)
+        self.assertTrue(bd._kernel.jacobian)
+
+        x = np.r_[1.0, 2]
+        J = bd.jacobian(0, x)
+        Jfd = np.zeros((2, 2))
+        for i in range(2):
+            dx = np.zeros((2,))
+            dx[i] = 1e-6
+            Jfd[:, i] = (
+                bd.schedule_evaluate(x + dx, 0, sinks=False)
+                - bd.schedule_evaluate(x - dx, 0, sinks=False)
+            ) / 2e-6
+        nt.assert_almost_equal(J.toarray(), Jfd)
+        nt.assert_almost_equal(J.toarray(), [[0, 1], [-1, -0.1]])
+
+    def test_sparsity(self):
+        bd = self.sim.blockdiagram()
+
+        # int1 -> func -> int2 <- int2, int3 is independent
+        int1 = bd.INTEGRATOR(x0=[1, 2])
+        int2 = bd.INTEGRATOR(x0=0)
+        int3 = bd.INTEGRATOR(x0=0)
+        func = bd.FUNCTION(lambda x: x.sum())
+        sum = bd.SUM("++")
+        bd.connect(int1, func)
+        bd.connect(func, sum[0])
+        bd.connect(int2, sum[1])
+        bd.connect(sum, int2)
+        bd.connect(bd.CONSTANT(1), int1, int3)
+        bd.compile(verbose=False)
+
+        S = bd._kernel.sparsity.toarray()
+        nt.assert_equal(
+            S,
+            [
+                [1, 1, 0, 0],
+                [1, 1, 0, 0],
+                [1, 1, 1, 0],
+                [0, 0, 0, 1],
+            ],
+        )
+
+        # the members of an ensemble are independent
+        bd.ensemble = 2
+        bd.schedule_compile()
+        S2 = bd._kernel.sparsity.toarray()
+        self.assertEqual(S2.shape, (8, 8))
+        nt.assert_equal(S2[:4, :4], S)
+        nt.assert_equal(S2[4:, 4:], S)
+        self.assertFalse(S2[:4, 4:].any())
+
+    def test_schedule(self):
+        bd = self.sim.blockdiagram()
+
+        # const -> sum1 -> sum2 -> integ -> gain -> sum1, gain -> sum2
+        const = bd.CONSTANT(1)
+        sum1 = bd.SUM("++")
+        sum2 = bd.SUM("++")
+        integ = bd.INTEGRATOR(x0=0)
+        gain = bd.GAIN(2)
+        bd.connect(const, sum1[0])
+        bd.connect(sum1, sum2[0])
+        bd.connect(sum2, integ)
+        bd.connect(integ, gain)
+        bd.connect(gain, sum1[1], sum2[1])
+        bd.connect(sum2, bd.NULL())
+        bd.compile(verbose=False)
+
+        self.assertEqual(bd.plan, [[const, integ], [gain], [sum1], [sum2]])
+        self.assertEqual(bd._algebraic_loops(), [])
+
+    def test_algebraic_loops(self):
+        bd = self.sim.blockdiagram()
+
+        # two separate loops of function blocks, both are found
+        gain1 = bd.GAIN(2)
+        gain2 = bd.GAIN(3)
+        sum = bd.SUM("++")
+        bd.connect(bd.CONSTANT(1), sum[0])
+        bd.connect(sum, gain1)
+        bd.connect(gain1, gain2)
+        bd.connect(gain2, sum[1])
+        gain3 = bd.GAIN(4)
+        bd.connect(gain3, gain3)
+
+        self.assertRaises(RuntimeError, bd.compile, verbose=False)
+        self.assertEqual(bd._algebraic_loops(), [[gain1, gain2, sum], [gain3]])
+
+        # the loop is reported in wiring order, d -> f -> e -> d
+        bd = self.sim.blockdiagram()
+        d = bd.GAIN(1, name="d")
+        e = bd.GAIN(1, name="e")
+        f = bd.GAIN(1, name="f")
+        bd.connect(e, d)
+        bd.connect(d, f)
+        bd.connect(f, e)
+        self.assertRaises(RuntimeError, bd.compile, verbose=False)
+        self.assertEqual(bd._algebraic_loops(), [[d, f, e]])
+
+    def test_fold(self):
+        bd = self.sim.blockdiagram()
+
+        # const -> gain -> sum <- int, int is driven by the sum
+        # func is driven only by int and drives nothing
+        const = bd.CONSTANT(2)
+        gain = bd.GAIN(3)
+        sum = bd.SUM("+-")
+        integ = bd.INTEGRATOR(x0=1)
+        func = bd.FUNCTION(lambda x: x + 1)
+        unused = bd.GAIN(4)
+        bd.connect(const, gain)
+        bd.connect(gain, sum[0])
+        bd.connect(integ, sum[1], func)
+        bd.connect(sum, integ)
+        bd.connect(func, unused)
+
+        bd.compile(verbose=False)
+        evallist = [b for b, *_ in bd._kernel.evallist]
+        nt.assert_equal(bd.schedule_evaluate([1], 0), [5])
+
+        bd.compile(verbose=False, fold=True)
+        self.assertTrue(bd.fold)
+        kernel = bd._kernel
+        self.assertEqual([b for b, *_ in kernel.folded], [const, gain])
+        self.assertEqual(kernel.dead, {func, unused})
+        self.assertEqual(
+            [b for b, *_ in kernel.evallist],
+            [b for b in evallist if b not in (const, gain, func, unused)],
+        )
+        nt.assert_equal(bd.schedule_evaluate([1], 0), [5])
+        self.assertFalse(kernel.refold)
+
+        # the folded blocks are evaluated once
+        const.value = 1
+        nt.assert_equal(bd.schedule_evaluate([2], 0), [4])
+        bd.start()
+        nt.assert_equal(bd.schedule_evaluate([2], 0), [1])
+
+        # a changed parameter is seen on the next evaluation
+        const.set_param("value", 3)
+        nt.assert_equal(bd.schedule_evaluate([2], 0), [7])
+
+        # the Jacobian skips the folded and eliminated blocks
+        nt.assert_equal(bd.jacobian(0, [2]).toarray(), [[-1]])
+
+        # a watched block is evaluated
+        bd.watched = [unused[0]]
+        self.assertIsNone(bd._kernel)
+        bd.schedule_evaluate([2], 0)
+        self.assertEqual(bd._kernel.dead, set())
+        self.assertEqual(unused.output_values, [12])
+
+
 class ImportTest(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
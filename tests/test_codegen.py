@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+import math
+import os
+import tempfile
+
+import numpy as np
+from scipy.integrate import solve_ivp
+
+import bdsim
+from bdsim.codegen import constant, load
+import unittest
+import numpy.testing as nt
+
+
+class CodegenTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.sim = bdsim.BDSim(graphics=None, progress=False)
+
+    def test_constant(self):
+        constants = []
+        self.assertEqual(constant(2, constants), "2")
+        self.assertEqual(constant(2.5, constants), "2.5")
+        self.assertEqual(constant(True, constants), "True")
+        self.assertEqual(constant(-math.inf, constants), "(-np.inf)")
+        self.assertEqual(constants, [])
+
+        A = np.array([[1.0, 2], [3, 4]])
+        name = constant(A, constants)
+        self.assertEqual(name, "c0")
+        namespace = {"np": np}
+        exec(constants[0], namespace)
+        nt.assert_equal(namespace["c0"], A)
+
+        with self.assertRaises(ValueError):
+            constant("foo", constants)
+
+    def test_codegen(self):
+        bd = self.sim.blockdiagram()
+
+        A = np.array([[-1.0, 2], [0, -3]])
+        lti = bd.LTI_SS(A=A, B=np.r_[0, 1.0], C=np.r_[1.0, 1])
+        sum = bd.SUM("+-")
+        gain = bd.GAIN(4)
+        const = bd.CONSTANT(2)
+        integ = bd.INTEGRATOR(x0=[1, 2])
+        mux = bd.MUX(2)
+        demux = bd.DEMUX(3)
+        pow = bd.POW(2)
+        clip = bd.CLIP(-1, 1)
+        prod = bd.PROD("*/")
+        index = bd.INDEX([0, 2])
+        gain2 = bd.GAIN(np.array([[1, 2], [3, 4]]), premul=True)
+        func = bd.FUNCTION(lambda u: np.sin(u))  # no code template
+
+        bd.connect(const, sum[0])
+        bd.connect(lti, sum[1], mux[0])
+        bd.connect(sum, gain)
+        bd.connect(gain, lti)
+        bd.connect(integ, mux[1])
+        bd.connect(mux, demux, index)
+        bd.connect(demux[0], pow)
+        bd.connect(demux[1], clip)
+        bd.connect(pow, prod[0])
+        bd.connect(clip, prod[1])
+        bd.connect(index, gain2)
+        bd.connect(gain2, func)
+        bd.connect(func, integ)
+        bd.connect(prod, bd.NULL())
+        bd.connect(demux[2], bd.NULL())
+        bd.compile()
+
+        rhs = bd.codegen()
+        self.assertEqual(rhs.nstates, 4)
+        nt.assert_equal(rhs.x0, [0, 0, 1, 2])
+        self.assertEqual(list(rhs.blocks), [b.name for b in bd.blocklist])
+        self.assertIn("blocks['function.0']", rhs.source)
+        self.assertNotIn("blocks['gain.0']", rhs.source)
+
+        x = np.r_[0.5, 0.7, 0.2, 0.3]
+        nt.assert_almost_equal(rhs.f(1, x), bd.schedule_evaluate(x, 1, sinks=False))
+        y = rhs.outputs(1, x)
+        for b in (prod, demux, index, gain2):
+            nt.assert_almost_equal(y[b.name], b.output_values)
+
+        sol = solve_ivp(rhs.f, (0, 2), rhs.x0, rtol=1e-8, atol=1e-10)
+        out = self.sim.run(bd, 2, solver_args={"rtol": 1e-8, "atol": 1e-10})
+        nt.assert_almost_equal(sol.y[:, -1], out.x[-1], decimal=6)
+
+    def test_file(self):
+        bd = self.sim.blockdiagram()
+
+        integ = bd.INTEGRATOR(x0=1)
+        gain = bd.GAIN(-2)
+        bd.connect(integ, gain)
+        bd.connect(gain, integ)
+        bd.compile()
+
+        with tempfile.TemporaryDirectory() as dir:
+            filename = os.path.join(dir, "rhs.py")
+            bd.codegen(filename)
+            with open(filename) as f:
+                source = f.read()
+
+        # every block has a template, so the code is standalone
+        rhs = load(source)
+        nt.assert_equal(rhs.f(0, np.r_[3.0]), [-6])
+        self.assertEqual(rhs.outputs(0, np.r_[3.0])["gain.0"], [-6])
+
+    def test_ensemble(self):
+        bd = self.sim.blockdiagram()
+
+        integ = bd.INTEGRATOR(x0=1)
+        gain = bd.GAIN(-2)
+        bd.connect(integ, gain)
+        bd.connect(gain, integ)
+        bd.compile()
+        bd.ensemble = 3
+
+        with self.assertRaises(ValueError):
+            bd.codegen()
+
+
+# ---------------------------------------------------------------------------------------#
+if __name__ == "__main__":
+
+    unittest.main()
@@ -74,6 +74,28 @@ class FunctionBlockTest(unittest.TestCase):
         y = np.vstack((np.ones((4,))*2*math.pi, np.zeros((4,))))
         nt.assert_array_almost_equal(block.T_output(x, x)[0], y)
         
+    def test_jacobian(self):
+
+        block = Gain(2)
+        nt.assert_equal(block.jacobian(0, [np.r_[1, 2]], None)[0][0], 2 * np.eye(2))
+
+        block = Gain(np.r_[1, 2, 3])
+        nt.assert_equal(block.jacobian(0, [2], None)[0][0], [[1], [2], [3]])
+
+        K = np.array([[1, 2], [3, 4]])
+        block = Gain(K)
+        nt.assert_equal(block.jacobian(0, [np.r_[1, 2]], None)[0][0], K.T)
+        block = Gain(K, premul=True)
+        nt.assert_equal(block.jacobian(0, [np.r_[1, 2]], None)[0][0], K)
+
+        # matrix valued signal
+        self.assertIsNone(block.jacobian(0, [K], None))
+
+        block = Sum('+-')
+        D = block.jacobian(0, [np.r_[1, 2], 3], None)
+        nt.assert_equal(D[0][0], np.eye(2))
+        nt.assert_equal(D[0][1], [[-1], [-1]])
+
     def test_prod(self):
 
         block = Prod('**')
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+import bdsim
+from bdsim.fusion import LinearGroup
+import unittest
+import numpy.testing as nt
+
+
+def build(sim, fuse):
+    # PI control of a second order plant, with a nonlinear actuator
+    bd = sim.blockdiagram()
+
+    demand = bd.STEP(T=0.1, off=np.r_[0.0, 0.0], on=np.r_[1.0, 2.0])
+    plant = bd.LTI_SS(
+        A=np.array([[0.0, 1], [-2, -3]]), B=np.r_[0, 1.0], C=np.r_[1.0, 0]
+    )
+    integ = bd.INTEGRATOR(x0=[0.1, 0.2])
+    actuator = bd.FUNCTION(lambda u: np.tanh(u))
+    index = bd.INDEX([0])
+    scope = bd.NULL()
+
+    e = demand - bd.MUX(2, inputs=(plant, plant))
+    bd.connect(e, integ)
+    u = 2 * e + 0.5 * integ
+    bd.connect(u, index)
+    bd.connect(index, actuator)
+    bd.connect(actuator, plant)
+    bd.connect(u, scope)
+
+    bd.compile(verbose=False, fuse=fuse)
+    return bd, plant, integ, u
+
+
+class FusionTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.sim = bdsim.BDSim(graphics=None, progress=False)
+
+    def test_fuse(self):
+        bd0, *_ = build(self.sim, False)
+        bd, plant, integ, u = build(self.sim, True)
+        self.assertFalse(bd0.fuse)
+        self.assertTrue(bd.fuse)
+        self.assertEqual(bd0._kernel.fused, [])
+
+        # the gains, sums and the integrator are fused, the plant is separated
+        # from them by the nonlinear actuator
+        fused = bd._kernel.fused
+        self.assertEqual(len(fused), 1)
+        self.assertIsInstance(fused[0], LinearGroup)
+        self.assertIn(integ, fused[0].blocks)
+        self.assertIn(u, fused[0].blocks)
+        self.assertNotIn(plant, fused[0].blocks)
+        self.assertLess(len(bd._kernel.evallist), len(bd0._kernel.evallist))
+
+        for t, x in [(0, [0.1, 0.2, 0.3, 0.4]), (1, [-0.5, 1.0, 2.0, 0.7])]:
+            x = np.array(x)
+            nt.assert_almost_equal(
+                bd.schedule_evaluate(x, t), bd0.schedule_evaluate(x, t)
+            )
+
+            # outputs of the fused blocks are still set
+            for b, b0 in zip(bd.blocklist, bd0.blocklist):
+                if b.nout == 0:
+                    continue
+                for y, y0 in zip(b.output_values, b0.output_values):
+                    nt.assert_almost_equal(y, y0)
+            nt.assert_almost_equal(integ._x, x[integ._xslice])
+
+        # other uses of the diagram see the blocks
+        x = np.r_[0.1, 0.2, 0.3, 0.4]
+        nt.assert_almost_equal(bd.codegen().f(1, x), bd0.codegen().f(1, x))
+
+        # changing the option discards the kernel
+        bd.fuse = False
+        self.assertIsNone(bd._kernel)
+        bd.schedule_evaluate(x, 1)
+        self.assertEqual(bd._kernel.fused, [])
+
+    def test_nonlinear(self):
+        bd = self.sim.blockdiagram()
+
+        integ = bd.INTEGRATOR(x0=1, min=-1, max=1)
+        gain = bd.GAIN(-2)
+        sum = bd.SUM("++")
+        bd.connect(integ, gain)
+        bd.connect(gain, sum[0])
+        bd.connect(bd.CONSTANT(1), sum[1])
+        bd.connect(sum, integ)
+        bd.compile(verbose=False, fuse=True)
+
+        # the limited integrator is not linear
+        fused = bd._kernel.fused
+        self.assertEqual(len(fused), 1)
+        self.assertEqual(fused[0].blocks, [gain, sum])
+        nt.assert_almost_equal(bd.schedule_evaluate(np.r_[0.2], 0), [0.6])
+        nt.assert_almost_equal(bd.jacobian(0, np.r_[0.2]).toarray(), [[-2]])
+
+    def test_set_param(self):
+        bd = self.sim.blockdiagram()
+
+        integ = bd.INTEGRATOR(x0=1)
+        gain = bd.GAIN(-2)
+        bd.connect(integ, gain)
+        bd.connect(gain, integ)
+        bd.compile(verbose=False, fuse=True)
+        kernel = bd._kernel
+        nt.assert_almost_equal(bd.schedule_evaluate(np.r_[0.5], 0), [-1])
+
+        # the matrices of the group are recomputed, the kernel is kept
+        gain.set_param("K", -3)
+        self.assertIs(bd._kernel, kernel)
+        nt.assert_almost_equal(bd.schedule_evaluate(np.r_[0.5], 0), [-1.5])
+
+        # the signal shapes of the group have changed
+        gain.set_param("K", np.r_[-3.0, 1.0])
+        self.assertIsNone(bd._kernel)
+
+    def test_set_param_shape(self):
+        bd = self.sim.blockdiagram()
+
+        const = bd.CONSTANT(1.0)
+        gain = bd.GAIN(2.0)
+        sum = bd.SUM("+-")
+        integ = bd.INTEGRATOR(x0=[0, 0])
+        bd.connect(const, gain)
+        bd.connect(gain, sum[0])
+        bd.connect(integ, sum[1])
+        bd.connect(sum, integ)
+        bd.compile(verbose=False, fuse=True)
+        self.assertTrue(bd._kernel.fused)
+        nt.assert_almost_equal(bd.schedule_evaluate(np.r_[0.5, 0.5], 0), [1.5, 1.5])
+
+        # the signal shapes of the group have changed, the blocks are evaluated
+        # once without fusion and then fused again
+        gain.set_param("K", np.r_[2.0, 3.0])
+        nt.assert_almost_equal(bd.schedule_evaluate(np.r_[0.5, 0.5], 0), [1.5, 2.5])
+        self.assertIsNone(bd._kernel)
+        nt.assert_almost_equal(bd.schedule_evaluate(np.r_[0.5, 0.5], 0), [1.5, 2.5])
+        self.assertTrue(bd._kernel.fused)
+
+    def test_sim(self):
+        # watch the output of the sum, which is fused
+        bd0, *_, u0 = build(self.sim, False)
+        bd, *_, u = build(self.sim, True)
+        out0 = self.sim.run(bd0, 2, watch=[u0])
+        out = self.sim.run(bd, 2, watch=[u])
+        nt.assert_almost_equal(out.x, out0.x)
+        nt.assert_almost_equal(out.y0, out0.y0)
+
+
+# ---------------------------------------------------------------------------------------#
+if __name__ == "__main__":
+
+    unittest.main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+import time
+import numpy as np
+
+import bdsim
+from bdsim.parallel import ParallelGroup
+import unittest
+import numpy.testing as nt
+
+
+def slow(k):
+    # sleeping releases the global interpreter lock
+    def f(u):
+        time.sleep(0.002)
+        return k * u
+
+    return f
+
+
+def build(sim, workers):
+    # three independent slow functions of the integrator state, and a cheap one
+    bd = sim.blockdiagram()
+
+    integ = bd.INTEGRATOR(x0=1)
+    funcs = [bd.FUNCTION(slow(k)) for k in (1, 2, 3)]
+    cheap = bd.FUNCTION(lambda u: -u)
+    sum = bd.SUM("++++")
+    for i, f in enumerate(funcs + [cheap]):
+        f.expensive = True
+        bd.connect(integ, f)
+        bd.connect(f, sum[i])
+    bd.connect(sum, integ)
+
+    bd.workers = workers
+    bd.compile(verbose=False)
+    return bd, funcs, cheap
+
+
+class ParallelTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.sim = bdsim.BDSim(graphics=None, progress=False)
+
+    def test_parallel(self):
+        bd0, *_ = build(self.sim, None)
+        bd, funcs, cheap = build(self.sim, 2)
+        self.assertIsNone(bd0.workers)
+        self.assertEqual(bd0._kernel.parallel, [])
+        self.assertIsNone(bd0._kernel.pool)
+
+        parallel = bd._kernel.parallel
+        self.assertEqual(len(parallel), 1)
+        self.assertIsInstance(parallel[0], ParallelGroup)
+        self.assertEqual(parallel[0].blocks, funcs + [cheap])
+        self.assertEqual(len(bd._kernel.evallist), len(bd0._kernel.evallist) - 3)
+
+        for k in range(ParallelGroup.ncalibrate + 2):
+            x = np.r_[0.1 * k]
+            nt.assert_almost_equal(
+                bd.schedule_evaluate(x, 0), bd0.schedule_evaluate(x, 0)
+            )
+            for b, b0 in zip(bd.blocklist, bd0.blocklist):
+                if b.nout > 0:
+                    nt.assert_almost_equal(b.output_values, b0.output_values)
+
+        # the slow blocks are dispatched to the pool, the cheap one is inline
+        self.assertEqual([b for b, _ in parallel[0]._pooled], funcs)
+        self.assertEqual([b for b, _ in parallel[0]._inline], [cheap])
+
+        # rebuilding the kernel reuses the thread pool
+        pool = bd._kernel.pool
+        bd.fuse = not bd.fuse
+        bd.schedule_evaluate(np.r_[0.0], 0)
+        self.assertIs(bd._kernel.pool, pool)
+
+        # changing the option discards the kernel and shuts down the pool
+        bd.workers = None
+        self.assertIsNone(bd._kernel)
+        self.assertTrue(pool._shutdown)
+        bd.schedule_evaluate(np.r_[0.0], 0)
+        self.assertEqual(bd._kernel.parallel, [])
+
+    def test_sim(self):
+        bd0, *_ = build(self.sim, None)
+        bd, *_ = build(self.sim, 4)
+        out0 = self.sim.run(bd0, 0.5, dt=0.05)
+        out = self.sim.run(bd, 0.5, dt=0.05)
+        nt.assert_almost_equal(out.x, out0.x)
+
+
+# ---------------------------------------------------------------------------------------#
+if __name__ == "__main__":
+
+    unittest.main()
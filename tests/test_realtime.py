@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+
+import asyncio
+import time
+import numpy as np
+
+import bdsim
+from bdsim.components import SourceBlock, SinkBlock
+from bdsim.run_realtime import Ticker
+import unittest
+import numpy.testing as nt
+
+
+class TickerTest(unittest.TestCase):
+    def test_ontime(self):
+        ticker = Ticker(0.01, spin=0.001)
+        ticker.start()
+        for k in range(1, 6):
+            self.assertEqual(ticker.wait(), (k, False))
+            # the deadlines are absolute
+            self.assertGreaterEqual(time.perf_counter_ns(), ticker.t0 + k * 10_000_000)
+        self.assertEqual(ticker.noverrun, 0)
+
+    def test_catchup(self):
+        ticker = Ticker(0.01, overrun="catchup")
+        ticker.start()
+        time.sleep(0.022)
+        t0 = time.perf_counter()
+        self.assertEqual(ticker.wait(), (1, True))
+        self.assertEqual(ticker.wait(), (2, True))
+        self.assertLess(time.perf_counter() - t0, 0.005)
+        self.assertEqual(ticker.wait(), (3, False))
+        self.assertEqual(ticker.noverrun, 2)
+
+    def test_skip(self):
+        ticker = Ticker(0.01, overrun="skip")
+        ticker.start()
+        time.sleep(0.022)
+        self.assertEqual(ticker.wait(), (3, True))
+        self.assertEqual(ticker.nskipped, 2)
+        self.assertGreaterEqual(time.perf_counter_ns(), ticker.t0 + 30_000_000)
+
+    def test_abort(self):
+        ticker = Ticker(0.01, overrun="abort")
+        ticker.start()
+        time.sleep(0.015)
+        self.assertRaises(RuntimeError, ticker.wait)
+
+        self.assertRaises(ValueError, Ticker, 0.01, overrun="bad")
+
+
+def counter(calls):
+    # a function block that counts its evaluations
+    def f(u):
+        calls.append(u)
+        return u
+
+    return f
+
+
+class RunTest(unittest.TestCase):
+    def test_nsamples(self):
+        # 0.3 / 0.1 is slightly less than 3
+        sim = bdsim.BDRealTime(graphics=None, progress=False)
+        bd = sim.blockdiagram()
+        time = bd.TIME()
+        bd.connect(time, bd.NULL())
+        bd.compile(verbose=False)
+
+        out = sim.run(bd, T=0.3, dt=0.1, watch=[time], samples=False)
+        nt.assert_almost_equal(out.t, [0, 0.1, 0.2, 0.3])
+
+        out = asyncio.run(sim.arun(bd, T=0.3, dt=0.1, watch=[time], samples=False))
+        nt.assert_almost_equal(out.t, [0, 0.1, 0.2, 0.3])
+
+
+class MultiClockTest(unittest.TestCase):
+    def test_clocks(self):
+        sim = bdsim.BDRealTime(graphics=None, progress=False)
+        bd = sim.blockdiagram()
+
+        fast = bd.clock(0.01, name="fast")
+        slow = bd.clock(0.03, name="slow")
+
+        # a fast discrete integrator of a constant, sampled by a slow ZOH
+        integ = bd.DINTEGRATOR(fast, x0=0)
+        fastcalls, slowcalls, freecalls = [], [], []
+        f1 = bd.FUNCTION(counter(fastcalls))
+        zoh = bd.ZOH(slow)
+        f2 = bd.FUNCTION(counter(slowcalls))
+        bd.connect(bd.CONSTANT(1), integ)
+        bd.connect(integ, f1)
+        bd.connect(f1, zoh)
+        bd.connect(zoh, f2)
+        bd.connect(f2, bd.NULL())
+
+        # a block not connected to a clocked block
+        f3 = bd.FUNCTION(counter(freecalls))
+        bd.connect(bd.TIME(), f3)
+        bd.connect(f3, bd.NULL())
+        bd.compile(verbose=False)
+
+        fastcalls.clear()
+        slowcalls.clear()
+        freecalls.clear()
+        out = sim.run(bd, T=0.095, watch=[f2], samples=False)
+
+        # the ticks of each clock
+        nt.assert_almost_equal(out.fast.t, np.arange(1, 10) * 0.01)
+        nt.assert_almost_equal(out.slow.t, [0.03, 0.06, 0.09])
+        nt.assert_almost_equal(out.fast.x.ravel(), np.arange(1, 10) * 0.01)
+        nt.assert_almost_equal(out.t, [0] + list(np.arange(1, 10) * 0.01))
+
+        # the first evaluation is at time zero, then the blocks are evaluated
+        # only at the ticks of their clock.  The fast function is also
+        # evaluated before each slow tick since the ZOH samples it
+        self.assertEqual(len(fastcalls), 1 + 9 + 3)
+        self.assertEqual(len(slowcalls), 1 + 3)
+        self.assertEqual(len(freecalls), 1 + 9)
+
+        # the slow output is held between the slow ticks, it samples the fast
+        # integrator just before its tick at the same time
+        nt.assert_almost_equal(
+            np.ravel(out.y0), [0, 0, 0, 0.02, 0.02, 0.02, 0.05, 0.05, 0.05, 0.08]
+        )
+
+        # the clocks save their states
+        nt.assert_equal(fast.t, out.fast.t)
+        nt.assert_equal(np.array(fast.x), out.fast.x)
+
+        # the clocks start again from their initial state, and each plan group
+        # is timed once per evaluation
+        out = sim.run(bd, T=0.095, watch=[f2], samples=False, profile=True)
+        self.assertEqual(len(fast.t), 9)
+        self.assertEqual(out.profile.plan.n.max(), 1 + 9)
+
+
+class FakeDevice:
+    # a local socket server standing in for an I/O board, a read of a channel
+    # replies after a delay
+    def __init__(self, delay):
+        self.delay = delay
+        self.inflight = 0
+        self.maxinflight = 0
+        self.written = []
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def handle(self, reader, writer):
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            cmd, *args = line.decode().split()
+            if cmd == "read":
+                self.inflight += 1
+                self.maxinflight = max(self.maxinflight, self.inflight)
+                await asyncio.sleep(self.delay)
+                channel, t = int(args[0]), float(args[1])
+                writer.write(f"{10 * channel + t}\n".encode())
+                await writer.drain()
+                self.inflight -= 1
+            elif cmd == "write":
+                self.written.append(float(args[0]))
+        writer.close()
+
+    def stop(self):
+        self.server.close()
+
+
+class DeviceIn(SourceBlock):
+    nin = 0
+    nout = 1
+
+    def __init__(self, device, channel, **blockargs):
+        super().__init__(**blockargs)
+        self.device = device
+        self.channel = channel
+        self.stream = None
+
+    def output(self, t, inports, x):
+        return [0.0]
+
+    async def aoutput(self, t, inports, x):
+        if self.stream is None:
+            self.stream = await asyncio.open_connection("127.0.0.1", self.device.port)
+        reader, writer = self.stream
+        writer.write(f"read {self.channel} {t}\n".encode())
+        await writer.drain()
+        return [float(await reader.readline())]
+
+
+class DeviceOut(SinkBlock):
+    nin = 1
+    nout = 0
+
+    def __init__(self, device, **blockargs):
+        super().__init__(**blockargs)
+        self.device = device
+        self.stream = None
+
+    async def astep(self, t, inports):
+        if self.stream is None:
+            self.stream = await asyncio.open_connection("127.0.0.1", self.device.port)
+        _, writer = self.stream
+        writer.write(f"write {inports[0]}\n".encode())
+        await writer.drain()
+
+
+class SlowIn(SourceBlock):
+    # misses the deadline at every other sample
+    nin = 0
+    nout = 1
+
+    def output(self, t, inports, x):
+        return [0.0]
+
+    async def aoutput(self, t, inports, x):
+        if round(t / 0.02) % 2 == 1:
+            await asyncio.sleep(1)
+        return [t]
+
+
+class AsyncTest(unittest.TestCase):
+    def test_io(self):
+        sim = bdsim.BDRealTime(graphics=None, progress=False)
+        bd = sim.blockdiagram()
+        device = FakeDevice(delay=0.02)
+
+        in1 = DeviceIn(device, 1, bd=bd)
+        in2 = DeviceIn(device, 2, bd=bd)
+        sum = bd.SUM("++")
+        out = DeviceOut(device, bd=bd)
+        bd.connect(in1, sum[0])
+        bd.connect(in2, sum[1])
+        bd.connect(sum, out)
+        bd.compile(verbose=False)
+
+        async def main():
+            await device.start()
+            try:
+                return await sim.arun(
+                    bd, T=0.2, dt=0.05, watch=[sum], samples=False, timeout=0.04
+                )
+            finally:
+                device.stop()
+
+        results = asyncio.run(main())
+
+        t = np.arange(5) * 0.05
+        nt.assert_almost_equal(results.t, t)
+        nt.assert_almost_equal(np.ravel(results.y0), 30 + 2 * t)
+        self.assertEqual(len(device.written), 5)
+        nt.assert_almost_equal(device.written, 30 + 2 * t)
+
+        # the two reads of each sample are concurrent
+        self.assertEqual(device.maxinflight, 2)
+        self.assertEqual(sim.state.niotimeout, 0)
+
+    def test_timeout(self):
+        sim = bdsim.BDRealTime(graphics=None, progress=False)
+        bd = sim.blockdiagram()
+        slow = SlowIn(bd=bd)
+        gain = bd.GAIN(2)
+        bd.connect(slow, gain)
+        bd.connect(gain, bd.NULL())
+        bd.compile(verbose=False)
+
+        results = asyncio.run(
+            sim.arun(bd, T=0.1, dt=0.02, watch=[gain], samples=False, timeout=0.005)
+        )
+
+        # the output is held when the read misses its deadline
+        nt.assert_almost_equal(
+            np.ravel(results.y0), [0, 0, 0.08, 0.08, 0.16, 0.16]
+        )
+        self.assertEqual(sim.state.niotimeout, 3)
+
+        # the sample interval is required
+        self.assertRaises(ValueError, asyncio.run, sim.arun(bd, T=0.1))
+
+        # clocked diagrams are not supported
+        bd.clock(0.1)
+        self.assertRaises(ValueError, asyncio.run, sim.arun(bd, T=0.1, dt=0.02))
+
+
+# ---------------------------------------------------------------------------------------#
+if __name__ == "__main__":
+
+    unittest.main()
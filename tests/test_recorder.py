@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import os
+import tempfile
+
+import bdsim
+from bdsim.recorder import Channel, FileChannel, Recorder, StreamRecorder, load
+import unittest
+import numpy.testing as nt
+
+
+class ChannelTest(unittest.TestCase):
+    def test_scalar(self):
+        c = Channel(chunksize=4)
+        self.assertEqual(len(c), 0)
+        self.assertEqual(c.data.shape, (0,))
+
+        for i in range(10):
+            c.append(i)
+        self.assertEqual(len(c), 10)
+        self.assertEqual(c.data.dtype, np.float64)
+        nt.assert_equal(c.data, np.arange(10))
+
+        c.close()
+        nt.assert_equal(c.data, np.arange(10))
+
+    def test_vector(self):
+        c = Channel(dtype=np.float32, chunksize=3)
+        for i in range(7):
+            c.append([i, 2 * i])
+        self.assertEqual(c.data.shape, (7, 2))
+        self.assertEqual(c.data.dtype, np.float32)
+        nt.assert_equal(c.data[:, 1], 2 * np.arange(7))
+
+    def test_view(self):
+        c = Channel(chunksize=4)
+        for i in range(5):
+            c.append(i)
+        d = c.data
+        self.assertFalse(d.flags.owndata)
+
+        # a referenced buffer is not resized
+        c.close()
+        nt.assert_equal(d, np.arange(5))
+
+    def test_object(self):
+        c = Channel()
+        c.append("hello")
+        c.append(None)
+        self.assertEqual(c.data.dtype, object)
+        self.assertEqual(list(c.data), ["hello", None])
+
+
+class RecorderTest(unittest.TestCase):
+    def test_run(self):
+        sim = bdsim.BDSim(graphics=None, progress=False)
+        bd = sim.blockdiagram()
+
+        clock = bd.clock(0.5, "s")
+        integ = bd.INTEGRATOR(x0=[1, 2])
+        const = bd.CONSTANT([3, 4])
+        step = bd.STEP(T=1)
+        zoh = bd.ZOH(clock)
+        bd.connect(const, integ)
+        bd.connect(step, zoh)
+        bd.connect(zoh, bd.NULL())
+
+        bd.compile()
+        out = sim.run(bd, 2, watch=[zoh], recorder=Recorder(dtype=np.float32))
+
+        n = len(out.t)
+        self.assertEqual(out.t.dtype, np.float64)
+        self.assertEqual(out.x.shape, (n, 2))
+        self.assertEqual(out.x.dtype, np.float32)
+        nt.assert_almost_equal(out.x[-1], [1 + 3 * 2, 2 + 4 * 2], decimal=5)
+        self.assertEqual(out.y0.shape, (n, 1))
+        self.assertEqual(out.y0.dtype, np.float32)
+
+        name = clock.name.replace(".", "")
+        self.assertIsInstance(out[name], bdsim.BDStruct)
+        nt.assert_almost_equal(out[name].t, [0.5, 1.0, 1.5, 2.0])
+        nt.assert_equal(out[name].x[:, 0], [0, 1, 1, 1])
+
+
+class FileChannelTest(unittest.TestCase):
+    def test_stream(self):
+        with tempfile.TemporaryDirectory() as dir:
+            path = os.path.join(dir, "c.npy")
+            c = FileChannel(path, chunksize=4)
+            for i in range(10):
+                c.append([i, -i])
+            self.assertEqual(len(c), 10)
+
+            c.close()
+            self.assertEqual(os.path.getsize(path), 128 + 10 * 2 * 8)
+            d = np.load(path)
+            self.assertEqual(d.shape, (10, 2))
+            nt.assert_equal(d[:, 1], -np.arange(10))
+
+            self.assertIsInstance(c.data, np.memmap)
+            nt.assert_equal(c.data, d)
+
+    def test_empty(self):
+        with tempfile.TemporaryDirectory() as dir:
+            path = os.path.join(dir, "c.npy")
+            c = FileChannel(path)
+            c.close()
+            self.assertEqual(c.data.shape, (0,))
+            self.assertEqual(np.load(path).shape, (0,))
+
+    def test_object(self):
+        with tempfile.TemporaryDirectory() as dir:
+            path = os.path.join(dir, "c.npy")
+            c = FileChannel(path, chunksize=2)
+            for s in "hello":
+                c.append(s)
+            c.close()
+            self.assertEqual(list(np.load(path, allow_pickle=True)), list("hello"))
+
+
+class StreamRecorderTest(unittest.TestCase):
+    def test_run(self):
+        def run(recorder):
+            sim = bdsim.BDSim(graphics=None, progress=False)
+            bd = sim.blockdiagram()
+
+            clock = bd.clock(0.5, "s")
+            integ = bd.INTEGRATOR(x0=[1, 2])
+            const = bd.CONSTANT([3, 4])
+            step = bd.STEP(T=1)
+            zoh = bd.ZOH(clock)
+            bd.connect(const, integ)
+            bd.connect(step, zoh)
+            bd.connect(zoh, bd.NULL())
+
+            bd.compile()
+            out = sim.run(bd, 2, watch=[zoh], recorder=recorder)
+            out.clock = out[clock.name.replace(".", "")]
+            return out
+
+        out1 = run(Recorder())
+
+        with tempfile.TemporaryDirectory() as dir:
+            out2 = run(StreamRecorder(dir, chunksize=8))
+            out3 = load(dir)
+            out3.clock = out3[[k for k in vars(out3) if k.startswith("clock")][0]]
+
+            for out in (out2, out3):
+                self.assertIsInstance(out.t, np.memmap)
+                nt.assert_equal(out.t, out1.t)
+                nt.assert_equal(out.x, out1.x)
+                nt.assert_equal(out.y0, out1.y0)
+
+                nt.assert_equal(out.clock.t, out1.clock.t)
+                nt.assert_equal(out.clock.x, out1.clock.x)
+
+                self.assertEqual(out.xnames, out1.xnames)
+                self.assertEqual(out.ynames, out1.ynames)
+            del out, out2, out3  # release the memory maps
+
+
+# ---------------------------------------------------------------------------------------#
+if __name__ == "__main__":
+
+    unittest.main()
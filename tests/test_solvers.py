@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+import bdsim
+from bdsim.solvers import Euler, Heun, RK4, fixedstep_solvers, extend
+import unittest
+import numpy.testing as nt
+
+
+def decay(t, y):
+    return -y
+
+
+def solve(solver, h, T=1.0):
+    integrator = solver(decay, 0.0, np.r_[1.0, 2.0], T, max_step=h)
+    tlist = []
+    while integrator.status == "running":
+        integrator.step()
+        tlist.append(integrator.t)
+    return integrator, np.array(tlist)
+
+
+class SolverTest(unittest.TestCase):
+    def test_steps(self):
+        integrator, t = solve(RK4, 0.1)
+        self.assertEqual(len(t), 10)
+        nt.assert_almost_equal(t, np.arange(1, 11) * 0.1, decimal=14)
+        self.assertEqual(t[-1], 1.0)
+        self.assertEqual(integrator.status, "finished")
+
+        # last step is shortened to end at t_bound
+        integrator, t = solve(Euler, 0.3)
+        nt.assert_almost_equal(t, [0.3, 0.6, 0.9, 1.0])
+        self.assertAlmostEqual(integrator.step_size, 0.1)
+
+    def test_order(self):
+        for solver in (Euler, Heun, RK4):
+            e1 = np.abs(solve(solver, 0.1)[0].y - np.r_[1, 2] * np.exp(-1)).max()
+            e2 = np.abs(solve(solver, 0.05)[0].y - np.r_[1, 2] * np.exp(-1)).max()
+            # halving the step reduces the error by 2^order
+            self.assertAlmostEqual(np.log2(e1 / e2), solver.order, delta=0.2)
+
+    def test_dense(self):
+        integrator = RK4(decay, 0.0, np.r_[1.0], 1.0, max_step=0.1)
+        integrator.step()
+        f = integrator.dense_output()
+        nt.assert_almost_equal(f(0.0), [1.0])
+        nt.assert_almost_equal(f(0.1), integrator.y)
+        nt.assert_almost_equal(f(0.05), [np.exp(-0.05)], decimal=6)
+
+    def test_extend(self):
+        integrator, t = solve(Euler, 0.1, T=0.25)
+        nt.assert_almost_equal(t, [0.1, 0.2, 0.25])
+
+        # steps remain on the original grid
+        self.assertTrue(extend(integrator, 0.5))
+        self.assertEqual(integrator.status, "running")
+        tlist = []
+        while integrator.status == "running":
+            integrator.step()
+            tlist.append(integrator.t)
+        nt.assert_almost_equal(tlist, [0.3, 0.4, 0.5])
+
+    def test_nostep(self):
+        with self.assertRaises(ValueError):
+            RK4(decay, 0.0, np.r_[1.0], 1.0)
+
+    def test_sim(self):
+        sim = bdsim.BDSim(graphics=None, progress=False)
+        bd = sim.blockdiagram()
+
+        integ = bd.INTEGRATOR(x0=1)
+        gain = bd.GAIN(-1)
+        clock = bd.clock(0.1, "s")
+        zoh = bd.ZOH(clock)
+        bd.connect(integ, gain)
+        bd.connect(gain, integ)
+        bd.connect(integ, zoh)
+        bd.connect(zoh, bd.NULL())
+
+        bd.compile()
+        for name in fixedstep_solvers:
+            out = sim.run(bd, 2, dt=0.01, solver=name.upper())
+
+            # steps are aligned with the clock ticks
+            self.assertEqual(len(out.t), 200)
+            nt.assert_almost_equal(out.t, np.arange(1, 201) * 0.01, decimal=12)
+            self.assertAlmostEqual(out.x[-1, 0], np.exp(-2), delta=0.01)
+
+
+# ---------------------------------------------------------------------------------------#
+if __name__ == "__main__":
+
+    unittest.main()
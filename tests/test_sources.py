@@ -169,6 +169,33 @@ class SourceBlockTest(unittest.TestCase):
         self.assertAlmostEqual(block.T_output(t=math.pi / 2)[0], 1)
         self.assertAlmostEqual(block.T_output(t=3 / 2 * math.pi)[0], -1)
 
+    def test_waveform_events(self):
+        from bdsim.run_sim import BDSimState
+
+        block = WaveForm(wave="square", freq=2, duty=0.25)
+        simstate = BDSimState()
+        simstate.T = 1.2
+        block.start(simstate)
+
+        # only the first edge is declared
+        self.assertEqual(len(simstate.eventq), 1)
+
+        times = []
+        while len(simstate.eventq) > 0:
+            t, blocks = simstate.eventq.pop()
+            self.assertEqual(blocks, [block])
+            times.append(t)
+            block.next_event(simstate)
+            self.assertLessEqual(len(simstate.eventq), 1)
+        nt.assert_almost_equal(times, [0, 0.125, 0.5, 0.625, 1.0, 1.125])
+
+        block = WaveForm(wave="sine")
+        simstate = BDSimState()
+        simstate.T = 1.2
+        block.start(simstate)
+        block.next_event(simstate)
+        self.assertEqual(len(simstate.eventq), 0)
+
     def test_step(self):
 
         block = Step()
@@ -201,6 +228,22 @@ class SourceBlockTest(unittest.TestCase):
         self.assertEqual(block.T_output(t=2.1)[0], 0)
         self.assertEqual(block.T_output(t=9)[0], 0)
 
+    def test_piecewise_events(self):
+        from bdsim.run_sim import BDSimState
+
+        block = Piecewise((0, 0), (1, 1), (2, 1), (2, 0), (10, 0))
+        simstate = BDSimState()
+        simstate.T = 5
+        block.start(simstate)
+        self.assertEqual(len(simstate.eventq), 1)
+
+        times = []
+        while len(simstate.eventq) > 0:
+            t, blocks = simstate.eventq.pop()
+            times.append(t)
+            block.next_event(simstate)
+        self.assertEqual(times, [0, 1, 2, 2, 10])
+
     def test_ramp(self):
         block = Ramp()
         self.assertAlmostEqual(block.T_output(t=0)[0], 0)
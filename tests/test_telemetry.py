@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import numpy as np
+
+import bdsim
+from bdsim.telemetry import RingBuffer, RingReader, TelemetryWriter
+import unittest
+import numpy.testing as nt
+
+
+class RingBufferTest(unittest.TestCase):
+    def test_write(self):
+        ring = RingBuffer(capacity=4, sizes=[1, 2])
+        self.assertEqual(ring.width, 4)
+        self.assertEqual(len(ring), 0)
+
+        reader = RingReader(ring)
+        self.assertEqual(reader.read().shape, (0, 4))
+
+        ring.write(0.0, [1, np.r_[2, 3]])
+        ring.write(0.1, [4, np.array([[5], [6]])])
+        self.assertEqual(len(ring), 2)
+        nt.assert_equal(reader.read(), [[0.0, 1, 2, 3], [0.1, 4, 5, 6]])
+        self.assertEqual(reader.read().shape, (0, 4))
+        self.assertEqual(reader.lost, 0)
+
+    def test_overwrite(self):
+        ring = RingBuffer(capacity=4, sizes=[1])
+        reader = RingReader(ring)
+        for i in range(10):
+            ring.write(i, [10 * i])
+
+        # only the last samples are held, the oldest may be overwritten next
+        rows = reader.read()
+        nt.assert_equal(rows[:, 0], [7, 8, 9])
+        nt.assert_equal(rows[:, 1], [70, 80, 90])
+        self.assertEqual(reader.lost, 7)
+        self.assertEqual(reader.cursor, 10)
+
+        ring.write(10, [100])
+        nt.assert_equal(reader.read()[:, 0], [10])
+        self.assertEqual(reader.lost, 7)
+
+    def test_unallocated(self):
+        ring = RingBuffer()
+        self.assertEqual(len(ring), 0)
+        self.assertEqual(RingReader(ring).read().size, 0)
+        ring.allocate([3])
+        self.assertEqual(ring.data.shape, (4096, 4))
+
+    def test_shared(self):
+        ring = RingBuffer(capacity=8, sizes=[2], shared=True)
+        try:
+            other = RingBuffer.attach(ring.name, 8, [2])
+            ring.write(1.0, [np.r_[2, 3]])
+            nt.assert_equal(RingReader(other).read(), [[1, 2, 3]])
+            other.close()
+        finally:
+            ring.close()
+
+    def test_writer(self):
+        ring = RingBuffer(capacity=16, sizes=[1])
+        with tempfile.TemporaryDirectory() as dir:
+            path = os.path.join(dir, "telemetry.bin")
+            writer = TelemetryWriter(ring, path, interval=0.001)
+            writer.start()
+            for i in range(40):
+                ring.write(i, [-i])
+                if i % 8 == 0:
+                    writer._done.wait(0.005)
+            writer.stop()
+
+            data = np.fromfile(path).reshape((-1, 2))
+            self.assertEqual(len(data) + writer.reader.lost, 40)
+            nt.assert_equal(data[:, 1], -data[:, 0])
+            nt.assert_equal(data[-1], [39, -39])
+
+
+class RealTimeTelemetryTest(unittest.TestCase):
+    def test_run(self):
+        sim = bdsim.BDRealTime(graphics=None, progress=False)
+        bd = sim.blockdiagram()
+        time = bd.TIME()
+        gain = bd.GAIN(np.r_[1, 2])
+        bd.connect(time, gain)
+        bd.connect(gain, bd.NULL())
+        bd.compile(verbose=False)
+
+        ring = RingBuffer(capacity=8)
+        reader = RingReader(ring)
+        out = sim.run(bd, T=0.1, dt=0.01, watch=[time, gain], telemetry=ring)
+        self.assertIs(out.telemetry, ring)
+
+        # the overrun flags of the samples are not kept by default
+        self.assertFalse(sim.state.samples)
+        self.assertEqual(len(sim.state.sampled), 0)
+        self.assertFalse(hasattr(out, "t"))
+        self.assertFalse(hasattr(out, "y0"))
+
+        self.assertEqual(ring.width, 4)
+        self.assertEqual(len(ring), 11)
+        rows = reader.read()
+        self.assertEqual(reader.lost, 4)
+        nt.assert_almost_equal(rows[:, 0], np.arange(4, 11) * 0.01)
+        nt.assert_almost_equal(rows[:, 1], rows[:, 0])
+        nt.assert_almost_equal(rows[:, 2:], rows[:, :1] * [1, 2])
+
+
+# ---------------------------------------------------------------------------------------#
+if __name__ == "__main__":
+
+    unittest.main()
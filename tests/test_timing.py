@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+import bdsim
+from bdsim.timing import Histogram, Profiler
+import unittest
+import numpy.testing as nt
+
+
+class HistogramTest(unittest.TestCase):
+    def test_buckets(self):
+        h = Histogram(1)
+
+        # small values have a bucket each
+        for v in range(32):
+            self.assertEqual(h._upper(h._index(v)), v)
+
+        # the relative error of larger values is bounded
+        for v in [32, 33, 100, 12_345, 1_000_000, 987_654_321]:
+            upper = h._upper(h._index(v))
+            self.assertGreaterEqual(upper, v)
+            self.assertLess(upper - v, v / 16)
+
+    def test_percentile(self):
+        h = Histogram(2)
+        for v in range(1, 1001):
+            h.record(0, v * 1000)  # 1 to 1000 us
+        nt.assert_equal(h.n, [1000, 0])
+        self.assertEqual(h.max[0], 1_000_000)
+
+        p50, p99 = h.percentile(50), h.percentile(99)
+        self.assertTrue(500e-6 <= p50[0] < 500e-6 * 1.07)
+        self.assertTrue(990e-6 <= p99[0] < 990e-6 * 1.07)
+        self.assertAlmostEqual(h.percentile(100)[0], 1e-3)
+        self.assertTrue(np.isnan(p50[1]))
+
+        # values out of range are counted in the last bucket
+        h.record(1, 2**50)
+        self.assertEqual(h.counts[1, -1], 1)
+
+
+class ProfilerTest(unittest.TestCase):
+    def test_profiler(self):
+        sim = bdsim.BDSim(graphics=None, progress=False)
+        bd = sim.blockdiagram()
+        const = bd.CONSTANT(2)
+        gain = bd.GAIN(3)
+        null = bd.NULL()
+        bd.connect(const, gain)
+        bd.connect(gain, null)
+        bd.compile(verbose=False)
+
+        kernel = bd._kernel
+        kernel.profile = Profiler(kernel)
+        for i in range(10):
+            bd.schedule_evaluate([], 0)
+
+        profile = kernel.profile
+        self.assertEqual(profile.names, ["constant.0", "gain.0", "null.0"])
+        self.assertEqual(profile.groups, [0, 1, 2])
+        nt.assert_equal(profile.blocks.n, [10, 10, 10])
+        nt.assert_equal(profile.plan.n, [10, 10, 10])
+        self.assertTrue((profile.blocks.percentile(50) > 0).all())
+        profile.report()
+
+
+# ---------------------------------------------------------------------------------------#
+if __name__ == "__main__":
+
+    unittest.main()
@@ -66,6 +66,54 @@ class TransferTest(unittest.TestCase):
         nt.assert_equal(block.T_output(u, x=x)[0], C@x)
         nt.assert_equal(block.getstate0(), np.r_[30, 40])
         
+    def test_LTI_SS_ensemble(self):
+        # states and inputs have a leading ensemble dimension
+        A = np.array([[1, 2], [3, 4]])
+        B = np.array([[5], [6]])
+        C = np.array([[7, 8]])
+        block = LTI_SS(A=A, B=B, C=C)
+        x = np.array([[10, 11], [12, 13], [14, 15]])
+        u = np.r_[-2, 0, 2]
+
+        xd = block.deriv(0, [u], x)
+        self.assertEqual(xd.shape, (3, 2))
+        y = block.output(0, [u], x)
+        for i in range(3):
+            nt.assert_equal(xd[i], A @ x[i] + B @ np.r_[u[i]])
+            nt.assert_equal(y[0][i], C @ x[i])
+
+    def test_integrator_ensemble(self):
+        block = Integrator(x0=[5, 6], min=[-10, -10], max=[10, 10])
+        x = np.array([[0, 0], [11, 0]])
+
+        u = np.array([[1, 2], [3, 4]])
+        nt.assert_equal(block.deriv(0, [u], x), np.array([[1, 2], [0, 4]]))
+
+        # input broadcast to all members
+        nt.assert_equal(block.deriv(0, [np.r_[1, 2]], x), np.array([[1, 2], [0, 2]]))
+
+    def test_jacobian(self):
+        A = np.array([[1, 2], [3, 4]])
+        B = np.array([[5], [6]])
+        C = np.array([[7, 8]])
+        block = LTI_SS(A=A, B=B, C=C)
+        JA, JB, JC = block.jacobian(0, [1], np.r_[10, 11])
+        nt.assert_equal(JA, A)
+        nt.assert_equal(JB[0], B)
+        self.assertEqual(len(JC), 1)
+        nt.assert_equal(JC[0], C)
+
+        block = Integrator(x0=[5, 6], gain=2, min=[-10, -10], max=[10, 10])
+        JA, JB, JC = block.jacobian(0, [np.r_[1, 2]], np.r_[0, 11])
+        nt.assert_equal(JA, np.zeros((2, 2)))
+        # no change in the second state, it is at its maximum
+        nt.assert_equal(JB[0], np.array([[2, 0], [0, 0]]))
+        nt.assert_equal(JC[0], 2 * np.eye(2))
+
+        # input broadcast to the state
+        JA, JB, JC = block.jacobian(0, [3], np.r_[0, 0])
+        nt.assert_equal(JB[0], np.array([[2], [2]]))
+
     def test_LTI_SISO(self):
         
         block = LTI_SISO( [2, 1], [2, 4, 6])